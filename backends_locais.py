@@ -0,0 +1,274 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Substitutos locais da busca na web, dos embeddings e do LLM.
+
+Respondem sem acessar a rede, com respostas determinísticas (a mesma
+entrada gera sempre a mesma saída) e com latência, taxa de erros (inclusive
+429) e vazão máxima configuráveis. Servem para medir o desempenho do
+pipeline e testar a concorrência, as retentativas e o uso de memória em
+execuções grandes (ver benchmark.py e BACKEND_BUSCA/BACKEND_IA no main.py)
+sem gastar cota das APIs do Google nem depender de conexão.
+"""
+
+import time
+import random
+import hashlib
+import threading
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+from pydantic import PrivateAttr
+from langchain_core.embeddings import Embeddings  # Interface de embeddings do LangChain
+from langchain_core.language_models.chat_models import BaseChatModel  # Interface de chat do LangChain
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Vocabulário dos textos gerados. Inclui palavras-chave de relevância e de
+# impacto, para que a pontuação dos resultados e a marcação de impactos
+# tenham trabalho parecido com o de uma execução real
+VOCABULARIO = (
+    "mineração processo lavra pesquisa empresa titular área hectares município "
+    "substância ouro ferro cobre manganês bauxita relatório licença ibama funai "
+    "terra indígena conflito ameaça impacto ambiental comunidade protesto multa "
+    "ação civil ministério público sobreposição desmatamento poluição contaminação"
+).split()
+
+# Domínios dos links gerados: metade de sites relevantes, metade genéricos
+SITES_LOCAIS = (
+    "mpf.mp.br", "ibama.gov.br", "socioambiental.org", "reporterbrasil.org.br",
+    "noticias.exemplo.com.br", "portal.exemplo.org", "blog.exemplo.net", "jornal.exemplo.com",
+)
+
+
+def _semente(*partes: str) -> int:
+    """Semente determinística derivada do texto (o hash() do Python muda a cada execução)."""
+    return int.from_bytes(hashlib.sha256("\0".join(partes).encode("utf-8")).digest()[:8], "little")
+
+
+def _texto(rng: random.Random, palavras: int) -> str:
+    """Texto com `palavras` palavras sorteadas do vocabulário."""
+    return " ".join(rng.choice(VOCABULARIO) for _ in range(palavras))
+
+
+class ErroLocal(Exception):
+    """
+    Erro simulado de um backend local.
+
+    O status HTTP fica em resp.status e na mensagem, como nos erros do
+    googleapiclient, para ser reconhecido por eh_rate_limit (concorrencia.py).
+    """
+
+    def __init__(self, status: int, mensagem: str):
+        super().__init__(f"{status} {mensagem}")
+        self.resp = SimpleNamespace(status=status)
+
+
+class _Servico:
+    """
+    Comportamento simulado de uma API: latência, erros e vazão máxima.
+
+    Seguro entre threads. Os erros são sorteados a partir da entrada e do
+    número da tentativa com essa entrada: a mesma sequência de chamadas
+    falha sempre nos mesmos pontos, em qualquer ordem entre as threads, e
+    uma nova tentativa pode dar certo (como numa API real). Quando uma
+    chamada dá certo, a contagem da entrada é descartada (a memória não
+    cresce com o número de entradas): uma nova chamada com ela recomeça a
+    mesma sequência.
+
+    Args:
+        nome (str): Nome do serviço (entra no sorteio dos erros)
+        latencia (float): Segundos de espera por chamada
+        variacao (float): Variação relativa da espera (0.2 = ±20%), sorteada
+        taxa_erros (float): Fração das chamadas que falham com erro 500
+        taxa_429 (float): Fração das chamadas que falham com 429
+        vazao_max (float): Chamadas por segundo aceitas (rajada de até um
+            segundo); acima disso, responde 429 na hora (None = sem limite)
+    """
+
+    def __init__(self, nome: str, latencia: float = 0.0, variacao: float = 0.0,
+                 taxa_erros: float = 0.0, taxa_429: float = 0.0, vazao_max: float = None):
+        self.nome = nome
+        self.latencia = latencia
+        self.variacao = variacao
+        self.taxa_erros = taxa_erros
+        self.taxa_429 = taxa_429
+        self.vazao_max = vazao_max
+        self.chamadas = 0
+        self.erros = 0
+        self.erros_429 = 0
+        self._tentativas = Counter()  # Semente da entrada -> chamadas já feitas com ela, até dar certo
+        self._fichas = max(1.0, vazao_max or 0)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _dentro_da_vazao(self) -> bool:
+        """Consome uma ficha do limite de vazão (chamar com o lock)."""
+        if self.vazao_max is None:
+            return True
+        agora = time.monotonic()
+        capacidade = max(1.0, self.vazao_max)
+        self._fichas = min(capacidade, self._fichas + (agora - self._ultimo) * self.vazao_max)
+        self._ultimo = agora
+        if self._fichas < 1:
+            return False
+        self._fichas -= 1
+        return True
+
+    def atender(self, entrada: str):
+        """
+        Simula uma chamada: espera a latência ou levanta o erro sorteado.
+
+        Raises:
+            ErroLocal: 429 (vazão excedida ou sorteado) ou 500 (sorteado)
+        """
+        semente = _semente(self.nome, entrada)
+        with self._lock:
+            self.chamadas += 1
+            tentativa = self._tentativas[semente]
+            self._tentativas[semente] += 1
+            if not self._dentro_da_vazao():
+                self.erros_429 += 1
+                raise ErroLocal(429, f"{self.nome}: vazão máxima de {self.vazao_max}/s excedida")
+        if self.latencia > 0:
+            time.sleep(self.latencia * (1 + random.uniform(-self.variacao, self.variacao)))
+        sorteio = random.Random(semente + tentativa).random()
+        if sorteio < self.taxa_429:
+            with self._lock:
+                self.erros_429 += 1
+            raise ErroLocal(429, f"{self.nome}: limite de requisições (simulado)")
+        if sorteio < self.taxa_429 + self.taxa_erros:
+            with self._lock:
+                self.erros += 1
+            raise ErroLocal(500, f"{self.nome}: erro interno (simulado)")
+        with self._lock:
+            self._tentativas.pop(semente, None)
+
+
+class BuscaLocal:
+    """
+    Substituto da ferramenta de busca, no formato do GoogleSearchAPIWrapper.
+
+    run(query) devolve uma lista de dicionários com 'title', 'link' e
+    'snippet', como a busca do Google, sorteados a partir da query.
+
+    Args:
+        latencia (float): Segundos de espera por busca
+        resultados (int): Resultados por busca
+        palavras_trecho (int): Tamanho de cada 'snippet', em palavras
+        variacao (float): Variação relativa da latência
+        taxa_erros, taxa_429, vazao_max: Falhas simuladas (ver _Servico)
+    """
+
+    def __init__(self, latencia: float = 0.0, resultados: int = 5,
+                 palavras_trecho: int = 60, variacao: float = 0.0,
+                 taxa_erros: float = 0.0, taxa_429: float = 0.0, vazao_max: float = None):
+        self.servico = _Servico("busca", latencia, variacao, taxa_erros, taxa_429, vazao_max)
+        self.resultados = resultados
+        self.palavras_trecho = palavras_trecho
+
+    @property
+    def chamadas(self) -> int:
+        return self.servico.chamadas
+
+    def run(self, query: str) -> list:
+        self.servico.atender(query)
+        rng = random.Random(_semente("busca", query))
+        return [
+            {
+                "title": f"{query} ({i + 1})",
+                "link": f"https://{rng.choice(SITES_LOCAIS)}/{_semente(query, str(i)) % 10**8:08d}",
+                "snippet": f"{query} {_texto(rng, self.palavras_trecho)}",
+            }
+            for i in range(self.resultados)
+        ]
+
+
+class EmbeddingsLocais(Embeddings):
+    """
+    Substituto do modelo de embeddings: vetores sorteados a partir do texto.
+
+    Cada chamada a embed_documents conta como uma requisição (um lote),
+    como na API do Gemini.
+
+    Args:
+        dimensao (int): Tamanho dos vetores
+        latencia (float): Segundos de espera por requisição
+        variacao (float): Variação relativa da latência
+        taxa_erros, taxa_429, vazao_max: Falhas simuladas (ver _Servico)
+    """
+
+    def __init__(self, dimensao: int = 64, latencia: float = 0.0, variacao: float = 0.0,
+                 taxa_erros: float = 0.0, taxa_429: float = 0.0, vazao_max: float = None):
+        self.model = f"local-{dimensao}"  # Nome usado nas chaves do cache de embeddings
+        self.dimensao = dimensao
+        self.servico = _Servico("embeddings", latencia, variacao, taxa_erros, taxa_429, vazao_max)
+
+    @property
+    def chamadas(self) -> int:
+        return self.servico.chamadas
+
+    def _vetor(self, texto: str) -> list:
+        vetor = np.random.default_rng(_semente("embedding", texto)).standard_normal(self.dimensao)
+        return (vetor / np.linalg.norm(vetor)).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        self.servico.atender("\0".join(texts))
+        return [self._vetor(t) for t in texts]
+
+    def embed_query(self, text: str) -> list:
+        self.servico.atender(text)
+        return self._vetor(text)
+
+
+class LLMLocal(BaseChatModel):
+    """
+    Substituto do modelo de chat: resposta sorteada a partir do prompt.
+
+    Usável em qualquer cadeia do LangChain (ex: RetrievalQA), no lugar de
+    ChatGoogleGenerativeAI. Informa o uso de tokens (usage_metadata) como
+    o Gemini, estimado em ~4 caracteres por token.
+
+    Args:
+        latencia (float): Segundos de espera por chamada
+        variacao (float): Variação relativa da latência
+        palavras_resposta (int): Tamanho da resposta, em palavras
+        taxa_erros, taxa_429, vazao_max: Falhas simuladas (ver _Servico)
+    """
+
+    model: str = "local"
+    temperature: float = 0.0
+    latencia: float = 0.0
+    variacao: float = 0.0
+    palavras_resposta: int = 200
+    taxa_erros: float = 0.0
+    taxa_429: float = 0.0
+    vazao_max: float | None = None
+    _servico: _Servico = PrivateAttr(default=None)
+
+    def model_post_init(self, contexto):
+        self._servico = _Servico("llm", self.latencia, self.variacao,
+                                 self.taxa_erros, self.taxa_429, self.vazao_max)
+
+    @property
+    def servico(self) -> _Servico:
+        return self._servico
+
+    @property
+    def chamadas(self) -> int:
+        return self._servico.chamadas
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = "\n".join(str(m.content) for m in messages)
+        self._servico.atender(prompt)
+        texto = _texto(random.Random(_semente("llm", prompt)), self.palavras_resposta)
+        uso = {"input_tokens": len(prompt) // 4, "output_tokens": len(texto) // 4}
+        uso["total_tokens"] = uso["input_tokens"] + uso["output_tokens"]
+        mensagem = AIMessage(content=texto, usage_metadata=uso)
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
@@ -0,0 +1,571 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Benchmarks das etapas do pipeline, sem acesso à rede.
+
+Gera shapefiles sintéticos no formato do SIGMINE (de mil a 500 mil
+polígonos, com quantidade de vértices variada como nos dados reais) e mede
+leitura, cache, reprojeção e área, seleção do top-N, enhanced_search,
+rag_summary_enhanced, pontuação por palavras-chave e gravação do relatório.
+Busca, embeddings e LLM são os substitutos locais de backends_locais.py,
+com latência configurável.
+
+Os tempos são gravados em JSON, para comparar execuções (ex: antes e
+depois de uma mudança):
+
+    python benchmark.py
+    python benchmark.py --tamanhos 1000 100000 500000 --dados-dir data/benchmark
+    python benchmark.py --saida output/depois.json --comparar output/antes.json
+
+--carga N roda o main.py inteiro com N processos sintéticos e os backends
+locais, com erros 429 e vazão máxima simulados, e grava o tempo total, o
+pico de memória e as chamadas, retentativas e tokens medidos (teste de
+carga da concorrência e das retentativas):
+
+    python benchmark.py --sem-geo --sem-ia --carga 10000 --taxa-429 0.05
+"""
+
+import os
+# O Chroma tenta enviar telemetria anônima; desligada para rodar sem rede
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import io
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+from importlib.metadata import version, PackageNotFoundError
+
+import numpy as np
+import shapely
+import geopandas as gpd
+
+from geo_sigmine import (ler_shapefile, construir_cache, carregar_sigmine,
+                         calcular_area_ha, selecionar_top_n)
+from backends_locais import BuscaLocal, EmbeddingsLocais, LLMLocal, VOCABULARIO
+from palavras_chave import remover_acentos
+
+# === CONFIGURAÇÕES PADRÃO ===
+# Quantidades de polígonos dos shapefiles sintéticos
+TAMANHOS_PADRAO = [1_000, 10_000]
+
+# Repetições de cada medição (vale o menor tempo; a mediana também é gravada)
+REPETICOES_PADRAO = 3
+
+# Processos analisados nos benchmarks de busca e RAG
+PROCESSOS_PADRAO = 20
+
+# Latência simulada (segundos) de cada chamada aos substitutos locais
+LATENCIA_BUSCA_PADRAO = 0.05
+LATENCIA_EMBEDDINGS_PADRAO = 0.02
+LATENCIA_LLM_PADRAO = 0.2
+
+# Textos pontuados no benchmark de palavras-chave
+TEXTOS_PALAVRAS_PADRAO = 20_000
+
+# Processos gravados no benchmark do relatório
+LINHAS_RELATORIO_PADRAO = 2_000
+
+# Simulação de falhas dos backends locais no teste de carga (--carga)
+TAXA_429_PADRAO = 0.02
+TAXA_ERROS_PADRAO = 0.0
+
+# Campos medidos dos resultados (os demais identificam a medição em --comparar)
+CAMPOS_MEDIDOS = ("segundos", "mediana", "tempos", "pico_memoria_mb", "etapas", "contadores", "erro")
+
+# Polígonos gerados e gravados por vez no shapefile sintético
+LOTE_GERACAO = 50_000
+
+# Quantidade de vértices por polígono: distribuição log-normal, como nos
+# processos do SIGMINE (a maioria com poucas dezenas, alguns com milhares)
+MEDIANA_VERTICES = 30
+DISPERSAO_VERTICES = 1.0
+LIMITES_VERTICES = (4, 5_000)
+
+# Retângulo aproximado do território brasileiro (SIRGAS 2000)
+BBOX_BRASIL = (-73.9, -33.7, -34.8, 5.3)
+
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA",
+       "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO"]
+FASES = ["AUTORIZAÇÃO DE PESQUISA", "REQUERIMENTO DE PESQUISA", "CONCESSÃO DE LAVRA",
+         "REQUERIMENTO DE LAVRA", "LICENCIAMENTO", "DISPONIBILIDADE", "LAVRA GARIMPEIRA"]
+SUBSTANCIAS = ["OURO", "FERRO", "COBRE", "MANGANÊS", "BAUXITA", "AREIA", "GRANITO", "CALCÁRIO"]
+SUFIXOS_TITULAR = ["LTDA", "Ltda.", "S.A.", "S/A", "EIRELI", ""]
+
+
+def versao_pacote(nome: str) -> str:
+    """Versão instalada de um pacote (ou "ausente")."""
+    try:
+        return version(nome)
+    except PackageNotFoundError:
+        return "ausente"
+
+
+# === GERAÇÃO DOS DADOS SINTÉTICOS ===
+
+def _poligonos_sinteticos(rng: np.random.Generator, n: int) -> np.ndarray:
+    """
+    Gera n polígonos simples em forma de estrela, espalhados pelo Brasil.
+
+    Cada polígono tem os vértices em ângulos crescentes ao redor do centro
+    e raios sorteados, o que garante um polígono válido com qualquer
+    quantidade de vértices. Montado com arrays do shapely, sem laço por polígono.
+    """
+    vertices = np.clip(
+        np.round(rng.lognormal(np.log(MEDIANA_VERTICES), DISPERSAO_VERTICES, n)),
+        *LIMITES_VERTICES).astype(np.int64)
+    xmin, ymin, xmax, ymax = BBOX_BRASIL
+    centros = np.column_stack([rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n)])
+    # Raio em graus: de ~100 m a alguns km, como os processos do SIGMINE
+    raios = rng.lognormal(np.log(0.02), 0.8, n)
+
+    dono = np.repeat(np.arange(n), vertices)
+    # Ângulos crescentes dentro de cada polígono: posição do vértice + ruído
+    inicio = np.repeat(np.cumsum(vertices) - vertices, vertices)
+    posicao = np.arange(len(dono)) - inicio
+    angulos = 2 * np.pi * (posicao + rng.uniform(0.1, 0.9, len(dono))) / vertices[dono]
+    distancias = raios[dono] * rng.uniform(0.5, 1.0, len(dono))
+    coords = centros[dono] + np.column_stack([np.cos(angulos), np.sin(angulos)]) * distancias[:, None]
+
+    aneis = shapely.linearrings(coords, indices=dono)  # Fecha cada anel automaticamente
+    return shapely.polygons(aneis)
+
+
+def gerar_shapefile_sintetico(caminho: str, n: int, semente: int = 0) -> str:
+    """
+    Grava um shapefile com n processos fictícios no formato do SIGMINE.
+
+    Tem as colunas do SIGMINE usadas pelo pipeline (PROCESSO, NUMERO, ANO,
+    AREA_HA, FASE, NOME, SUBS, USO, UF, DSProcesso, ULT_EVENTO), em SIRGAS 2000.
+    Os titulares se repetem, com variações de grafia, como nos dados reais.
+    Gravado em lotes, para não montar os 500 mil polígonos na memória de uma vez.
+
+    Args:
+        caminho (str): Caminho do .shp
+        n (int): Quantidade de polígonos
+        semente (int): Semente do sorteio (mesma semente = mesmo arquivo)
+
+    Returns:
+        str: O caminho do .shp
+    """
+    import pyogrio
+
+    rng = np.random.default_rng(semente)
+    n_titulares = max(1, n // 5)
+    for inicio in range(0, n, LOTE_GERACAO):
+        m = min(LOTE_GERACAO, n - inicio)
+        numero = 800_000 + np.arange(inicio, inicio + m) % 200_000
+        ano = 1960 + (np.arange(inicio, inicio + m) // 200_000) + rng.integers(0, 60, m)
+        titular = rng.zipf(1.3, m) % n_titulares  # Poucos titulares com muitos processos
+        nomes = [f"MINERACAO {t:06d} {SUFIXOS_TITULAR[s]}".strip()
+                 for t, s in zip(titular, rng.integers(0, len(SUFIXOS_TITULAR), m))]
+        lote = gpd.GeoDataFrame({
+            "PROCESSO": [f"{a:06d}/{b}" for a, b in zip(numero, ano)],
+            "NUMERO": numero,
+            "ANO": ano,
+            "AREA_HA": np.zeros(m),
+            "FASE": rng.choice(FASES, m),
+            "NOME": nomes,
+            "SUBS": rng.choice(SUBSTANCIAS, m),
+            "USO": "Industrial",
+            "UF": rng.choice(UFS, m),
+            "DSProcesso": [f"{a // 1000:03d}.{a % 1000:03d}/{b}" for a, b in zip(numero, ano)],
+            "ULT_EVENTO": "EVENTO SINTÉTICO",
+        }, geometry=_poligonos_sinteticos(rng, m), crs=4674)
+        # Área declarada aproximada, para a agregação de titulares ter números realistas
+        lote["AREA_HA"] = calcular_area_ha(lote).to_numpy()
+        pyogrio.write_dataframe(lote, caminho, encoding="UTF-8", append=inicio > 0)
+    return caminho
+
+
+# === MEDIÇÃO ===
+
+def medir(etapa: str, funcao, repeticoes: int, preparar=None, **info) -> dict:
+    """
+    Mede o tempo de uma etapa, repetindo-a e guardando todos os tempos.
+
+    Args:
+        etapa (str): Nome da etapa no JSON
+        funcao (callable): Função medida (sem argumentos)
+        repeticoes (int): Quantidade de execuções
+        preparar (callable): Chamada antes de cada execução, fora da medição
+        **info: Dados extras gravados com o resultado (ex: n, workers)
+
+    Returns:
+        dict: {'etapa', 'segundos' (menor tempo), 'mediana', 'tempos', **info}
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar is not None:
+            preparar()
+        # As funções do pipeline escrevem o progresso (print e tqdm) no terminal
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+    resultado = {"etapa": etapa, **info, "segundos": min(tempos),
+                 "mediana": statistics.median(tempos), "tempos": tempos}
+    detalhes = " ".join(f"{k}={v}" for k, v in info.items())
+    print(f"   {etapa:<28} {detalhes:<28} {min(tempos):9.3f} s (mediana {statistics.median(tempos):.3f} s)")
+    return resultado
+
+
+class BuscadorRegex:
+    """
+    Alternativa ao BuscadorPalavras com uma única expressão regular, só para comparação.
+
+    Uma passada pelo texto com a alternância de todas as palavras (as mais
+    longas primeiro) dentro de um lookahead, para achar também ocorrências
+    sobrepostas. Uma palavra que é prefixo de outra achada na mesma posição
+    também conta, e o resultado é o mesmo de BuscadorPalavras.encontrar.
+    """
+
+    def __init__(self, palavras):
+        self.palavras = list(dict.fromkeys(palavras))
+        self._originais = {}
+        for palavra in self.palavras:
+            self._originais.setdefault(remover_acentos(palavra), []).append(palavra)
+        normalizadas = sorted(self._originais, key=len, reverse=True)
+        self._prefixos = {n: [p for p in normalizadas if n.startswith(p)] for n in normalizadas}
+        self._regex = re.compile("(?=(" + "|".join(map(re.escape, normalizadas)) + "))")
+
+    def encontrar(self, texto: str) -> list:
+        if not texto:
+            return []
+        achadas = {m.group(1) for m in self._regex.finditer(remover_acentos(texto))}
+        encontradas = {original for n in achadas for p in self._prefixos[n]
+                       for original in self._originais[p]}
+        return [p for p in self.palavras if p in encontradas]
+
+
+def benchmarks_geo(caminho: str, n: int, repeticoes: int, workers: int, diretorio: str) -> list:
+    """
+    Mede leitura, cache, área (reprojeção) e seleção do top-N de um shapefile.
+
+    Returns:
+        list: Resultados de medir()
+    """
+    cache_dir = os.path.join(diretorio, f"cache_{n}")
+    sig = ler_shapefile(caminho)
+    resultados = [
+        medir("leitura_shapefile", lambda: ler_shapefile(caminho), repeticoes, n=n),
+        medir("construcao_cache", lambda: construir_cache(caminho, cache_dir, workers), repeticoes,
+              n=n, workers=workers),
+        medir("leitura_cache", lambda: carregar_sigmine(caminho, cache_dir), repeticoes, n=n),
+    ]
+    for modo in ("projetada", "elipsoidal"):
+        resultados.append(medir(f"area_{modo}", lambda: calcular_area_ha(sig, 1, modo=modo),
+                                repeticoes, n=n, workers=1))
+    if workers > 1:
+        resultados.append(medir("area_projetada", lambda: calcular_area_ha(sig, workers),
+                                repeticoes, n=n, workers=workers))
+    resultados.append(medir("top_n", lambda: selecionar_top_n(sig, 10, workers=workers),
+                            repeticoes, n=n, top=10))
+    return resultados
+
+
+def benchmarks_ia(args, diretorio: str) -> list:
+    """
+    Mede busca, RAG, pontuação por palavras-chave e gravação do relatório.
+
+    Usa as funções do main.py com os substitutos locais de busca,
+    embeddings e LLM, e com os caches em disco desligados (cada repetição
+    faz todas as chamadas).
+
+    Returns:
+        list: Resultados de medir()
+    """
+    import main  # Importado só aqui: lê as configurações e o .env
+    from langchain_community.vectorstores import Chroma
+    from concorrencia import LimitesPorEtapa
+    from saida_incremental import MarkdownIncremental, CSVIncremental
+
+    main.USAR_CACHE_BUSCA = False
+    main.SEARCH_ENGINE_USED = "Benchmark local"
+    # Sem limite de taxa: o que se mede é o pipeline, não a cota do provedor
+    main.LIMITES_BUSCA[main.SEARCH_ENGINE_USED] = (1_000_000, 1_000_000)
+
+    busca = BuscaLocal(latencia=args.latencia_busca)
+    embeddings = EmbeddingsLocais(latencia=args.latencia_embeddings)
+    llm = LLMLocal(latencia=args.latencia_llm)
+
+    rng = random.Random(0)
+    tarefas = [(f"MINERACAO {rng.randrange(1000):06d} LTDA", f"{800_000 + i:06d}/2020", rng.choice(UFS))
+               for i in range(args.processos)]
+    p = len(tarefas)
+    resultados = []
+
+    resultados.append(medir(
+        "enhanced_search",
+        lambda: [main.enhanced_search(t, proc, uf, busca) for t, proc, uf in tarefas],
+        args.repeticoes, processos=p, latencia=args.latencia_busca))
+
+    # Coleção nova a cada repetição, para que todos os trechos sejam indexados
+    colecao = {}
+    def nova_colecao():
+        colecao["vectorstore"] = Chroma(
+            collection_name=f"benchmark_{time.time_ns()}", embedding_function=embeddings,
+            persist_directory=os.path.join(diretorio, "chroma"))
+
+    def analisar(tarefa, etapas=None):
+        titular, processo, uf = tarefa
+        return main.rag_summary_enhanced(f'"{titular}" {uf}', busca, llm, embeddings, titular,
+                                         processo, uf, vectorstore=colecao["vectorstore"],
+                                         etapas=etapas)
+
+    resultados.append(medir("rag_summary_enhanced", lambda: [analisar(t) for t in tarefas],
+                            args.repeticoes, preparar=nova_colecao, processos=p,
+                            latencia_llm=args.latencia_llm))
+
+    # As mesmas análises pelo pipeline concorrente do main (busca, indexação e geração)
+    def pipeline():
+        etapas = LimitesPorEtapa(main.LIMITES_ETAPAS)
+        main.executar_pipeline(lambda i: analisar(tarefas[i], etapas), list(range(p)), etapas,
+                               desc="Benchmark", ao_concluir=lambda i, analise: None)
+    resultados.append(medir("pipeline_concorrente", pipeline, args.repeticoes,
+                            preparar=nova_colecao, processos=p))
+
+    # Listas completas de palavras de relevância e de impacto, com a busca
+    # de substrings por palavra (BuscadorPalavras) e com a expressão
+    # regular única (BuscadorRegex), que precisam dar o mesmo resultado
+    textos = [" ".join(rng.choice(VOCABULARIO) for _ in range(80)) for _ in range(args.textos_palavras)]
+    palavras = len(main.PALAVRAS_CHAVE_RELEVANCIA) + len(main.TERMOS_IMPACTO)
+    regex_relevancia = BuscadorRegex(main.PALAVRAS_CHAVE_RELEVANCIA)
+    regex_impacto = BuscadorRegex(main.TERMOS_IMPACTO)
+    for texto in textos[:1000]:
+        if (regex_relevancia.encontrar(texto) != main.BUSCADOR_RELEVANCIA.encontrar(texto)
+                or regex_impacto.encontrar(texto) != main.BUSCADOR_IMPACTO.encontrar(texto)):
+            raise AssertionError(f"BuscadorRegex difere de BuscadorPalavras em: {texto!r}")
+    for etapa, relevancia, impacto in (
+            ("pontuacao_palavras_chave", main.BUSCADOR_RELEVANCIA, main.BUSCADOR_IMPACTO),
+            ("pontuacao_palavras_chave_regex", regex_relevancia, regex_impacto)):
+        def pontuar():
+            for texto in textos:
+                relevancia.encontrar(texto)
+                impacto.encontrar(texto)
+        resultados.append(medir(etapa, pontuar, args.repeticoes,
+                                textos=len(textos), palavras=palavras))
+
+    # Relatório e CSVs de muitos processos, a partir de análises já prontas
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        nova_colecao()
+        analises = [analisar(t) for t in tarefas]
+    def gravar_relatorio():
+        saida = os.path.join(diretorio, "relatorio")
+        os.makedirs(saida, exist_ok=True)
+        relatorio = MarkdownIncremental(os.path.join(saida, "relatorio.md"), partes=("processos",))
+        colunas_resultados, colunas_descobertas = main.colunas_csv(
+            [main.COL_PROCESSO, main.COL_TITULAR, main.COL_UF, main.COL_CHAVE, "area_ha_calculada"])
+        csv_resultados = CSVIncremental(os.path.join(saida, "resultados.csv"), colunas_resultados)
+        csv_descobertas = CSVIncremental(os.path.join(saida, "descobertas.csv"), colunas_descobertas)
+        for i in range(args.linhas_relatorio):
+            titular, processo, uf = tarefas[i % p]
+            row = {main.COL_PROCESSO: processo, main.COL_TITULAR: titular, main.COL_UF: uf,
+                   main.COL_CHAVE: i, "area_ha_calculada": 1000.0 + i}
+            data = {**analises[i % p], "row_data": row}
+            termos = main.BUSCADOR_IMPACTO.encontrar(data["summary"])
+            relatorio.escrever("processos", main.format_report_section(processo, data, row))
+            linha, descobertas = main.linhas_csv_processo(processo, data, termos)
+            csv_resultados.escrever([linha])
+            csv_descobertas.escrever(descobertas)
+        relatorio.finalizar("# Benchmark\n")
+        csv_resultados.fechar()
+        csv_descobertas.fechar()
+    resultados.append(medir("gravacao_relatorio", gravar_relatorio, args.repeticoes,
+                            processos=args.linhas_relatorio))
+    return resultados
+
+
+def _pico_memoria_mb():
+    """Pico de memória residente do processo, em MB (None fora do Linux/macOS)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB no Linux, bytes no macOS
+    return round(pico / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def teste_carga(args, dados_dir: str, diretorio: str) -> dict:
+    """
+    Roda o main.py inteiro com args.carga processos e os backends locais.
+
+    O shapefile sintético tem exatamente args.carga polígonos, e N_TOP é
+    args.carga: todos os processos passam pelo pipeline (busca, indexação
+    e geração), com a latência, os erros 429 e a vazão máxima pedidos.
+    Roda uma vez (não repete): com N grande, cada execução leva minutos.
+
+    Returns:
+        dict: Resultado no formato de medir(), com o pico de memória e as
+            medições do manifesto (tempo das etapas e contadores)
+    """
+    import main  # Importado só aqui: lê as configurações e o .env
+    from instrumentacao import Instrumentacao
+
+    n = args.carga
+    caminho = os.path.join(dados_dir, f"sigmine_sintetico_{n}.shp")
+    if not os.path.exists(caminho):
+        gerar_shapefile_sintetico(caminho, n)
+
+    saida = os.path.join(diretorio, "carga")
+    cache = os.path.join(saida, "cache")
+    main.SHAPEFILE_PATH = caminho
+    main.N_TOP = n
+    main.OUTPUT_DIR = saida
+    main.CACHE_DIR = cache
+    main.REPORT_FILENAME = os.path.join(saida, "relatorio.md")
+    main.RANKING_FILENAME = os.path.join(saida, "ranking_processos.csv")
+    main.CHECKPOINT_PATH = os.path.join(saida, "checkpoint.jsonl")
+    main.MANIFESTO_PATH = os.path.join(saida, "manifesto_execucao.json")
+    main.CACHE_BUSCA_PATH = os.path.join(cache, "buscas.sqlite")
+    main.CACHE_EMBEDDINGS_PATH = os.path.join(cache, "embeddings.sqlite")
+    main.CACHE_LLM_PATH = os.path.join(cache, "respostas_llm.sqlite")
+    main.CHROMA_DIR = os.path.join(cache, "chroma")
+    main.SCM_DIR = os.path.join(saida, "sem_scm")
+    main.CAMADAS_SOBREPOSICAO = {}
+    main.BACKEND_BUSCA = main.BACKEND_IA = "local"
+    falhas = {"taxa_429": args.taxa_429, "taxa_erros": args.taxa_erros}
+    main.CONFIG_BACKENDS_LOCAIS = {
+        "busca": {"latencia": args.latencia_busca, "variacao": 0.5, **falhas,
+                  "vazao_max": args.vazao_busca},
+        "embeddings": {"latencia": args.latencia_embeddings, "variacao": 0.5, **falhas},
+        "llm": {"latencia": args.latencia_llm, "variacao": 0.5, **falhas},
+    }
+    # Limites do lado do cliente: os da busca acompanham a vazão simulada;
+    # o de embeddings (ajustado para a cota do Gemini) não se aplica
+    main.LIMITES_BUSCA["Busca local"] = (args.vazao_busca or 1_000_000, 10)
+    main.LIMITE_EMBEDDINGS = (1_000_000, 1_000_000)
+    # Retentativas rápidas: o que se testa é o comportamento, não a espera
+    main.BACKOFF_BASE_BUSCA = main.BACKOFF_BASE_LLM = 0.05
+    main.INSTRUMENTACAO = Instrumentacao()
+
+    print(f"   rodando main.py com {n} processos (progresso abaixo)...")
+    # Uma falha (ex: 429 persistente depois das retentativas) também é um
+    # resultado do teste: o manifesto é gravado até o ponto em que parou
+    erro = None
+    inicio = time.perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()):
+            main.main()
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+    segundos = time.perf_counter() - inicio
+
+    with open(main.MANIFESTO_PATH, encoding="utf-8") as f:
+        manifesto = json.load(f)
+    c = manifesto["contadores"]
+    resultado = {"etapa": "carga_pipeline", "processos": n, **falhas, "vazao_busca": args.vazao_busca,
+                 "latencia_llm": args.latencia_llm, "segundos": segundos, "mediana": segundos,
+                 "tempos": [segundos], "pico_memoria_mb": _pico_memoria_mb(),
+                 "etapas": manifesto["etapas"], "contadores": c, "erro": erro}
+    print(f"   {'carga_pipeline':<28} processos={n:<19} {segundos:9.3f} s "
+          f"({n / segundos:.1f} processos/s, pico de memória {resultado['pico_memoria_mb']} MB)")
+    print(f"   buscas: {c.get('busca_chamadas', 0)} ({c.get('busca_429', 0)} com 429, "
+          f"{c.get('busca_erros', 0)} ignoradas); embeddings: {c.get('embeddings_chamadas', 0)} "
+          f"({c.get('embeddings_429', 0)} com 429); LLM: {c.get('llm_chamadas', 0)} "
+          f"({c.get('llm_429', 0)} com 429)")
+    if erro:
+        print(f"   ❌ execução interrompida: {erro}")
+    return resultado
+
+
+def comparar(atual: dict, anterior: dict):
+    """Mostra, etapa a etapa, o tempo atual em relação a uma execução anterior."""
+    def chave(r):
+        return (r["etapa"],) + tuple(sorted((k, str(v)) for k, v in r.items()
+                                            if k != "etapa" and k not in CAMPOS_MEDIDOS))
+    antes = {chave(r): r["segundos"] for r in anterior.get("resultados", [])}
+    print(f"\n📊 Comparação com a execução de {anterior.get('inicio', '?')}:")
+    for r in atual["resultados"]:
+        if chave(r) in antes and antes[chave(r)] > 0:
+            razao = r["segundos"] / antes[chave(r)]
+            print(f"   {r['etapa']:<28} {antes[chave(r)]:9.3f} s -> {r['segundos']:9.3f} s  ({razao:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks das etapas do pipeline SIGMINE (sem rede)")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="Quantidades de polígonos dos shapefiles sintéticos")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES_PADRAO)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processos usados no cálculo de áreas")
+    parser.add_argument("--processos", type=int, default=PROCESSOS_PADRAO,
+                        help="Processos analisados nos benchmarks de busca e RAG")
+    parser.add_argument("--latencia-busca", type=float, default=LATENCIA_BUSCA_PADRAO)
+    parser.add_argument("--latencia-embeddings", type=float, default=LATENCIA_EMBEDDINGS_PADRAO)
+    parser.add_argument("--latencia-llm", type=float, default=LATENCIA_LLM_PADRAO)
+    parser.add_argument("--textos-palavras", type=int, default=TEXTOS_PALAVRAS_PADRAO)
+    parser.add_argument("--linhas-relatorio", type=int, default=LINHAS_RELATORIO_PADRAO)
+    parser.add_argument("--sem-geo", action="store_true", help="Pula os benchmarks geoespaciais")
+    parser.add_argument("--sem-ia", action="store_true", help="Pula busca, RAG e relatório")
+    parser.add_argument("--carga", type=int, default=None,
+                        help="Teste de carga: main.py inteiro com N processos e backends locais")
+    parser.add_argument("--taxa-429", type=float, default=TAXA_429_PADRAO,
+                        help="Fração das chamadas aos backends locais que falham com 429 (--carga)")
+    parser.add_argument("--taxa-erros", type=float, default=TAXA_ERROS_PADRAO,
+                        help="Fração das chamadas que falham com erro 500 (--carga)")
+    parser.add_argument("--vazao-busca", type=float, default=None,
+                        help="Buscas por segundo aceitas pela busca local (--carga; padrão: sem limite)")
+    parser.add_argument("--dados-dir", default=None,
+                        help="Onde guardar os shapefiles sintéticos para reusar (padrão: temporário)")
+    parser.add_argument("--saida", default=os.path.join(
+        "output", f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"))
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior")
+    args = parser.parse_args(argv)
+
+    execucao = {
+        "inicio": datetime.now().isoformat(timespec="seconds"),
+        "maquina": {"sistema": platform.platform(), "processador": platform.processor(),
+                    "cpus": os.cpu_count(), "python": sys.version.split()[0]},
+        "versoes": {p: versao_pacote(p) for p in ("numpy", "pandas", "geopandas", "shapely", "pyogrio",
+                                                  "pyproj", "pyarrow", "langchain", "chromadb")},
+        "parametros": vars(args),
+        "resultados": [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_sigmine_") as temporario:
+        dados_dir = args.dados_dir or temporario
+        os.makedirs(dados_dir, exist_ok=True)
+
+        if not args.sem_geo:
+            for n in args.tamanhos:
+                caminho = os.path.join(dados_dir, f"sigmine_sintetico_{n}.shp")
+                if not os.path.exists(caminho):
+                    print(f"\n🧪 Gerando shapefile sintético com {n} polígonos...")
+                    inicio = time.perf_counter()
+                    gerar_shapefile_sintetico(caminho, n)
+                    print(f"   gerado em {time.perf_counter() - inicio:.1f} s: {caminho}")
+                print(f"\n⏱️ Etapas geoespaciais ({n} polígonos):")
+                execucao["resultados"] += benchmarks_geo(caminho, n, args.repeticoes, args.workers,
+                                                         temporario)
+
+        if not args.sem_ia:
+            print(f"\n⏱️ Busca, RAG e relatório ({args.processos} processos, backends locais):")
+            execucao["resultados"] += benchmarks_ia(args, temporario)
+
+        if args.carga:
+            print(f"\n🏋️ Teste de carga ({args.carga} processos, backends locais, "
+                  f"taxa de 429 {args.taxa_429}):")
+            execucao["resultados"].append(teste_carga(args, dados_dir, temporario))
+
+    os.makedirs(os.path.dirname(args.saida) or ".", exist_ok=True)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(execucao, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Resultados salvos em: '{args.saida}'")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(execucao, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Caches persistentes para as chamadas aos modelos de IA (embeddings e LLM).
+
+Cada chamada ao Google Gemini é paga e demora; aqui ficam os adaptadores
+que guardam as respostas em disco (ver cache_persistente.py) e evitam
+repetir chamadas para textos já processados.
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor  # Para enviar lotes em paralelo
+
+from langchain_core.embeddings import Embeddings  # Interface de embeddings do LangChain
+from langchain_core.documents import Document  # Estrutura de dados para documentos
+
+from concorrencia import executar_com_retentativa
+
+logger = logging.getLogger(__name__)
+
+
+def hash_conteudo(*partes: str) -> str:
+    """
+    Gera um hash SHA-256 que identifica um conteúdo de forma única.
+
+    As partes são separadas por um caractere nulo para que, por exemplo,
+    ("ab", "c") e ("a", "bc") não gerem o mesmo hash.
+    """
+    return hashlib.sha256("\0".join(partes).encode("utf-8")).hexdigest()
+
+
+class EmbeddingsComCache(Embeddings):
+    """
+    Envolve um modelo de embeddings com um cache em disco endereçado por conteúdo.
+
+    A chave de cada vetor é o hash de (modelo, tipo, texto). Textos já vistos,
+    nesta ou em execuções anteriores, não geram nova chamada ao modelo. Textos
+    repetidos dentro de uma mesma chamada (ex: o mesmo trecho do DuckDuckGo
+    guardado para várias URLs) são enviados ao modelo uma única vez.
+
+    Os textos que faltam no cache são enviados em lotes de `tamanho_lote`
+    (uma requisição por lote), com até `concorrencia` lotes ao mesmo tempo
+    e respeitando o limitador de taxa `bucket`. pre_calcular() junta os
+    trechos de vários processos (threads) que chegam dentro de
+    `espera_lote` segundos, para enviar lotes cheios.
+
+    Pode ser usado no lugar do modelo original em qualquer lugar do LangChain
+    (ex: Chroma.from_documents).
+
+    Args:
+        modelo: Modelo de embeddings do LangChain (ex: GoogleGenerativeAIEmbeddings)
+        cache (CacheSQLite): Cache onde os vetores são guardados
+        nome_modelo (str): Nome usado na chave (padrão: atributo `model` do modelo)
+        tamanho_lote (int): Máximo de textos por requisição ao modelo
+        concorrencia (int): Máximo de requisições simultâneas
+        bucket (TokenBucket): Limitador de taxa das requisições (None = sem limite)
+        max_tentativas (int): Tentativas por lote em caso de erro 429
+        instrumentacao (Instrumentacao): Onde são contados os acertos do cache,
+            as requisições, os trechos enviados e os 429 (None = não conta)
+        espera_lote (float): Tempo máximo, em segundos, que pre_calcular()
+            espera por trechos de outras threads antes de enviar um lote
+            incompleto (0 = envia logo)
+    """
+
+    def __init__(self, modelo, cache, nome_modelo: str = None, tamanho_lote: int = 100,
+                 concorrencia: int = 1, bucket=None, max_tentativas: int = 5,
+                 instrumentacao=None, espera_lote: float = 0.0):
+        self.modelo = modelo
+        self.cache = cache
+        self.nome_modelo = nome_modelo or getattr(modelo, "model", type(modelo).__name__)
+        self.tamanho_lote = max(1, tamanho_lote)
+        self.concorrencia = max(1, concorrencia)
+        self.bucket = bucket
+        self.max_tentativas = max_tentativas
+        self.instrumentacao = instrumentacao
+        self.espera_lote = espera_lote
+        # Trechos aguardando envio por pre_calcular() e trechos em envio,
+        # compartilhados entre as threads
+        self._cond = threading.Condition()
+        self._fila = {}  # chave -> texto
+        self._enviando = set()
+        # Chaves enviadas por pre_calcular() cuja primeira leitura em
+        # embed_documents ainda não foi contada (contam como faltas)
+        self._pre_calculados = Counter()
+        # Contadores simples para acompanhar a economia do cache
+        # (atualizados com self._cond adquirida: várias threads usam o modelo)
+        self.acertos = 0
+        self.chamadas_modelo = 0
+
+    def _somar(self, acertos: int = 0, chamadas_modelo: int = 0):
+        with self._cond:
+            self.acertos += acertos
+            self.chamadas_modelo += chamadas_modelo
+
+    def _chave(self, tipo: str, texto: str) -> str:
+        # Documentos e consultas podem ter embeddings diferentes no mesmo modelo
+        # (ex: task_type RETRIEVAL_DOCUMENT x RETRIEVAL_QUERY no Gemini)
+        return hash_conteudo(self.nome_modelo, tipo, texto)
+
+    def _contar(self, metrica: str, quantidade: int = 1, processo=None):
+        if self.instrumentacao is not None and quantidade:
+            self.instrumentacao.contar(metrica, quantidade, processo=processo)
+
+    def _embutir_faltantes(self, faltantes: dict) -> dict:
+        """
+        Envia ao modelo os textos que não estão no cache, em lotes paralelos.
+
+        Args:
+            faltantes (dict): {chave: texto}, sem repetições
+
+        Returns:
+            dict: {chave: vetor} dos textos enviados (já gravados no cache)
+        """
+        chaves = list(faltantes)
+        lotes = [chaves[i:i + self.tamanho_lote]
+                 for i in range(0, len(chaves), self.tamanho_lote)]
+        # Os lotes rodam em outras threads: o processo das medições vai junto
+        processo = self.instrumentacao.processo_atual() if self.instrumentacao is not None else None
+
+        def embutir_lote(lote):
+            vetores = executar_com_retentativa(
+                self.modelo.embed_documents, [faltantes[c] for c in lote],
+                bucket=self.bucket, max_tentativas=self.max_tentativas,
+                ao_rate_limit=lambda e: self._contar("embeddings_429", processo=processo))
+            novos_lote = dict(zip(lote, ([float(x) for x in vetor] for vetor in vetores)))
+            # Uma única transação por lote, assim que ele volta do modelo
+            self.cache.set_muitos(novos_lote)
+            return novos_lote
+
+        with ThreadPoolExecutor(max_workers=min(self.concorrencia, len(lotes) or 1)) as executor:
+            resultados = list(executor.map(embutir_lote, lotes))
+        self._somar(chamadas_modelo=len(lotes))
+        self._contar("embeddings_chamadas", len(lotes))
+        self._contar("embeddings_trechos", len(chaves))
+
+        novos = {}
+        for novos_lote in resultados:
+            novos.update(novos_lote)
+        return novos
+
+    def pre_calcular(self, texts) -> int:
+        """
+        Garante que os embeddings de todos os textos estejam no cache.
+
+        Chamado por várias threads (uma por processo) antes da indexação:
+        os textos que faltam no cache entram numa fila comum, e a thread que
+        completa um lote, ou cujo prazo de `espera_lote` venceu, envia a
+        fila para todas. Cada thread volta quando seus textos foram
+        enviados (por ela ou por outra).
+
+        Se o envio falhar, o erro só é registrado no log: os textos que
+        faltarem são enviados de novo, normalmente, por embed_documents.
+
+        Returns:
+            int: Quantidade de textos desta chamada que faltavam no cache
+        """
+        faltantes = {}
+        for texto in texts:
+            chave = self._chave("documento", texto)
+            if chave not in faltantes and self.cache.get(chave) is None:
+                faltantes[chave] = texto
+        if not faltantes:
+            return 0
+
+        prazo = time.monotonic() + self.espera_lote
+        with self._cond:
+            for chave, texto in faltantes.items():
+                if chave not in self._fila and chave not in self._enviando:
+                    self._fila[chave] = texto
+            # A fila cresceu: outra thread pode ter agora um lote cheio
+            self._cond.notify_all()
+
+        while True:
+            with self._cond:
+                lote = self._aguardar_lote(faltantes, prazo)
+            if lote is None:
+                return len(faltantes)
+            try:
+                self._embutir_faltantes(lote)
+                enviado = True
+            except Exception as e:
+                logger.warning(f"Falha ao enviar {len(lote)} trechos antecipados: {e}")
+                enviado = False
+            with self._cond:
+                self._enviando.difference_update(lote)
+                if enviado:
+                    self._pre_calculados.update(lote.keys())
+                self._cond.notify_all()
+
+    def _aguardar_lote(self, faltantes: dict, prazo: float):
+        """
+        Espera até os textos de `faltantes` saírem da fila e do envio, ou até
+        ser a vez desta thread de enviar a fila.
+
+        Deve ser chamada com self._cond adquirida.
+
+        Returns:
+            dict ou None: {chave: texto} a enviar (já marcado como em envio),
+                ou None se todos os textos de `faltantes` já foram enviados
+        """
+        while True:
+            na_fila = any(chave in self._fila for chave in faltantes)
+            if not na_fila and not any(chave in self._enviando for chave in faltantes):
+                return None
+            if na_fila:
+                if time.monotonic() >= prazo:
+                    quantidade = len(self._fila)  # Prazo vencido: envia tudo
+                else:
+                    # Antes do prazo, só lotes cheios
+                    quantidade = len(self._fila) // self.tamanho_lote * self.tamanho_lote
+                if quantidade:
+                    chaves = list(self._fila)[:quantidade]
+                    lote = {chave: self._fila.pop(chave) for chave in chaves}
+                    self._enviando.update(lote)
+                    return lote
+                self._cond.wait(timeout=max(0.0, prazo - time.monotonic()))
+            else:
+                # Os textos estão sendo enviados por outra thread
+                self._cond.wait()
+
+    def _contar_pre_calculado(self, chave: str) -> bool:
+        """Consome a marca de uma chave enviada por pre_calcular()."""
+        with self._cond:
+            if self._pre_calculados[chave] <= 0:
+                return False
+            self._pre_calculados[chave] -= 1
+            if not self._pre_calculados[chave]:
+                del self._pre_calculados[chave]
+            return True
+
+    def embed_documents(self, texts):
+        """
+        Gera os embeddings de uma lista de textos, consultando o cache antes.
+
+        Returns:
+            list: Um vetor por texto, na mesma ordem da entrada
+        """
+        chaves = [self._chave("documento", t) for t in texts]
+        vetores = {}
+        faltantes = {}  # chave -> texto, sem repetições
+        pre_calculados = 0  # Achados no cache, mas enviados há pouco por pre_calcular()
+
+        for chave, texto in zip(chaves, texts):
+            if chave in vetores or chave in faltantes:
+                continue
+            vetor = self.cache.get(chave)
+            if vetor is None:
+                faltantes[chave] = texto
+            else:
+                vetores[chave] = vetor
+                if self._contar_pre_calculado(chave):
+                    pre_calculados += 1
+
+        self._somar(acertos=len(vetores) - pre_calculados)
+        self._contar("embeddings_cache_acertos", len(vetores) - pre_calculados)
+        self._contar("embeddings_cache_faltas", len(faltantes) + pre_calculados)
+        if faltantes:
+            vetores.update(self._embutir_faltantes(faltantes))
+
+        return [vetores[chave] for chave in chaves]
+
+    def embed_query(self, text):
+        """
+        Gera o embedding de uma consulta, consultando o cache antes.
+
+        Returns:
+            list: Vetor da consulta
+        """
+        chave = self._chave("consulta", text)
+        vetor = self.cache.get(chave)
+        if vetor is not None:
+            self._somar(acertos=1)
+            self._contar("embeddings_cache_acertos")
+            return vetor
+        self._somar(chamadas_modelo=1)
+        self._contar("embeddings_cache_faltas")
+        self._contar("embeddings_chamadas")
+        self._contar("embeddings_trechos")
+        vetor = executar_com_retentativa(
+            self.modelo.embed_query, text, bucket=self.bucket, max_tentativas=self.max_tentativas,
+            ao_rate_limit=lambda e: self._contar("embeddings_429"))
+        vetor = [float(x) for x in vetor]
+        self.cache.set(chave, vetor)
+        return vetor
+
+
+class CacheRespostasLLM:
+    """
+    Cache em disco das respostas do LLM na cadeia de perguntas e respostas (RAG).
+
+    A chave é o hash de (modelo, temperatura, template do prompt, pergunta,
+    hashes dos trechos de contexto na ordem em que foram recuperados). Se
+    tudo isso se repete, a resposta do modelo seria a mesma chamada de novo;
+    o cache devolve o 'result' e os 'source_documents' guardados sem acionar
+    o modelo.
+
+    Args:
+        cache (CacheSQLite): Cache onde as respostas são guardadas
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        # Consultado por várias threads de geração ao mesmo tempo
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+
+    def chave(self, llm, template: str, pergunta: str, documentos) -> str:
+        """
+        Calcula a chave de uma chamada ao LLM.
+
+        Args:
+            llm: Modelo de chat (ex: ChatGoogleGenerativeAI)
+            template (str): Template do prompt
+            pergunta (str): Pergunta enviada à cadeia
+            documentos (list): Trechos de contexto, na ordem de recuperação
+
+        Returns:
+            str: Hash que identifica a chamada
+        """
+        modelo = str(getattr(llm, "model", type(llm).__name__))
+        temperatura = str(getattr(llm, "temperature", ""))
+        hashes_contexto = [hash_conteudo(doc.page_content) for doc in documentos]
+        return hash_conteudo(modelo, temperatura, template, pergunta, *hashes_contexto)
+
+    def get(self, chave: str):
+        """
+        Retorna a resposta guardada, no mesmo formato da cadeia RetrievalQA.
+
+        Returns:
+            dict ou None: {'result': str, 'source_documents': [Document]}
+        """
+        valor = self.cache.get(chave)
+        with self._lock:
+            if valor is None:
+                self.faltas += 1
+            else:
+                self.acertos += 1
+        if valor is None:
+            return None
+        return {
+            'result': valor['result'],
+            'source_documents': [Document(page_content=d['page_content'], metadata=d['metadata'])
+                                 for d in valor['source_documents']],
+        }
+
+    def set(self, chave: str, resposta: dict):
+        """Guarda a resposta ('result' e 'source_documents') da cadeia."""
+        self.cache.set(chave, {
+            'result': resposta['result'],
+            'source_documents': [{'page_content': d.page_content, 'metadata': d.metadata}
+                                 for d in resposta.get('source_documents', [])],
+        })
@@ -0,0 +1,242 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Cache persistente em disco (SQLite) para respostas de APIs externas.
+
+Evita repetir chamadas pagas ou com cota (buscas na web) quando o
+script é executado novamente sobre os mesmos processos.
+"""
+
+import os
+import json
+import atexit
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_query(query: str) -> str:
+    """
+    Normaliza uma query de busca para uso como chave de cache.
+
+    Buscas que diferem só em maiúsculas/minúsculas, espaços extras ou
+    forma de codificação dos acentos são tratadas como a mesma busca.
+
+    Ex: '  "VALE S.A."   PA ' -> '"vale s.a." pa'
+    """
+    query = unicodedata.normalize("NFC", query)
+    return " ".join(query.split()).casefold()
+
+
+class CacheSQLite:
+    """
+    Armazena valores JSON em uma tabela SQLite, com validade (TTL) e tamanho máximo.
+
+    Cada entrada guarda o valor, o momento em que foi obtido e o último
+    acesso. Entradas mais antigas que o TTL são ignoradas e removidas.
+    Quando o total armazenado passa do tamanho máximo, as entradas
+    acessadas há mais tempo são descartadas (LRU) até o total voltar a
+    FRACAO_APOS_DESCARTE do máximo.
+
+    O total armazenado é somado uma vez ao abrir e depois mantido na
+    memória, pela diferença de cada gravação e remoção (sem varrer a tabela
+    a cada gravação). Os horários de acesso das leituras ficam num buffer,
+    gravados de uma vez a cada `acessos_por_gravacao` chaves lidas, antes de um
+    descarte e ao fechar (também ao fim do programa, se o cache não foi
+    fechado): uma leitura não abre uma transação de escrita.
+
+    Pode ser usado por várias threads ao mesmo tempo.
+
+    Args:
+        caminho (str): Arquivo do banco SQLite
+        tabela (str): Nome da tabela (permite vários caches no mesmo arquivo)
+        ttl_segundos (float): Validade das entradas (None = não expiram)
+        tamanho_max_bytes (int): Tamanho máximo dos valores (None = sem limite)
+        acessos_por_gravacao (int): Chaves lidas acumuladas antes de gravar
+            os horários de acesso
+    """
+
+    # Fração do tamanho máximo que sobra depois de um descarte: folga para
+    # que as gravações seguintes não disparem um descarte cada uma
+    FRACAO_APOS_DESCARTE = 0.9
+
+    def __init__(self, caminho: str, tabela: str, ttl_segundos: float = None,
+                 tamanho_max_bytes: int = None, acessos_por_gravacao: int = 500):
+        if not tabela.isidentifier():
+            raise ValueError(f"Nome de tabela inválido: {tabela!r}")
+        self.caminho = caminho
+        self.tabela = tabela
+        self.ttl_segundos = ttl_segundos
+        self.tamanho_max_bytes = tamanho_max_bytes
+        self.acessos_por_gravacao = max(1, acessos_por_gravacao)
+        self._acessos = {}  # chave -> último acesso ainda não gravado
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        # Uma única conexão protegida por lock, compartilhada entre threads
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        with self._lock, self._conn:
+            # WAL permite leituras enquanto outra execução grava no mesmo arquivo
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {tabela} (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    obtido_em REAL NOT NULL,
+                    acessado_em REAL NOT NULL,
+                    tamanho INTEGER NOT NULL
+                )""")
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{tabela}_acesso ON {tabela} (acessado_em)")
+        self.limpar_expirados()
+        with self._lock:
+            # Única soma da tabela inteira; daqui em diante o total é atualizado
+            # pela diferença de cada gravação e remoção
+            self._total_bytes = self._conn.execute(
+                f"SELECT COALESCE(SUM(tamanho), 0) FROM {tabela}").fetchone()[0]
+        # Os caches do pipeline ficam abertos até o fim do programa
+        atexit.register(self.fechar)
+
+    def _expirado(self, obtido_em: float) -> bool:
+        return self.ttl_segundos is not None and time.time() - obtido_em > self.ttl_segundos
+
+    def get(self, chave: str, padrao=None):
+        """
+        Retorna o valor guardado para a chave, ou `padrao` se ausente ou expirado.
+        """
+        with self._lock:
+            linha = self._conn.execute(
+                f"SELECT valor, obtido_em, tamanho FROM {self.tabela} WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                return padrao
+            valor, obtido_em, tamanho = linha
+            if self._expirado(obtido_em):
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM {self.tabela} WHERE chave = ?", (chave,))
+                self._total_bytes -= tamanho
+                self._acessos.pop(chave, None)
+                return padrao
+            self._acessos[chave] = time.time()
+            if len(self._acessos) >= self.acessos_por_gravacao:
+                with self._conn:
+                    self._gravar_acessos()
+        return json.loads(valor)
+
+    def set(self, chave: str, valor):
+        """
+        Guarda um valor (serializável em JSON) e aplica o limite de tamanho.
+        """
+        self.set_muitos({chave: valor})
+
+    def set_muitos(self, valores: dict):
+        """
+        Guarda vários valores numa única transação e aplica o limite de tamanho.
+
+        Args:
+            valores (dict): {chave: valor serializável em JSON}
+        """
+        agora = time.time()
+        linhas = []
+        for chave, valor in valores.items():
+            texto = json.dumps(valor, ensure_ascii=False)
+            linhas.append((chave, texto, agora, agora, len(texto.encode("utf-8"))))
+        if not linhas:
+            return
+        with self._lock, self._conn:
+            # Tamanho das entradas substituídas, para manter o total sem somar a tabela
+            for chave, *_ in linhas:
+                anterior = self._conn.execute(
+                    f"SELECT tamanho FROM {self.tabela} WHERE chave = ?", (chave,)).fetchone()
+                if anterior is not None:
+                    self._total_bytes -= anterior[0]
+                self._acessos.pop(chave, None)
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.tabela} VALUES (?, ?, ?, ?, ?)", linhas)
+            self._total_bytes += sum(linha[4] for linha in linhas)
+            self._aplicar_limite_tamanho()
+
+    def remover(self, chave: str):
+        """Remove uma entrada do cache (se existir)."""
+        with self._lock, self._conn:
+            linha = self._conn.execute(
+                f"SELECT tamanho FROM {self.tabela} WHERE chave = ?", (chave,)).fetchone()
+            if linha is not None:
+                self._conn.execute(f"DELETE FROM {self.tabela} WHERE chave = ?", (chave,))
+                self._total_bytes -= linha[0]
+            self._acessos.pop(chave, None)
+
+    def limpar_expirados(self):
+        """Remove todas as entradas com validade vencida."""
+        if self.ttl_segundos is None:
+            return
+        limite = time.time() - self.ttl_segundos
+        with self._lock, self._conn:
+            removidos = self._conn.execute(
+                f"SELECT COALESCE(SUM(tamanho), 0) FROM {self.tabela} WHERE obtido_em < ?",
+                (limite,)).fetchone()[0]
+            self._conn.execute(f"DELETE FROM {self.tabela} WHERE obtido_em < ?", (limite,))
+            self._total_bytes -= removidos
+
+    def _gravar_acessos(self):
+        """
+        Grava os horários de acesso acumulados pelas leituras.
+
+        Deve ser chamada com o lock adquirido e dentro de uma transação.
+        """
+        if self._acessos:
+            self._conn.executemany(f"UPDATE {self.tabela} SET acessado_em = ? WHERE chave = ?",
+                                   [(acesso, chave) for chave, acesso in self._acessos.items()])
+            self._acessos.clear()
+
+    def _aplicar_limite_tamanho(self):
+        """
+        Descarta as entradas menos usadas se o cache passou do tamanho máximo.
+
+        Deve ser chamada com o lock adquirido e dentro de uma transação.
+        """
+        if self.tamanho_max_bytes is None or self._total_bytes <= self.tamanho_max_bytes:
+            return
+        # Os acessos ainda no buffer contam para decidir quem é descartado
+        self._gravar_acessos()
+        excesso = self._total_bytes - int(self.tamanho_max_bytes * self.FRACAO_APOS_DESCARTE)
+        removidos = 0
+        chaves = []
+        for chave, tamanho in self._conn.execute(
+                f"SELECT chave, tamanho FROM {self.tabela} ORDER BY acessado_em"):
+            chaves.append((chave,))
+            removidos += tamanho
+            if removidos >= excesso:
+                break
+        self._conn.executemany(f"DELETE FROM {self.tabela} WHERE chave = ?", chaves)
+        self._total_bytes -= removidos
+        logger.info(f"Cache '{self.tabela}': {len(chaves)} entradas antigas descartadas")
+
+    def tamanho_bytes(self) -> int:
+        """Total armazenado (soma do tamanho dos valores), em bytes."""
+        with self._lock:
+            return self._total_bytes
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.tabela}").fetchone()[0]
+
+    def fechar(self):
+        """Grava os acessos pendentes e fecha a conexão com o banco."""
+        atexit.unregister(self.fechar)
+        with self._lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                self._gravar_acessos()
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,83 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Chave numérica canônica dos processos minerários.
+
+O mesmo processo aparece escrito de formas diferentes em cada fonte:
+"803237/2022" (PROCESSO, no SIGMINE), "803.237/2022" (DSProcesso, no
+SIGMINE, e DSPROCESSO, no SCM), às vezes com ou sem zeros à esquerda.
+Juntar tabelas por esses textos é lento e, pior, descarta em silêncio
+as linhas cujo formato não bate.
+
+Aqui cada processo vira um único inteiro de 64 bits:
+
+    chave = número × 10.000 + ano    ("803.237/2022" -> 8032372022)
+
+Todas as junções e consultas entre SIGMINE, SCM e os resultados da
+análise são feitas por essa chave.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Multiplicador do número do processo: o ano ocupa os 4 últimos dígitos
+FATOR_ANO = 10_000
+
+# Chave dos textos que não puderam ser interpretados como "número/ano"
+CHAVE_INVALIDA = -1
+
+# Número (com ou sem pontos de milhar) e ano de 4 dígitos, ex: "803.237/2022"
+_PADRAO_PROCESSO = r"^\s*(?P<numero>[0-9][0-9.]*)\s*/\s*(?P<ano>[0-9]{4})\s*$"
+
+
+def chave_de_numero_ano(numero, ano) -> np.ndarray:
+    """
+    Calcula a chave a partir do número e do ano já separados.
+
+    Usada com as colunas NUMERO e ANO do SIGMINE, sem interpretar textos.
+
+    Returns:
+        ndarray: Chaves int64
+    """
+    return np.asarray(numero, dtype=np.int64) * FATOR_ANO + np.asarray(ano, dtype=np.int64)
+
+
+def chave_processo(processos) -> np.ndarray:
+    """
+    Converte números de processo escritos como texto para a chave canônica.
+
+    Aceita os formatos do SIGMINE e do SCM ("803237/2022", "803.237/2022",
+    "001.662/1936"). A conversão é vetorizada (pyarrow.compute), sem laços
+    em Python, e serve tanto para uma lista curta (filtros) quanto para as
+    centenas de milhares de linhas do SCM.
+
+    Args:
+        processos: Textos (lista, Series, array ou coluna Arrow)
+
+    Returns:
+        ndarray: Chaves int64; CHAVE_INVALIDA para textos fora do padrão
+    """
+    if isinstance(processos, (pa.Array, pa.ChunkedArray)):
+        textos = processos.cast(pa.string())
+    else:
+        textos = pa.array(pd.Series(list(processos), dtype=object).astype(str), type=pa.string())
+
+    partes = pc.extract_regex(textos, _PADRAO_PROCESSO)
+    numero = pc.replace_substring(pc.struct_field(partes, "numero"), ".", "")
+    ano = pc.struct_field(partes, "ano")
+    chaves = pc.add(pc.multiply(numero.cast(pa.int64()), FATOR_ANO), ano.cast(pa.int64()))
+    return pc.fill_null(chaves, CHAVE_INVALIDA).to_numpy(zero_copy_only=False).astype(np.int64)
+
+
+def formatar_chave(chaves) -> list:
+    """
+    Escreve chaves no formato do PROCESSO do SIGMINE (ex: 8032372022 -> "803237/2022").
+
+    Returns:
+        list: Textos "número/ano", com o número em 6 dígitos
+    """
+    chaves = np.asarray(chaves, dtype=np.int64)
+    return [f"{c // FATOR_ANO:06d}/{c % FATOR_ANO:04d}" for c in chaves]
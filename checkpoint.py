@@ -0,0 +1,119 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Checkpoint das análises concluídas, para execuções em lote retomáveis.
+
+Cada análise terminada é gravada imediatamente numa linha de um arquivo
+JSONL (só acrescenta, nunca reescreve). Se a execução for interrompida
+(queda, erro de cota, Ctrl+C), a próxima execução lê o arquivo e pula as
+análises que já estão nele.
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointJSONL:
+    """
+    Registro append-only de análises concluídas, uma linha JSON por análise.
+
+    Cada linha tem a forma {"chave": ..., "registrado_em": ..., "dados": ...}.
+    Se a mesma chave aparece mais de uma vez (ex: processo reanalisado),
+    vale a última linha. Uma linha incompleta no fim do arquivo (execução
+    interrompida no meio da gravação) é ignorada.
+
+    Na memória fica só a posição (em bytes) de cada linha no arquivo; os
+    dados são lidos do disco quando pedidos em obter(). Assim, retomar um
+    lote com milhares de análises não carrega todas elas de uma vez.
+
+    Pode ser usado por várias threads ao mesmo tempo.
+
+    Args:
+        caminho (str): Arquivo JSONL do checkpoint
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self.posicoes = self._carregar()
+
+    def _carregar(self) -> dict:
+        """
+        Localiza as análises já registradas.
+
+        Returns:
+            dict: {chave: posição da linha no arquivo, em bytes}
+        """
+        posicoes = {}
+        if not os.path.exists(self.caminho):
+            return posicoes
+
+        posicao = 0
+        ultima = b""
+        with open(self.caminho, "rb") as f:
+            for numero, linha in enumerate(f, start=1):
+                ultima = linha
+                if linha.strip():
+                    try:
+                        posicoes[json.loads(linha)["chave"]] = posicao
+                    except (ValueError, KeyError):
+                        logger.warning(f"Checkpoint {self.caminho}: linha {numero} inválida ignorada")
+                posicao += len(linha)
+
+        # Uma gravação interrompida deixa o arquivo sem a quebra de linha final;
+        # completa a linha para que o próximo registro comece numa linha nova
+        if ultima and not ultima.endswith(b"\n"):
+            with open(self.caminho, "ab") as f:
+                f.write(b"\n")
+
+        return posicoes
+
+    def concluido(self, chave: str) -> bool:
+        """Indica se a análise identificada por `chave` já foi registrada."""
+        with self._lock:
+            return chave in self.posicoes
+
+    def obter(self, chave: str, padrao=None):
+        """Lê do arquivo os dados registrados para a chave, ou retorna `padrao`."""
+        with self._lock:
+            posicao = self.posicoes.get(chave)
+            if posicao is None:
+                return padrao
+            with open(self.caminho, "rb") as f:
+                f.seek(posicao)
+                return json.loads(f.readline())["dados"]
+
+    def registrar(self, chave: str, dados):
+        """
+        Grava uma análise concluída no fim do arquivo.
+
+        A linha é enviada ao disco (fsync) antes de retornar, para que a
+        análise não se perca se a execução cair logo em seguida.
+        """
+        linha = json.dumps({
+            "chave": chave,
+            "registrado_em": datetime.now().isoformat(timespec="seconds"),
+            "dados": dados,
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.caminho, "ab") as f:
+                posicao = f.tell()
+                f.write((linha + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            self.posicoes[chave] = posicao
+
+    def __len__(self):
+        with self._lock:
+            return len(self.posicoes)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Ferramentas de controle de taxa e de retentativas para chamadas a APIs externas.
+
+Usadas pelas buscas na web (Google/DuckDuckGo) para rodar várias consultas
+em paralelo sem ultrapassar o limite de requisições de cada provedor, e
+pelo pipeline que analisa vários processos ao mesmo tempo.
+"""
+
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Limitador de taxa do tipo "balde de fichas" (token bucket), seguro entre threads.
+
+    O balde começa cheio com `capacidade` fichas e é reabastecido continuamente
+    à razão de `taxa` fichas por segundo. Cada requisição consome uma ficha;
+    se o balde estiver vazio, a thread espera até a próxima ficha ficar pronta.
+    Assim, rajadas curtas de até `capacidade` requisições são permitidas, mas a
+    média nunca passa de `taxa` requisições por segundo.
+
+    Args:
+        taxa (float): Fichas reabastecidas por segundo (requisições/s)
+        capacidade (int): Máximo de fichas acumuladas (tamanho da rajada)
+    """
+
+    def __init__(self, taxa: float, capacidade: int = 1):
+        if taxa <= 0:
+            raise ValueError("A taxa do TokenBucket deve ser positiva")
+        self.taxa = float(taxa)
+        self.capacidade = max(1, int(capacidade))
+        self._fichas = float(self.capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reabastecer(self):
+        """Adiciona as fichas acumuladas desde a última verificação."""
+        agora = time.monotonic()
+        self._fichas = min(self.capacidade, self._fichas + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def adquirir(self):
+        """Consome uma ficha, esperando o tempo necessário se o balde estiver vazio."""
+        while True:
+            with self._lock:
+                self._reabastecer()
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            # Dorme fora do lock para não bloquear as outras threads
+            time.sleep(espera)
+
+
+def eh_rate_limit(erro: Exception) -> bool:
+    """
+    Verifica se uma exceção corresponde a um erro 429 (Too Many Requests).
+
+    As bibliotecas de busca não usam uma exceção padrão para isso,
+    então a verificação é feita pelo código de status ou pela mensagem.
+    """
+    status = getattr(getattr(erro, "resp", None), "status", None)
+    return status == 429 or "429" in str(erro)
+
+
+def executar_com_retentativa(funcao, *args, bucket: TokenBucket = None,
+                             max_tentativas: int = 5, backoff_base: float = 1.0,
+                             backoff_max: float = 60.0, ao_rate_limit=None, **kwargs):
+    """
+    Executa uma chamada respeitando o limitador de taxa e repetindo em caso de 429.
+
+    Antes de cada tentativa, consome uma ficha do `bucket`. Se a chamada
+    falhar com 429, espera um tempo que cresce exponencialmente
+    (backoff_base, 2x, 4x, ...) com "jitter" aleatório, para que várias
+    threads não voltem a bater na API exatamente no mesmo instante.
+    Outros erros são propagados imediatamente.
+
+    Args:
+        funcao (callable): Função a ser executada
+        bucket (TokenBucket): Limitador de taxa (None = sem limite)
+        max_tentativas (int): Número máximo de tentativas
+        backoff_base (float): Espera base, em segundos, após o primeiro 429
+        backoff_max (float): Espera máxima entre tentativas, em segundos
+        ao_rate_limit (callable): Chamada com o erro a cada 429 recebido,
+            inclusive o último (ex: para contar os 429 de cada API)
+
+    Returns:
+        O retorno de `funcao`
+
+    Raises:
+        Exception: O último erro 429 se todas as tentativas falharem,
+            ou qualquer outro erro da chamada
+    """
+    for tentativa in range(max_tentativas):
+        if bucket is not None:
+            bucket.adquirir()
+        try:
+            return funcao(*args, **kwargs)
+        except Exception as e:
+            if ao_rate_limit is not None and eh_rate_limit(e):
+                ao_rate_limit(e)
+            if not eh_rate_limit(e) or tentativa == max_tentativas - 1:
+                raise
+            # "Full jitter": espera aleatória entre 0 e o teto exponencial
+            teto = min(backoff_max, backoff_base * (2 ** tentativa))
+            espera = random.uniform(0, teto)
+            logger.info(f"Rate limit (429). Nova tentativa em {espera:.1f}s "
+                        f"({tentativa + 1}/{max_tentativas})")
+            time.sleep(espera)
+
+
+class ExecucaoUnica:
+    """
+    Garante que cada chave seja calculada uma única vez, mesmo entre threads.
+
+    A primeira thread que pede uma chave executa a função; as que pedirem a
+    mesma chave durante a execução esperam por ela e recebem o mesmo
+    resultado. Erros também são compartilhados.
+
+    O resultado fica na memória só enquanto for útil: a entrada é removida
+    quando a última thread que esperava por ela o recebe e a chave já foi
+    pedida as vezes previstas em `usos`. Chaves fora de `usos` saem assim
+    que ninguém mais espera por elas; um novo pedido as calcula de novo
+    (ex: lendo do cache em disco).
+
+    Args:
+        usos (dict): {chave: quantas vezes será pedida} (None = sem previsão)
+    """
+
+    def __init__(self, usos: dict = None):
+        self.usos = dict(usos or {})
+        self._entradas = {}  # chave -> {"futuro", "esperando", "pedidos"}
+        self._lock = threading.Lock()
+
+    def executar(self, chave, funcao, *args, **kwargs):
+        """
+        Retorna funcao(*args, **kwargs), calculada uma só vez para pedidos simultâneos
+        ou previstos de `chave`.
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            responsavel = entrada is None
+            if responsavel:
+                entrada = self._entradas[chave] = {"futuro": Future(), "esperando": 0, "pedidos": 0}
+            entrada["esperando"] += 1
+            entrada["pedidos"] += 1
+        futuro = entrada["futuro"]
+        if responsavel:
+            try:
+                futuro.set_result(funcao(*args, **kwargs))
+            except Exception as e:
+                futuro.set_exception(e)
+        try:
+            return futuro.result()
+        finally:
+            with self._lock:
+                entrada["esperando"] -= 1
+                if entrada["esperando"] == 0 and entrada["pedidos"] >= self.usos.get(chave, 0):
+                    del self._entradas[chave]
+
+    def __len__(self):
+        """Quantidade de chaves com resultado ainda na memória."""
+        with self._lock:
+            return len(self._entradas)
+
+
+class LimitesPorEtapa:
+    """
+    Limita quantas threads executam cada etapa de um pipeline ao mesmo tempo.
+
+    Cada etapa tem seu próprio semáforo. Uma thread que termina uma etapa
+    libera a vaga e passa à seguinte; assim, vários itens avançam juntos,
+    cada um numa etapa diferente (ex: um processo consulta o LLM enquanto
+    outro é indexado e um terceiro faz as buscas).
+
+    Args:
+        limites (dict): {nome da etapa: máximo de threads simultâneas}
+    """
+
+    def __init__(self, limites: dict):
+        self.limites = {nome: max(1, int(n)) for nome, n in limites.items()}
+        self._semaforos = {nome: threading.BoundedSemaphore(n)
+                           for nome, n in self.limites.items()}
+
+    @contextmanager
+    def etapa(self, nome: str):
+        """Ocupa uma vaga da etapa `nome` durante o bloco `with` (etapas sem limite não esperam)."""
+        with self._semaforos.get(nome, nullcontext()):
+            yield
+
+    def total(self) -> int:
+        """Soma das vagas de todas as etapas."""
+        return sum(self.limites.values())
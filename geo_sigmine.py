@@ -0,0 +1,800 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Funções de geoprocessamento do shapefile SIGMINE.
+
+Este módulo concentra a leitura do shapefile e o cálculo de áreas,
+para que o main.py trate apenas da orquestração do pipeline.
+"""
+
+import os
+import json  # Para salvar a assinatura do shapefile junto do cache
+import hashlib  # Para calcular o hash do conteúdo do shapefile
+import logging
+from concurrent.futures import ProcessPoolExecutor  # Para usar vários núcleos na reprojeção
+
+import numpy as np  # Para cálculos vetorizados sobre as coordenadas
+import pandas as pd
+import shapely  # Para extrair as coordenadas das geometrias como arrays
+import geopandas as gpd  # Extensão do pandas para dados geoespaciais (shapefiles)
+from functools import partial
+from pyproj import Transformer  # Para reprojetar arrays de coordenadas
+
+from chaves import FATOR_ANO, CHAVE_INVALIDA, chave_processo, chave_de_numero_ano
+
+logger = logging.getLogger(__name__)
+
+# === CONFIGURAÇÕES DE GEOPROCESSAMENTO ===
+
+# SIRGAS 2000 / Brazil Polyconic: projeção métrica usada no cálculo de áreas
+CRS_AREA = 5880
+
+# Diretório padrão onde ficam os arquivos de cache (GeoParquet + assinatura)
+CACHE_DIR = os.path.join("data", "cache")
+
+# Arquivos que compõem um shapefile. Qualquer alteração neles invalida o cache
+EXTENSOES_SHAPEFILE = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+# Modos de cálculo de área disponíveis:
+# - "projetada": reprojeta para EPSG:5880 e mede a área plana (padrão histórico)
+# - "elipsoidal": mede a área direto das coordenadas SIRGAS 2000 sobre o
+#   elipsoide GRS80, sem criar uma cópia reprojetada das geometrias
+MODOS_AREA = ("projetada", "elipsoidal")
+
+# Quantidade de feições reprojetadas e medidas por tarefa no cálculo paralelo
+# Lotes grandes diluem o custo de enviar as geometrias aos processos
+TAMANHO_LOTE_AREA = 10_000
+
+# Parâmetros do limite superior de área usado na pré-seleção do top-N
+# Pontos amostrados em cada lado do retângulo envolvente ao reprojetá-lo
+DENSIFICACAO_BBOX = 5
+# Folga relativa aplicada ao retângulo reprojetado, cobrindo a curvatura
+# dos lados entre os pontos amostrados
+MARGEM_BBOX = 0.02
+
+# Versão do formato do cache. Incrementar quando mudar o que é salvo no GeoParquet
+VERSAO_CACHE = 4
+
+# Chave numérica canônica de cada processo (ver chaves.py), calculada a
+# partir das colunas NUMERO e ANO do shapefile e guardada no cache
+COLUNA_CHAVE = "chave_processo"
+COLUNAS_NUMERO_ANO = ("NUMERO", "ANO")
+
+# Coluna que marca os processos cuja geometria era inválida no shapefile e
+# foi reparada (ver reparar_geometrias). Guardada no cache junto da geometria
+# reparada, para que o reparo não seja refeito a cada leitura
+COLUNA_REPARADA = "geometria_reparada"
+
+# Colunas do shapefile que podem ser usadas como filtro na leitura
+# Chave: nome do argumento nas funções de leitura / Valor: coluna no SIGMINE
+COLUNAS_FILTRO = {
+    "uf": "UF",            # Unidade Federativa (ex: "PA")
+    "fase": "FASE",        # Fase do processo (ex: "CONCESSÃO DE LAVRA")
+    "substancia": "SUBS",  # Substância (ex: "OURO")
+    "processo": COLUNA_CHAVE,  # Número do processo (ex: "803237/2022" ou "803.237/2022")
+    "titular": "NOME",     # Nome do titular (ex: "VALE S.A.")
+}
+
+
+def _arquivos_shapefile(shapefile_path: str):
+    """
+    Lista os arquivos existentes que compõem o shapefile (.shp, .dbf, etc.).
+
+    Args:
+        shapefile_path (str): Caminho para o arquivo .shp
+
+    Returns:
+        list: Caminhos dos arquivos auxiliares que existem em disco
+    """
+    base, _ = os.path.splitext(shapefile_path)
+    return [base + ext for ext in EXTENSOES_SHAPEFILE if os.path.exists(base + ext)]
+
+
+def _hash_arquivos(caminhos, tamanho_bloco: int = 8 * 1024 * 1024) -> str:
+    """
+    Calcula um hash SHA-256 do conteúdo de vários arquivos.
+
+    A leitura é feita em blocos para não carregar o shapefile
+    inteiro (centenas de MB) na memória.
+
+    Args:
+        caminhos (list): Arquivos a serem lidos, em ordem fixa
+        tamanho_bloco (int): Quantidade de bytes lidos por vez
+
+    Returns:
+        str: Hash hexadecimal do conteúdo
+    """
+    h = hashlib.sha256()
+    for caminho in caminhos:
+        h.update(os.path.basename(caminho).encode("utf-8"))
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+                h.update(bloco)
+    return h.hexdigest()
+
+
+def assinatura_shapefile(shapefile_path: str, calcular_hash: bool = True,
+                         modo_area: str = "projetada") -> dict:
+    """
+    Gera a assinatura (tamanho, data de modificação e hash) do shapefile.
+
+    A assinatura é usada como chave do cache: se ela mudar, o cache
+    é reconstruído automaticamente.
+
+    Args:
+        shapefile_path (str): Caminho para o arquivo .shp
+        calcular_hash (bool): Se False, omite o hash (mais rápido)
+        modo_area (str): Modo de cálculo da área guardada no cache
+
+    Returns:
+        dict: Assinatura com tamanho e mtime por arquivo e, opcionalmente, o hash
+    """
+    caminhos = _arquivos_shapefile(shapefile_path)
+    assinatura = {
+        "versao": VERSAO_CACHE,
+        "crs_area": CRS_AREA,
+        "modo_area": modo_area,
+        "arquivos": {
+            os.path.basename(c): {
+                "tamanho": os.path.getsize(c),
+                "mtime_ns": os.stat(c).st_mtime_ns,
+            }
+            for c in caminhos
+        },
+    }
+    if calcular_hash:
+        assinatura["sha256"] = _hash_arquivos(caminhos)
+    return assinatura
+
+
+def _caminhos_cache(shapefile_path: str, cache_dir: str, modo_area: str = "projetada"):
+    """
+    Define onde ficam o GeoParquet e a assinatura de um shapefile.
+
+    Cada modo de área tem seu próprio cache, para que alternar entre
+    eles não force a reconstrução a cada execução.
+
+    Returns:
+        tuple: (caminho do .parquet, caminho do .json com a assinatura)
+    """
+    nome = os.path.splitext(os.path.basename(shapefile_path))[0] + "_" + modo_area
+    return (os.path.join(cache_dir, f"{nome}.parquet"),
+            os.path.join(cache_dir, f"{nome}.json"))
+
+
+def cache_valido(shapefile_path: str, cache_dir: str = CACHE_DIR,
+                 modo_area: str = "projetada") -> bool:
+    """
+    Verifica se o cache GeoParquet corresponde ao shapefile atual.
+
+    A verificação é feita em duas etapas para que o caso comum seja rápido:
+    1. Se tamanho e mtime de todos os arquivos batem, o cache é válido
+    2. Se só os tamanhos batem (ex: arquivo copiado de novo), compara o hash
+       do conteúdo; se bater, atualiza a assinatura salva e reaproveita o cache
+
+    Args:
+        shapefile_path (str): Caminho para o arquivo .shp
+        cache_dir (str): Diretório do cache
+        modo_area (str): Modo de cálculo da área guardada no cache
+
+    Returns:
+        bool: True se o cache pode ser usado
+    """
+    parquet_path, assinatura_path = _caminhos_cache(shapefile_path, cache_dir, modo_area)
+    if not (os.path.exists(parquet_path) and os.path.exists(assinatura_path)):
+        return False
+
+    try:
+        with open(assinatura_path, encoding="utf-8") as f:
+            salva = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    atual = assinatura_shapefile(shapefile_path, calcular_hash=False, modo_area=modo_area)
+    if any(salva.get(k) != atual[k] for k in ("versao", "crs_area", "modo_area")):
+        return False
+
+    # Caso rápido: nada mudou desde a última execução
+    if salva.get("arquivos") == atual["arquivos"]:
+        return True
+
+    # Se algum tamanho mudou, o conteúdo certamente mudou
+    tamanhos_salvos = {k: v["tamanho"] for k, v in salva.get("arquivos", {}).items()}
+    tamanhos_atuais = {k: v["tamanho"] for k, v in atual["arquivos"].items()}
+    if tamanhos_salvos != tamanhos_atuais:
+        return False
+
+    # Mesmo tamanho, mtime diferente: confere o conteúdo pelo hash
+    atual["sha256"] = _hash_arquivos(_arquivos_shapefile(shapefile_path))
+    if atual["sha256"] != salva.get("sha256"):
+        return False
+
+    _salvar_assinatura(assinatura_path, atual)
+    return True
+
+
+def _salvar_assinatura(assinatura_path: str, assinatura: dict):
+    """Grava a assinatura em disco de forma atômica."""
+    tmp_path = assinatura_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(assinatura, f, indent=2)
+    os.replace(tmp_path, assinatura_path)
+
+
+def _q_autalica(lat_rad, e: float):
+    """
+    Calcula a função q(φ) da latitude autálica do elipsoide.
+
+    Na projeção cilíndrica equivalente de Lambert sobre o elipsoide,
+    y = a·q(φ)/2 e x = a·λ preservam áreas: a área plana nessas coordenadas
+    é a área sobre o elipsoide.
+
+    Args:
+        lat_rad (ndarray): Latitudes em radianos
+        e (float): Excentricidade do elipsoide
+
+    Returns:
+        ndarray: q(φ) para cada latitude
+    """
+    sen = np.sin(lat_rad)
+    es = e * sen
+    return (1 - e * e) * (sen / (1 - es * es) - np.log((1 - es) / (1 + es)) / (2 * e))
+
+
+def _parametros_elipsoide(crs):
+    """
+    Obtém o semieixo maior e a excentricidade do elipsoide de um CRS geográfico.
+
+    Returns:
+        tuple: (semieixo maior em metros, excentricidade)
+    """
+    elipsoide = crs.ellipsoid
+    f = 1 / elipsoide.inverse_flattening
+    return elipsoide.semi_major_metre, np.sqrt(f * (2 - f))
+
+
+def area_elipsoidal_ha(geometrias, a: float, e: float):
+    """
+    Mede a área de polígonos em lat/lon diretamente sobre o elipsoide, em hectares.
+
+    Trabalha sobre arrays planos de coordenadas, sem laços em Python:
+    1. Separa multipolígonos em polígonos e polígonos em anéis
+    2. Converte (lon, lat) em (λ, q(φ)), coordenadas equivalentes em área
+    3. Aplica a fórmula do trapézio (shoelace) em cada anel
+    4. Soma exteriores, subtrai buracos e agrega por feição
+
+    Lados sobre meridianos e paralelos (como os dos polígonos do SIGMINE,
+    definidos por rumos verdadeiros) são medidos exatamente, sem a distorção
+    de área da projeção policônica longe do meridiano central.
+
+    Args:
+        geometrias (array): Geometrias (Polygon/MultiPolygon) em graus
+        a (float): Semieixo maior do elipsoide, em metros
+        e (float): Excentricidade do elipsoide
+
+    Returns:
+        ndarray: Área em hectares (NaN para geometrias ausentes)
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    poligonos, idx_feicao = shapely.get_parts(geometrias, return_index=True)
+    aneis, idx_poligono = shapely.get_rings(poligonos, return_index=True)
+    coords, idx_anel = shapely.get_coordinates(aneis, return_index=True)
+
+    lam = np.radians(coords[:, 0])
+    q = _q_autalica(np.radians(coords[:, 1]), e)
+
+    # Termo do trapézio para cada lado (par de vértices consecutivos do mesmo anel)
+    mesmo_anel = idx_anel[1:] == idx_anel[:-1]
+    termos = (lam[1:] - lam[:-1]) * (q[1:] + q[:-1])
+    soma_anel = np.bincount(idx_anel[:-1][mesmo_anel], weights=termos[mesmo_anel],
+                            minlength=len(aneis))
+    area_anel = np.abs(soma_anel) * a * a / 4
+
+    # O primeiro anel de cada polígono é o exterior; os demais são buracos
+    exterior = np.r_[True, idx_poligono[1:] != idx_poligono[:-1]] if len(aneis) else np.array([], bool)
+    area_poligono = np.bincount(idx_poligono, weights=np.where(exterior, area_anel, -area_anel),
+                                minlength=len(poligonos))
+    area_feicao = np.bincount(idx_feicao, weights=area_poligono, minlength=len(geometrias))
+
+    area_feicao[shapely.is_missing(geometrias)] = np.nan
+    return area_feicao / 10_000
+
+
+def _area_ha_lote(geometrias: gpd.GeoSeries, modo: str = "projetada"):
+    """
+    Mede a área em hectares de um lote de geometrias no modo escolhido.
+
+    Fica no nível do módulo para poder ser enviada a outros processos.
+
+    Returns:
+        ndarray: Área em hectares de cada geometria do lote
+    """
+    if modo == "elipsoidal":
+        if not geometrias.crs.is_geographic:
+            geometrias = geometrias.to_crs(4674)  # SIRGAS 2000 geográfico
+        a, e = _parametros_elipsoide(geometrias.crs)
+        return area_elipsoidal_ha(geometrias.values, a, e)
+
+    # GeoPandas calcula área em m² para projeções métricas
+    # Dividimos por 10.000 para converter m² em hectares
+    return (geometrias.to_crs(CRS_AREA).area / 10_000).to_numpy()
+
+
+def calcular_area_ha(gdf: gpd.GeoDataFrame, workers: int = 1,
+                     tamanho_lote: int = TAMANHO_LOTE_AREA, modo: str = "projetada"):
+    """
+    Calcula a área de cada feição em hectares.
+
+    No modo "projetada", reprojeta para SIRGAS 2000 / Brazil Polyconic
+    (EPSG:5880), pois sistemas de coordenadas geográficas (lat/lon) não
+    permitem cálculos de área planos precisos. No modo "elipsoidal", mede
+    a área direto sobre o elipsoide, sem reprojetar (ver area_elipsoidal_ha).
+
+    Com workers > 1, as feições são divididas em lotes que são medidos
+    em paralelo, em processos separados. Os resultados são remontados
+    na ordem original e são idênticos aos do cálculo serial, pois cada
+    geometria passa exatamente pela mesma conta.
+
+    Args:
+        gdf (GeoDataFrame): Feições em qualquer CRS
+        workers (int): Quantidade de processos (1 = cálculo serial)
+        tamanho_lote (int): Quantidade de feições por tarefa
+        modo (str): "projetada" ou "elipsoidal"
+
+    Returns:
+        Series: Área em hectares, com o mesmo índice do GeoDataFrame
+    """
+    if modo not in MODOS_AREA:
+        raise ValueError(f"Modo de área inválido: {modo!r}. Use um de {MODOS_AREA}")
+
+    geometrias = gdf.geometry
+    medir = partial(_area_ha_lote, modo=modo)
+    lotes = [geometrias.iloc[i:i + tamanho_lote]
+             for i in range(0, len(geometrias), tamanho_lote)]
+
+    if workers <= 1 or len(lotes) <= 1:
+        # Mesmo no modo serial, medir por lotes limita o pico de memória
+        areas = [medir(lote) for lote in lotes]
+    else:
+        # executor.map devolve os resultados na mesma ordem dos lotes
+        with ProcessPoolExecutor(max_workers=min(workers, len(lotes))) as executor:
+            areas = list(executor.map(medir, lotes))
+    return pd.Series(np.concatenate(areas) if areas else np.array([], dtype=float),
+                     index=gdf.index)
+
+
+def limite_superior_area_ha(gdf: gpd.GeoDataFrame, lote: int = 50_000,
+                            modo: str = "projetada"):
+    """
+    Calcula um limite superior barato para a área de cada feição, em hectares.
+
+    Em vez de reprojetar todos os vértices de cada polígono, reprojeta apenas
+    alguns pontos do retângulo envolvente (bbox) em lat/lon. Como o polígono
+    está contido nesse retângulo, a área do bbox do retângulo reprojetado
+    (com uma pequena folga) nunca é menor que a área exata em EPSG:5880.
+    No modo "elipsoidal", o limite é a área do próprio retângulo em lat/lon
+    sobre o elipsoide, que tem fórmula fechada.
+
+    A coluna AREA_HA do próprio shapefile NÃO serve para isso: é a área
+    declarada no SIGMINE e pode ser menor que a área calculada.
+
+    Args:
+        gdf (GeoDataFrame): Feições em CRS geográfico
+        lote (int): Quantidade de feições reprojetadas por vez (limita a memória)
+        modo (str): "projetada" ou "elipsoidal", como em calcular_area_ha
+
+    Returns:
+        ndarray: Limite superior da área de cada feição, na ordem do GeoDataFrame
+    """
+    if modo == "elipsoidal":
+        a, e = _parametros_elipsoide(gdf.crs)
+        minx, miny, maxx, maxy = gdf.geometry.bounds.to_numpy().T
+        # Área do retângulo: a²/2 · Δλ · Δq, com folga mínima para arredondamentos
+        limites = (a * a / 2 * np.radians(maxx - minx)
+                   * (_q_autalica(np.radians(maxy), e) - _q_autalica(np.radians(miny), e))
+                   * (1 + 1e-9) / 10_000)
+        return np.nan_to_num(limites, nan=0.0)
+
+    transformer = Transformer.from_crs(gdf.crs, CRS_AREA, always_xy=True)
+    bounds = gdf.geometry.bounds.to_numpy()
+    t = np.linspace(0.0, 1.0, DENSIFICACAO_BBOX)
+    limites = np.empty(len(bounds))
+
+    for inicio in range(0, len(bounds), lote):
+        minx, miny, maxx, maxy = bounds[inicio:inicio + lote].T[:, :, None]
+        # Pontos nos quatro lados do retângulo: (feições x pontos)
+        xs = np.concatenate([minx + t * (maxx - minx), minx + t * (maxx - minx),
+                             np.broadcast_to(minx, (len(minx), len(t))),
+                             np.broadcast_to(maxx, (len(maxx), len(t)))], axis=1)
+        ys = np.concatenate([np.broadcast_to(miny, (len(miny), len(t))),
+                             np.broadcast_to(maxy, (len(maxy), len(t))),
+                             miny + t * (maxy - miny), miny + t * (maxy - miny)], axis=1)
+        px, py = transformer.transform(xs.ravel(), ys.ravel())
+        px = px.reshape(xs.shape)
+        py = py.reshape(ys.shape)
+        largura = (px.max(axis=1) - px.min(axis=1)) * (1 + MARGEM_BBOX)
+        altura = (py.max(axis=1) - py.min(axis=1)) * (1 + MARGEM_BBOX)
+        limites[inicio:inicio + lote] = largura * altura / 10_000
+
+    # Geometrias vazias ou nulas têm bbox NaN e área zero
+    return np.nan_to_num(limites, nan=0.0)
+
+
+def selecionar_top_n(gdf: gpd.GeoDataFrame, n: int, coluna_area: str = "area_ha_calculada",
+                     lote: int = 1_000, workers: int = 1,
+                     modo_area: str = "projetada") -> gpd.GeoDataFrame:
+    """
+    Seleciona as N maiores feições por área calculando a área exata só do necessário.
+
+    Se a coluna de área já existe (ex: veio do cache), equivale a nlargest.
+    Caso contrário:
+    1. Ordena as feições por um limite superior barato (bbox reprojetado)
+    2. Calcula a área exata (no modo escolhido) dos candidatos, em lotes, na ordem
+       do limite superior
+    3. Para assim que o próximo candidato não tem como superar a N-ésima
+       maior área exata já encontrada
+
+    O resultado é idêntico a calcular a área de todas as feições e aplicar
+    nlargest(n), inclusive no desempate (mantém a ordem original).
+
+    Args:
+        gdf (GeoDataFrame): Feições em CRS geográfico
+        n (int): Quantidade de feições a selecionar (None = todas, ordenadas por área)
+        coluna_area (str): Nome da coluna de área em hectares
+        lote (int): Quantidade mínima de candidatos medidos por rodada
+        workers (int): Processos usados no cálculo da área exata
+        modo_area (str): "projetada" ou "elipsoidal"
+
+    Returns:
+        GeoDataFrame: As N maiores feições, com a coluna de área preenchida
+    """
+    if n is None:
+        # Todas as feições: não há o que pré-selecionar, mede todas
+        if coluna_area not in gdf.columns:
+            gdf = gdf.assign(**{coluna_area: calcular_area_ha(gdf, workers, modo=modo_area)})
+        return gdf.sort_values(coluna_area, ascending=False, kind="stable").copy()
+    if coluna_area in gdf.columns:
+        return gdf.nlargest(n, coluna_area).copy()
+    if n <= 0 or gdf.empty:
+        return gdf.iloc[:0].assign(**{coluna_area: np.array([], dtype=float)})
+
+    limites = limite_superior_area_ha(gdf, modo=modo_area)
+    # Ordem decrescente do limite; 'stable' mantém a ordem original nos empates
+    ordem = np.argsort(-limites, kind="stable")
+
+    areas = np.full(len(gdf), np.nan)
+    medidos = 0
+    while medidos < len(ordem):
+        # Mede um lote de candidatos com o maior limite superior ainda não medidos
+        tamanho = max(lote, 2 * n)
+        posicoes = ordem[medidos:medidos + tamanho]
+        areas[posicoes] = calcular_area_ha(gdf.iloc[posicoes], workers,
+                                           modo=modo_area).to_numpy()
+        medidos += len(posicoes)
+
+        # N-ésima maior área exata já conhecida
+        conhecidas = areas[ordem[:medidos]]
+        if medidos < n:
+            continue
+        corte = np.partition(conhecidas, medidos - n)[medidos - n]
+
+        # Se nenhum candidato restante pode alcançar o corte, terminamos
+        if medidos >= len(ordem) or limites[ordem[medidos]] < corte:
+            break
+
+    # Aplica nlargest só nas feições medidas, preservando a ordem original
+    medidas = np.sort(ordem[:medidos])
+    candidatos = gdf.iloc[medidas].copy()
+    candidatos[coluna_area] = areas[medidas]
+    return candidatos.nlargest(n, coluna_area)
+
+
+def construir_cache(shapefile_path: str, cache_dir: str = CACHE_DIR,
+                    workers: int = 1, modo_area: str = "projetada") -> gpd.GeoDataFrame:
+    """
+    Lê o shapefile, calcula as áreas e grava o resultado como GeoParquet.
+
+    O GeoParquet é um formato colunar e binário: ler esse arquivo é muito
+    mais rápido que interpretar o .dbf e reprojetar todas as geometrias.
+    As geometrias são mantidas no CRS original (SIRGAS 2000), as inválidas
+    já vão reparadas (ver reparar_geometrias) e a coluna 'area_ha_calculada'
+    já vai calculada.
+
+    Args:
+        shapefile_path (str): Caminho para o arquivo .shp
+        cache_dir (str): Diretório do cache
+        workers (int): Processos usados no cálculo das áreas
+        modo_area (str): "projetada" ou "elipsoidal"
+
+    Returns:
+        GeoDataFrame: Dados do shapefile com 'chave_processo', 'geometria_reparada'
+            e 'area_ha_calculada'
+    """
+    parquet_path, assinatura_path = _caminhos_cache(shapefile_path, cache_dir, modo_area)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # A assinatura é calculada ANTES da leitura: se o arquivo mudar durante
+    # a conversão, a próxima execução detecta a diferença e reconstrói
+    assinatura = assinatura_shapefile(shapefile_path, modo_area=modo_area)
+
+    sig = gpd.read_file(shapefile_path)
+    adicionar_chave(sig)
+    reparar_geometrias(sig)
+    sig["area_ha_calculada"] = calcular_area_ha(sig, workers, modo=modo_area)
+
+    # Grava em arquivo temporário e renomeia, para nunca deixar um cache
+    # pela metade caso o processo seja interrompido
+    tmp_path = parquet_path + ".tmp"
+    # write_covering_bbox grava o retângulo envolvente de cada feição,
+    # permitindo filtrar por bbox na leitura sem decodificar as geometrias
+    sig.to_parquet(tmp_path, index=False, write_covering_bbox=True)
+    os.replace(tmp_path, parquet_path)
+    _salvar_assinatura(assinatura_path, assinatura)
+
+    logger.info(f"Cache GeoParquet gravado em {parquet_path}")
+    return sig
+
+
+def adicionar_chave(sig: gpd.GeoDataFrame):
+    """
+    Acrescenta a coluna 'chave_processo' (int64) ao GeoDataFrame, no próprio objeto.
+
+    Usa as colunas numéricas NUMERO e ANO quando foram lidas; senão,
+    interpreta o texto da coluna PROCESSO. Processos sem número/ano
+    válidos recebem CHAVE_INVALIDA, com um aviso.
+    """
+    if all(c in sig.columns for c in COLUNAS_NUMERO_ANO):
+        validos = sig["NUMERO"].notna() & sig["ANO"].notna()
+        chaves = np.full(len(sig), CHAVE_INVALIDA, dtype=np.int64)
+        chaves[validos.to_numpy()] = chave_de_numero_ano(sig.loc[validos, "NUMERO"],
+                                                         sig.loc[validos, "ANO"])
+    elif "PROCESSO" in sig.columns:
+        chaves = chave_processo(sig["PROCESSO"])
+    else:
+        return
+    invalidas = int((chaves == CHAVE_INVALIDA).sum())
+    if invalidas:
+        logger.warning(f"{invalidas} processos sem número/ano válidos (chave_processo = {CHAVE_INVALIDA})")
+    sig[COLUNA_CHAVE] = chaves
+
+
+def _partes_poligonais(geometrias: np.ndarray) -> np.ndarray:
+    """
+    Mantém só os polígonos de cada geometria, como MultiPolygon.
+
+    O make_valid pode devolver coleções com linhas e pontos (partes do
+    polígono que colapsaram), que não têm área e atrapalham as operações
+    seguintes. Feita com arrays do shapely, sem laço por geometria.
+
+    Returns:
+        ndarray: Um MultiPolygon por geometria (vazio se não sobrar polígono)
+    """
+    # Duas passadas: a primeira abre coleções, a segunda os multipolígonos delas
+    partes, origem = shapely.get_parts(geometrias, return_index=True)
+    partes, interno = shapely.get_parts(partes, return_index=True)
+    origem = origem[interno]
+    poligonos = shapely.get_type_id(partes) == 3  # Polygon
+    resultado = np.array([shapely.MultiPolygon()] * len(geometrias), dtype=object)
+    return shapely.multipolygons(partes[poligonos], indices=origem[poligonos], out=resultado)
+
+
+def reparar_geometrias(sig: gpd.GeoDataFrame) -> list:
+    """
+    Repara as geometrias inválidas do GeoDataFrame, no próprio objeto.
+
+    Polígonos inválidos (ex: autointerseção em "gravata borboleta") têm área
+    errada, às vezes zero. A validade é verificada de uma vez para todas as
+    feições (shapely.is_valid, vetorizado) e só as inválidas, em geral uma
+    pequena fração, passam por make_valid. Do resultado ficam só as partes
+    poligonais (ver _partes_poligonais).
+
+    Acrescenta a coluna 'geometria_reparada' (True nas feições reparadas).
+
+    Returns:
+        list: Números dos processos reparados (coluna PROCESSO, ou a chave)
+    """
+    geometrias = sig.geometry.to_numpy()
+    # Geometrias ausentes não são "inválidas": não há o que reparar
+    invalidas = ~shapely.is_valid(geometrias) & ~shapely.is_missing(geometrias)
+    sig[COLUNA_REPARADA] = invalidas
+    if not invalidas.any():
+        return []
+
+    sig.loc[invalidas, sig.geometry.name] = _partes_poligonais(
+        shapely.make_valid(geometrias[invalidas]))
+    coluna_id = "PROCESSO" if "PROCESSO" in sig.columns else COLUNA_CHAVE
+    reparados = sig.loc[invalidas, coluna_id].tolist() if coluna_id in sig.columns else []
+    exemplos = ", ".join(str(p) for p in reparados[:10]) + (", ..." if len(reparados) > 10 else "")
+    logger.warning(f"{int(invalidas.sum())} geometrias inválidas reparadas: {exemplos}")
+    return reparados
+
+
+def _normalizar_filtros(uf=None, fase=None, substancia=None, processo=None,
+                        titular=None) -> dict:
+    """
+    Converte os filtros de atributos em listas de valores por coluna.
+
+    Aceita um valor único ("PA") ou uma lista (["PA", "AM"]). Os valores
+    são convertidos para maiúsculas, como aparecem no SIGMINE. Números de
+    processo são convertidos para a chave canônica, em qualquer formato.
+
+    Returns:
+        dict: {coluna do shapefile: [valores aceitos]} apenas dos filtros usados
+    """
+    filtros = {}
+    for nome, valor in (("uf", uf), ("fase", fase), ("substancia", substancia),
+                        ("processo", processo), ("titular", titular)):
+        if valor is None:
+            continue
+        valores = [valor] if isinstance(valor, str) else list(valor)
+        if nome == "processo":
+            chaves = chave_processo(valores)
+            for texto in np.asarray(valores, dtype=object)[chaves == CHAVE_INVALIDA]:
+                logger.warning(f"Filtro de processo ignorado: {texto!r} não é um número de processo")
+            filtros[COLUNA_CHAVE] = [int(c) for c in chaves if c != CHAVE_INVALIDA]
+        else:
+            filtros[COLUNAS_FILTRO[nome]] = [str(v).strip().upper() for v in valores]
+    return filtros
+
+
+def _colunas_leitura(colunas, filtros: dict):
+    """
+    Define as colunas lidas do arquivo: as pedidas mais as usadas nos filtros.
+
+    Returns:
+        list ou None: None significa "todas as colunas"
+    """
+    if colunas is None:
+        return None
+    # A chave é calculada a partir de NUMERO e ANO, que não estão no .dbf como 'chave_processo'
+    extras = [c for c in list(filtros) + list(COLUNAS_NUMERO_ANO)
+              if c not in colunas and c != COLUNA_CHAVE]
+    return list(colunas) + list(dict.fromkeys(extras))
+
+
+def _clausula_where(filtros: dict):
+    """
+    Monta a cláusula SQL (dialeto OGR) equivalente aos filtros de atributos.
+
+    Ex: {"UF": ["PA", "AM"]} -> "UF IN ('PA', 'AM')"
+    O filtro pela chave do processo é calculado pelo GDAL a partir das
+    colunas numéricas NUMERO e ANO, sem comparar textos.
+
+    Returns:
+        str ou None: Cláusula WHERE, ou None se não houver filtros
+    """
+    if not filtros:
+        return None
+    partes = []
+    for coluna, valores in filtros.items():
+        if coluna == COLUNA_CHAVE:
+            lista = ", ".join(str(int(v)) for v in valores) or "NULL"
+            partes.append(f'("NUMERO" * {FATOR_ANO} + "ANO") IN ({lista})')
+            continue
+        # Aspas simples são escapadas duplicando-as, como no SQL padrão
+        lista = ", ".join("'" + v.replace("'", "''") + "'" for v in valores)
+        partes.append(f'"{coluna}" IN ({lista})')
+    return " AND ".join(partes)
+
+
+def ler_shapefile(shapefile_path: str, colunas=None, uf=None, fase=None,
+                  substancia=None, bbox=None, processo=None,
+                  titular=None) -> gpd.GeoDataFrame:
+    """
+    Lê o shapefile aplicando seleção de colunas e filtros durante a leitura.
+
+    Usa o caminho Arrow do pyogrio: só as colunas pedidas são lidas do .dbf
+    e os filtros de atributos (cláusula WHERE) e de bbox são aplicados pelo
+    GDAL antes de os dados chegarem ao pandas. Assim uma análise de uma só
+    UF não precisa carregar o país inteiro na memória.
+
+    Args:
+        shapefile_path (str): Caminho para o arquivo .shp
+        colunas (list): Colunas de atributos a ler (None = todas)
+        uf (str ou list): Filtra por UF (ex: "PA" ou ["PA", "AM"])
+        fase (str ou list): Filtra por FASE do processo
+        substancia (str ou list): Filtra pela substância (coluna SUBS)
+        bbox (tuple): (minx, miny, maxx, maxy) no CRS do shapefile
+        processo (str ou list): Filtra por número do processo
+        titular (str ou list): Filtra pelo nome do titular (coluna NOME)
+
+    Returns:
+        GeoDataFrame: Feições que atendem aos filtros, no CRS original, com
+            'chave_processo' e as geometrias inválidas já reparadas
+    """
+    filtros = _normalizar_filtros(uf, fase, substancia, processo, titular)
+    sig = gpd.read_file(
+        shapefile_path,
+        engine="pyogrio",
+        columns=_colunas_leitura(colunas, filtros),
+        where=_clausula_where(filtros),
+        bbox=bbox,
+        use_arrow=True,  # Lê direto para tabelas Arrow, sem colunas 'object' intermediárias
+    )
+    adicionar_chave(sig)
+    reparar_geometrias(sig)
+    return sig
+
+
+def _colunas_cache(colunas):
+    """Colunas pedidas mais as que sempre acompanham uma leitura do cache."""
+    if colunas is None:
+        return None
+    # A chave, a geometria (e se foi reparada) e a área calculada sempre
+    # acompanham as colunas pedidas
+    return list(dict.fromkeys(list(colunas) + [COLUNA_CHAVE, COLUNA_REPARADA,
+                                               "area_ha_calculada", "geometry"]))
+
+
+def _ler_cache(parquet_path: str, colunas=None, filtros=None, bbox=None) -> gpd.GeoDataFrame:
+    """
+    Lê o GeoParquet do cache aplicando seleção de colunas e filtros.
+
+    Returns:
+        GeoDataFrame: Feições do cache que atendem aos filtros
+    """
+    colunas = _colunas_cache(colunas)
+    filtros_parquet = [(c, "in", v) for c, v in (filtros or {}).items()] or None
+    return gpd.read_parquet(parquet_path, columns=colunas, filters=filtros_parquet, bbox=bbox)
+
+
+def carregar_sigmine(shapefile_path: str, cache_dir: str = CACHE_DIR,
+                     usar_cache: bool = True, colunas=None, uf=None, fase=None,
+                     substancia=None, bbox=None, calcular_area: bool = True,
+                     workers: int = 1, modo_area: str = "projetada",
+                     processo=None, titular=None) -> gpd.GeoDataFrame:
+    """
+    Carrega o SIGMINE com a coluna 'area_ha_calculada', usando cache quando possível.
+
+    Na primeira execução (ou quando o shapefile muda), converte o shapefile
+    para GeoParquet com as geometrias inválidas reparadas e as áreas
+    pré-calculadas. Nas execuções seguintes,
+    lê direto do GeoParquet, o que leva segundos em vez de minutos.
+
+    Colunas e filtros são aplicados durante a leitura, tanto no GeoParquet
+    quanto no shapefile. Sem cache válido, uma leitura só com seleção de
+    colunas monta o cache completo (todas as colunas) e devolve as colunas
+    pedidas. Uma leitura filtrada (atributos ou bbox) lê apenas o recorte
+    pedido do shapefile e NÃO reconstrói o cache (que exigiria ler o país
+    inteiro); o cache é montado na próxima leitura sem filtros.
+
+    Args:
+        shapefile_path (str): Caminho para o arquivo .shp
+        cache_dir (str): Diretório do cache
+        usar_cache (bool): Se False, ignora o cache e lê o shapefile diretamente
+        colunas (list): Colunas de atributos a ler (None = todas)
+        uf (str ou list): Filtra por UF (ex: "PA" ou ["PA", "AM"])
+        fase (str ou list): Filtra por FASE do processo
+        substancia (str ou list): Filtra pela substância (coluna SUBS)
+        bbox (tuple): (minx, miny, maxx, maxy) no CRS do shapefile
+        calcular_area (bool): Se False, leituras sem cache não calculam a área
+            (útil quando só o top-N interessa; ver selecionar_top_n)
+        workers (int): Processos usados no cálculo das áreas
+        modo_area (str): "projetada" (EPSG:5880) ou "elipsoidal" (GRS80)
+        processo (str ou list): Filtra por número do processo
+        titular (str ou list): Filtra pelo nome do titular (coluna NOME)
+
+    Returns:
+        GeoDataFrame: Dados do shapefile (CRS original) com 'chave_processo',
+            'geometria_reparada' e 'area_ha_calculada'
+    """
+    filtros = _normalizar_filtros(uf, fase, substancia, processo, titular)
+    leitura_filtrada = bool(filtros) or bbox is not None
+
+    if usar_cache and cache_valido(shapefile_path, cache_dir, modo_area):
+        parquet_path, _ = _caminhos_cache(shapefile_path, cache_dir, modo_area)
+        logger.info(f"Usando cache GeoParquet: {parquet_path}")
+        return _ler_cache(parquet_path, colunas, filtros, bbox)
+
+    if usar_cache and not leitura_filtrada:
+        logger.info("Cache ausente ou desatualizado. Convertendo shapefile para GeoParquet...")
+        sig = construir_cache(shapefile_path, cache_dir, workers, modo_area)
+        colunas = _colunas_cache(colunas)
+        return sig if colunas is None else sig[[c for c in colunas if c in sig.columns]]
+
+    # Sem cache: lê só o recorte pedido e calcula a área apenas dele
+    sig = ler_shapefile(shapefile_path, colunas, uf, fase, substancia, bbox, processo, titular)
+    if calcular_area:
+        sig["area_ha_calculada"] = calcular_area_ha(sig, workers, modo=modo_area)
+    return sig
@@ -0,0 +1,278 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Medição do tempo e das chamadas às APIs em cada etapa da execução.
+
+Registra, no total e por processo analisado, o tempo de parede de cada
+etapa, as buscas (e os erros 429), as requisições de embeddings e os
+trechos enviados, as chamadas ao LLM com os tokens de entrada e saída, e
+os acertos de cada cache. No fim da execução, tudo vai para um manifesto
+JSON e, opcionalmente, para um arquivo de métricas do Prometheus (coletor
+"textfile" do node_exporter). Serve para ver onde o tempo é gasto e
+estimar a cota de API antes de execuções grandes.
+"""
+
+import os
+import json
+import time
+import cProfile
+import tracemalloc
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+# Caches com taxa de acerto calculada no manifesto: contadores
+# "{cache}_cache_acertos" e "{cache}_cache_faltas"
+CACHES = ("busca", "embeddings", "llm")
+
+# Caracteres por token na estimativa usada quando o modelo não informa o uso
+CARACTERES_POR_TOKEN = 4
+
+
+def _gravar_atomico(caminho: str, texto: str):
+    """Grava um arquivo de uma vez (temporário + rename), sem leitores vendo-o pela metade."""
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(temporario, caminho)
+
+
+class Instrumentacao:
+    """
+    Acumula tempos de etapas e contadores de chamadas, no total e por processo.
+
+    Segura entre threads. O processo ao qual as medições pertencem é o da
+    thread atual (ver processo()); threads auxiliares (ex: as buscas de um
+    processo, em paralelo) precisam receber o processo explicitamente.
+
+    Ex:
+        with instr.processo("803237/2022"):
+            with instr.etapa("busca"):
+                instr.contar("busca_chamadas")
+    """
+
+    def __init__(self):
+        self.inicio = time.time()
+        self._etapas = defaultdict(lambda: {"segundos": 0.0, "execucoes": 0})
+        self._contadores = Counter()
+        self._processos = defaultdict(lambda: {"etapas": defaultdict(float), "contadores": Counter()})
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def processo_atual(self):
+        """Processo ao qual a thread atual está associada (None = nenhum)."""
+        return getattr(self._local, "processo", None)
+
+    @contextmanager
+    def processo(self, nome):
+        """Associa as medições feitas nesta thread, durante o bloco, a um processo."""
+        anterior = self.processo_atual()
+        self._local.processo = nome
+        try:
+            yield
+        finally:
+            self._local.processo = anterior
+
+    @contextmanager
+    def etapa(self, nome: str):
+        """Mede o tempo de parede do bloco e soma à etapa `nome`."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            processo = self.processo_atual()
+            with self._lock:
+                self._etapas[nome]["segundos"] += segundos
+                self._etapas[nome]["execucoes"] += 1
+                if processo is not None:
+                    self._processos[processo]["etapas"][nome] += segundos
+
+    def contar(self, metrica: str, quantidade: int = 1, processo=None):
+        """
+        Soma `quantidade` a um contador (ex: "busca_chamadas").
+
+        Args:
+            metrica (str): Nome do contador
+            quantidade (int): Valor somado
+            processo: Processo da medição (padrão: o da thread atual)
+        """
+        processo = processo if processo is not None else self.processo_atual()
+        with self._lock:
+            self._contadores[metrica] += quantidade
+            if processo is not None:
+                self._processos[processo]["contadores"][metrica] += quantidade
+
+    def contadores(self) -> dict:
+        """Cópia dos contadores totais."""
+        with self._lock:
+            return dict(self._contadores)
+
+    def manifesto(self, **extras) -> dict:
+        """
+        Monta o manifesto da execução.
+
+        Args:
+            **extras: Dados acrescentados ao manifesto (ex: configuração usada)
+
+        Returns:
+            dict: Início, duração, etapas, contadores, taxas de acerto dos
+                caches e medições de cada processo
+        """
+        with self._lock:
+            contadores = dict(self._contadores)
+            etapas = {nome: {"segundos": round(e["segundos"], 3), "execucoes": e["execucoes"]}
+                      for nome, e in self._etapas.items()}
+            processos = {
+                str(nome): {"etapas": {e: round(s, 3) for e, s in p["etapas"].items()},
+                            "contadores": dict(p["contadores"])}
+                for nome, p in self._processos.items()
+            }
+        taxas = {}
+        for cache in CACHES:
+            acertos = contadores.get(f"{cache}_cache_acertos", 0)
+            total = acertos + contadores.get(f"{cache}_cache_faltas", 0)
+            if total:
+                taxas[cache] = round(acertos / total, 4)
+        return {
+            "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+            "duracao_segundos": round(time.time() - self.inicio, 3),
+            **extras,
+            "etapas": etapas,
+            "contadores": contadores,
+            "taxa_acerto_caches": taxas,
+            "processos": processos,
+        }
+
+    def gravar_manifesto(self, caminho: str, **extras) -> dict:
+        """Grava o manifesto em JSON e o retorna."""
+        manifesto = self.manifesto(**extras)
+        _gravar_atomico(caminho, json.dumps(manifesto, indent=2, ensure_ascii=False, default=str))
+        return manifesto
+
+    def gravar_prometheus(self, caminho: str, prefixo: str = "sigmine"):
+        """
+        Grava as métricas no formato texto do Prometheus (coletor "textfile").
+
+        Só os totais da execução: métricas por processo teriam uma série
+        por processo, demais para o Prometheus.
+        """
+        manifesto = self.manifesto()
+        linhas = [
+            f"# HELP {prefixo}_execucao_duracao_segundos Duração da última execução",
+            f"# TYPE {prefixo}_execucao_duracao_segundos gauge",
+            f"{prefixo}_execucao_duracao_segundos {manifesto['duracao_segundos']}",
+            f"# HELP {prefixo}_execucao_inicio_timestamp_segundos Início da última execução (Unix)",
+            f"# TYPE {prefixo}_execucao_inicio_timestamp_segundos gauge",
+            f"{prefixo}_execucao_inicio_timestamp_segundos {self.inicio:.0f}",
+            f"# HELP {prefixo}_etapa_segundos Tempo de parede somado de cada etapa",
+            f"# TYPE {prefixo}_etapa_segundos gauge",
+        ]
+        linhas += [f'{prefixo}_etapa_segundos{{etapa="{nome}"}} {e["segundos"]}'
+                   for nome, e in sorted(manifesto["etapas"].items())]
+        for metrica, valor in sorted(manifesto["contadores"].items()):
+            linhas += [f"# TYPE {prefixo}_{metrica} gauge", f"{prefixo}_{metrica} {valor}"]
+        linhas += [f"# HELP {prefixo}_cache_taxa_acerto Fração das consultas atendidas pelo cache",
+                   f"# TYPE {prefixo}_cache_taxa_acerto gauge"]
+        linhas += [f'{prefixo}_cache_taxa_acerto{{cache="{cache}"}} {taxa}'
+                   for cache, taxa in sorted(manifesto["taxa_acerto_caches"].items())]
+        _gravar_atomico(caminho, "\n".join(linhas) + "\n")
+
+
+def contador_tokens_llm(instrumentacao: "Instrumentacao", processo=None):
+    """
+    Cria o callback do LangChain que conta as chamadas ao LLM e os tokens usados.
+
+    Usa o uso informado pelo modelo (usage_metadata, no Gemini). Se o
+    modelo não informar, estima ~4 caracteres por token e conta a chamada
+    em "llm_chamadas_tokens_estimados".
+
+    Args:
+        instrumentacao (Instrumentacao): Onde os contadores são somados
+        processo: Processo ao qual as chamadas pertencem
+
+    Returns:
+        BaseCallbackHandler: Para passar em config={"callbacks": [...]}
+    """
+    return _classe_contador_tokens()(instrumentacao, processo)
+
+
+@lru_cache(maxsize=None)
+def _classe_contador_tokens():
+    """Define a classe do callback, importando o LangChain só quando usada."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class ContadorTokensLLM(BaseCallbackHandler):
+        def __init__(self, instrumentacao: Instrumentacao, processo=None):
+            self.instrumentacao = instrumentacao
+            self.processo = processo
+            self._caracteres_entrada = 0
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self._caracteres_entrada = sum(len(str(m.content)) for lista in messages for m in lista)
+
+        def on_llm_start(self, serialized, prompts, **kwargs):
+            self._caracteres_entrada = sum(len(p) for p in prompts)
+
+        def on_llm_end(self, response, **kwargs):
+            contar = self.instrumentacao.contar
+            contar("llm_chamadas", processo=self.processo)
+            for geracoes in response.generations:
+                for geracao in geracoes:
+                    uso = getattr(getattr(geracao, "message", None), "usage_metadata", None)
+                    if uso:
+                        contar("llm_tokens_entrada", uso.get("input_tokens", 0), processo=self.processo)
+                        contar("llm_tokens_saida", uso.get("output_tokens", 0), processo=self.processo)
+                    else:
+                        contar("llm_chamadas_tokens_estimados", processo=self.processo)
+                        contar("llm_tokens_entrada", self._caracteres_entrada // CARACTERES_POR_TOKEN,
+                               processo=self.processo)
+                        contar("llm_tokens_saida", len(geracao.text) // CARACTERES_POR_TOKEN,
+                               processo=self.processo)
+
+    return ContadorTokensLLM
+
+
+@contextmanager
+def perfilar(caminho_cpu: str = None, memoria: bool = False, resultado: dict = None):
+    """
+    Liga, durante o bloco, o cProfile e/ou o tracemalloc (opcionais, têm custo).
+
+    O cProfile mede só a thread que entrou no bloco (a principal); o tempo
+    das análises em paralelo aparece como espera. O tracemalloc acompanha
+    as alocações de todas as threads.
+
+    Args:
+        caminho_cpu (str): Arquivo .prof do cProfile (None = não perfila a CPU).
+            Para ver: python -m pstats <arquivo>, ou snakeviz
+        memoria (bool): Se True, liga o tracemalloc
+        resultado (dict): Recebe 'memoria' (pico e maiores alocações) e
+            'perfil_cpu' (caminho do .prof), para ir ao manifesto
+    """
+    resultado = resultado if resultado is not None else {}
+    perfil = cProfile.Profile() if caminho_cpu else None
+    if memoria:
+        tracemalloc.start()
+    if perfil is not None:
+        perfil.enable()
+    try:
+        yield resultado
+    finally:
+        if perfil is not None:
+            perfil.disable()
+            os.makedirs(os.path.dirname(caminho_cpu) or ".", exist_ok=True)
+            perfil.dump_stats(caminho_cpu)
+            resultado["perfil_cpu"] = caminho_cpu
+        if memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            maiores = tracemalloc.take_snapshot().statistics("lineno")[:20]
+            tracemalloc.stop()
+            resultado["memoria"] = {
+                "pico_mb": round(pico / 1024 / 1024, 1),
+                "maiores_alocacoes": [{"local": str(s.traceback), "mb": round(s.size / 1024 / 1024, 2),
+                                       "blocos": s.count} for s in maiores],
+            }
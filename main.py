@@ -8,34 +8,60 @@ import os
 # garante compatibilidade entre todas as bibliotecas
 os.environ["PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION"] = "python"
 
-import time  # Para adicionar delays entre requisições e evitar rate limiting
 import pandas as pd  # Para manipulação de dados tabulares e criação de DataFrames
 import geopandas as gpd  # Extensão do pandas para dados geoespaciais (shapefiles)
 from dotenv import load_dotenv  # Para carregar variáveis de ambiente do arquivo .env
 from tqdm import tqdm  # Para criar barras de progresso visuais durante processamento
 import logging  # Para registrar logs estruturados do sistema
 from datetime import datetime  # Para trabalhar com datas e timestamps
-import random  # Para gerar delays aleatórios entre requisições
+from collections import Counter  # Para contar os processos que pedem cada busca
+import threading  # Para proteger estruturas compartilhadas entre threads
+import argparse  # Para a linha de comando (rank, analyze, report)
+import hashlib  # Para identificar as credenciais na verificação da busca
+from concurrent.futures import ThreadPoolExecutor, as_completed  # Para executar buscas e análises em paralelo
 
-# === IMPORTAÇÕES DO LANGCHAIN ===
-# LangChain é um framework para construir aplicações com LLMs (Large Language Models)
+# Limite de taxa (token bucket), retentativas com backoff e controle de
+# concorrência do pipeline de análise
+from concorrencia import (TokenBucket, ExecucaoUnica, LimitesPorEtapa,
+                          executar_com_retentativa, eh_rate_limit)
+
+# Cache em disco (SQLite) para os resultados das buscas na web
+from cache_persistente import CacheSQLite, normalizar_query
+
+# Registro das análises concluídas, para retomar execuções interrompidas
+from checkpoint import CheckpointJSONL
+
+# Gravação do relatório e dos CSVs à medida que as análises terminam
+from saida_incremental import EmissorOrdenado, CSVIncremental, MarkdownIncremental
+
+# Leitura do shapefile com cache GeoParquet e cálculo de áreas
+from geo_sigmine import carregar_sigmine, selecionar_top_n
+
+# Sobreposição dos processos com Terras Indígenas e Unidades de Conservação
+from sobreposicao import adicionar_sobreposicoes
 
-# Vectorstore para armazenar e buscar embeddings de documentos
-from langchain_community.vectorstores import Chroma
+# Microdados do SCM (pessoas, municípios e substâncias de cada processo)
+from scm import carregar_scm, resumo_scm
 
-# Ferramentas de busca na web
-from langchain_google_community import GoogleSearchAPIWrapper  # Busca via Google Custom Search
-from langchain_community.tools import DuckDuckGoSearchResults  # Busca via DuckDuckGo (fallback)
+# Agregação dos titulares de todos os processos (variantes do nome e CNPJ)
+from titulares import COLUNA_GRUPO, agregar_titulares, selecionar_titulares_perfil
 
-# Integração com Google Gemini (modelo de IA)
-from langchain_google_genai import ChatGoogleGenerativeAI  # Modelo de chat do Gemini
-from langchain_google_genai import GoogleGenerativeAIEmbeddings  # Modelo de embeddings
+# Chave numérica canônica dos processos (número × 10.000 + ano)
+from chaves import CHAVE_INVALIDA, chave_processo
 
-# Utilitários para processamento de texto
-from langchain.text_splitter import RecursiveCharacterTextSplitter  # Divide textos longos em chunks
-from langchain.chains import RetrievalQA  # Chain para Question-Answering com recuperação
-from langchain.prompts import PromptTemplate  # Template para prompts estruturados
-from langchain.schema import Document  # Estrutura de dados para documentos
+# Busca de palavras-chave sem diferenciar acentos
+from palavras_chave import BuscadorPalavras
+
+# Tempo de cada etapa, chamadas às APIs, tokens e acertos dos caches
+from instrumentacao import Instrumentacao, contador_tokens_llm, perfilar
+
+# === IMPORTAÇÕES DO LANGCHAIN ===
+# LangChain é um framework para construir aplicações com LLMs (Large Language Models)
+# O LangChain, o Chroma e os clientes do Google levam alguns segundos para
+# carregar e só são usados na análise com IA. Por isso são importados dentro
+# das funções que os usam (setup_search_tool, configurar_backends,
+# rag_summary_enhanced...): "python main.py rank" (só a parte geoespacial)
+# e "python main.py report" não pagam por eles
 
 # Carrega as variáveis de ambiente do arquivo .env
 # Isso inclui API keys do Google, credenciais, etc.
@@ -63,26 +89,318 @@ Processos minerários ativos - Brasil
 # Diretório onde serão salvos os resultados
 OUTPUT_DIR = "output"
 
+# Diretório do cache GeoParquet do shapefile (com as áreas já calculadas)
+# O cache é reconstruído automaticamente quando o shapefile muda
+CACHE_DIR = "data/cache"
+
+# Se False, ignora o cache e sempre lê/reprojeta o shapefile completo
+# (vale também para o cache Parquet dos microdados do SCM)
+USAR_CACHE = True
+
+# Diretório com os microdados do SCM (Pessoa.txt, ProcessoPessoa.txt,
+# ProcessoMunicipio.txt, ProcessoSubstancia.txt e Substancia.txt)
+# Se os arquivos não existirem, a análise segue só com o shapefile
+SCM_DIR = "data/microdados-scm"
+
+# Quantidade de processos (núcleos) usados na reprojeção e no cálculo de áreas
+# 1 = cálculo serial; o resultado é o mesmo com qualquer valor
+WORKERS_GEO = os.cpu_count() or 1
+
+# Como a área dos processos é calculada:
+# - "projetada": reprojeta para SIRGAS 2000 / Brazil Polyconic (EPSG:5880)
+# - "elipsoidal": mede direto sobre o elipsoide GRS80, a partir das coordenadas
+#   SIRGAS 2000, sem reprojetar (mais preciso longe do meridiano central e
+#   com menor uso de memória)
+MODO_AREA = "projetada"
+
 # Nome do arquivo do relatório final em Markdown
 REPORT_FILENAME = os.path.join(OUTPUT_DIR, "relatorio_sigmine_contexto.md")
 
+# Processos selecionados (top-N), na ordem do ranking, sem a geometria
+RANKING_FILENAME = os.path.join(OUTPUT_DIR, "ranking_processos.csv")
+
 # === NOMES DAS COLUNAS DO SHAPEFILE ===
 # Define os nomes das colunas que serão usadas do shapefile
 # Isso facilita manutenção caso os nomes mudem
 COL_PROCESSO = "PROCESSO"  # Número do processo minerário (ex: 803237/2022)
+COL_CHAVE = "chave_processo"  # Chave int64 do processo (ex: 8032372022), usada nas junções
 COL_TITULAR = "NOME"       # Nome da empresa titular do processo
 COL_UF = "UF"             # Unidade Federativa (estado)
+COL_FASE = "FASE"         # Fase do processo (ex: AUTORIZAÇÃO DE PESQUISA)
+COL_AREA_DECLARADA = "AREA_HA"  # Área declarada no SIGMINE, em hectares
+
+# Quantidade de maiores processos (por área) que serão analisados
+# None analisa todos os processos selecionados pelos filtros abaixo
+N_TOP = 10
+
+# Máximo de linhas das tabelas exibidas no terminal
+MAX_LINHAS_TELA = 50
+
+# === RECORTE DOS DADOS LIDOS DO SHAPEFILE ===
+# Apenas estas colunas de atributos são lidas (além da geometria e da área)
+# None lê todas as colunas do shapefile
+COLUNAS_LEITURA = [COL_PROCESSO, COL_TITULAR, COL_UF, COL_FASE, COL_AREA_DECLARADA]
+
+# Filtros aplicados durante a leitura (None = sem filtro)
+# Aceitam um valor ("PA") ou uma lista (["PA", "AM"])
+FILTRO_UF = None          # Ex: "PA" para analisar só o Pará
+FILTRO_FASE = None        # Ex: "CONCESSÃO DE LAVRA"
+FILTRO_SUBSTANCIA = None  # Ex: "OURO"
+FILTRO_BBOX = None        # (lon_min, lat_min, lon_max, lat_max) em SIRGAS 2000
+FILTRO_PROCESSOS = None   # Ex: ["803237/2022", "800.300/2010"] (com ou sem pontos)
+FILTRO_TITULAR = None     # Ex: "VALE S.A."
+
+# === SOBREPOSIÇÃO COM ÁREAS PROTEGIDAS ===
+# Camadas locais de polígonos cruzadas com todos os processos lidos
+# (shapefile, GeoPackage ou GeoJSON). Camadas ausentes são ignoradas
+# Código: (nome no relatório, arquivo, coluna com o nome de cada área)
+CAMADAS_SOBREPOSICAO = {
+    "ti": ("Terras Indígenas", os.path.join("data", "tis_poligonais.shp"), "terrai_nom"),   # FUNAI
+    "uc": ("Unidades de Conservação", os.path.join("data", "ucs.shp"), "NOME_UC1"),        # ICMBio/MMA (CNUC)
+}
+
+# === TITULARES AGREGADOS ===
+# Os titulares de todos os processos lidos são agregados, juntando variantes
+# do nome ("VALE S.A.", "Vale S/A") e, com o SCM, a raiz do CNPJ. Recebem o
+# perfil com IA os titulares do top-N com pelo menos MIN_PROCESSOS_PERFIL_TITULAR
+# processos no total, os de maior área total primeiro, até MAX_TITULARES_PERFIL
+MIN_PROCESSOS_PERFIL_TITULAR = 2
+MAX_TITULARES_PERFIL = 5
+
+# === CHECKPOINT (EXECUÇÃO EM LOTE RETOMÁVEL) ===
+# Cada análise concluída é gravada imediatamente neste arquivo. Se a
+# execução for interrompida, a próxima pula os processos já analisados
+# (exceto os de ATUALIZAR_BUSCAS). Apague o arquivo para refazer tudo
+USAR_CHECKPOINT = True
+CHECKPOINT_PATH = os.path.join(OUTPUT_DIR, "checkpoint_analises.jsonl")
+
+# Análise usada no "python main.py report" para os processos que ainda não
+# estão no checkpoint
+ANALISE_PENDENTE = {
+    'summary': "Análise ainda não realizada (rode `python main.py analyze`).",
+    'sources': [],
+    'raw_findings': [],
+}
+
+# === BACKENDS DE BUSCA E DE IA ===
+# BACKEND_BUSCA: "web" = Google Search API (ou DuckDuckGo, sem as credenciais)
+# BACKEND_IA: "gemini" = LLM e embeddings do Google Gemini
+# "local" (nos dois) = substitutos determinísticos, sem rede (backends_locais.py),
+# para testar concorrência, retentativas e memória em lotes grandes sem gastar cota
+BACKEND_BUSCA = "web"
+BACKEND_IA = "gemini"
+
+# Comportamento dos substitutos locais: latência (segundos) e sua variação
+# relativa, fração das chamadas que falham com 429 (taxa_429) ou com erro
+# 500 (taxa_erros) e vazão máxima em chamadas por segundo, acima da qual
+# respondem 429 (None = sem limite)
+CONFIG_BACKENDS_LOCAIS = {
+    "busca": {"latencia": 0.3, "variacao": 0.5, "taxa_429": 0.0, "taxa_erros": 0.0, "vazao_max": None},
+    "embeddings": {"latencia": 0.2, "variacao": 0.5, "taxa_429": 0.0, "taxa_erros": 0.0, "vazao_max": None},
+    "llm": {"latencia": 3.0, "variacao": 0.5, "taxa_429": 0.0, "taxa_erros": 0.0, "vazao_max": None},
+}
+
+# === LIMITES DE REQUISIÇÕES ÀS FERRAMENTAS DE BUSCA ===
+# Quantidade máxima de buscas executadas ao mesmo tempo
+BUSCAS_CONCORRENTES = 6
+
+# Limite de cada motor: (requisições por segundo, tamanho máximo da rajada)
+# Google CSE: cota padrão de 100 consultas/minuto
+# DuckDuckGo: sem cota oficial, mas bloqueia rajadas; mantemos conservador
+LIMITES_BUSCA = {
+    "Google Search API": (1.5, 5),
+    "DuckDuckGo Search": (0.5, 2),
+    "Busca local": (50.0, 10),  # BACKEND_BUSCA = "local"
+}
+LIMITE_BUSCA_PADRAO = (0.5, 1)
+
+# Retentativas em caso de erro 429 (espera exponencial com jitter)
+MAX_TENTATIVAS_BUSCA = 5
+BACKOFF_BASE_BUSCA = 2.0  # Segundos de espera (máxima) após o primeiro 429
+
+# Lista de sites especializados em questões socioambientais e mineração
+# Estes sites são priorizados porque tendem a ter informações mais confiáveis
+SITES_RELEVANTES = [
+    "terrasindigenas.org.br",    # Monitoramento de terras indígenas
+    "mpf.mp.br",                 # Ministério Público Federal
+    "ibama.gov.br",              # Instituto Brasileiro do Meio Ambiente
+    "funai.gov.br",              # Fundação Nacional do Índio
+    "socioambiental.org",        # Instituto Socioambiental
+    "cimi.org.br",               # Conselho Indigenista Missionário
+    "imazon.org.br",             # Instituto do Homem e Meio Ambiente da Amazônia
+    "inesc.org.br",              # Instituto de Estudos Socioeconômicos
+    "apublica.org",              # Agência de jornalismo investigativo
+    "reporterbrasil.org.br"      # ONG de jornalismo socioambiental
+]
+
+# === PALAVRAS-CHAVE DE IMPACTO ===
+# Encontradas sem diferenciar acentos e maiúsculas ("terra indigena" conta)
+# Palavras que pontuam a relevância de cada resultado de busca (+1 cada)
+PALAVRAS_CHAVE_RELEVANCIA = [
+    'terra indígena', 'conflito', 'ameaça', 'impacto', 'ambiental', 
+    'comunidade', 'protesto', 'multa', 'ação civil', 'ministério público',
+    'sobreposição', 'desmatamento', 'poluição', 'contaminação'
+]
+# Termos que, no resumo do LLM, marcam o processo como tendo possíveis impactos
+TERMOS_IMPACTO = ['terra indígena', 'conflito', 'impacto', 'ameaça']
+
+# Compilados uma única vez e usados em todas as análises
+BUSCADOR_RELEVANCIA = BuscadorPalavras(PALAVRAS_CHAVE_RELEVANCIA)
+BUSCADOR_IMPACTO = BuscadorPalavras(TERMOS_IMPACTO)
+
+# === CACHE DOS RESULTADOS DE BUSCA ===
+# Resultados brutos de cada busca ficam guardados em disco, identificados
+# por (motor de busca, query normalizada). Reexecuções com as mesmas
+# entradas não fazem nenhuma chamada de busca à rede
+USAR_CACHE_BUSCA = True
+CACHE_BUSCA_PATH = os.path.join(CACHE_DIR, "buscas.sqlite")
+TTL_CACHE_BUSCA_HORAS = 7 * 24      # Resultados mais antigos são buscados de novo
+TAMANHO_MAX_CACHE_BUSCA_MB = 200    # Acima disso, descarta os menos usados
+
+# Processos (ex: "803237/2022" ou "803.237/2022") ou titulares (ex: "VALE S.A.")
+# cujas buscas devem ignorar o cache e ser refeitas nesta execução
+ATUALIZAR_BUSCAS = []
+
+# === VERIFICAÇÃO DA BUSCA DO GOOGLE ===
+# Antes de usar a Google Search API, uma busca de teste confirma que as
+# credenciais funcionam. Uma verificação bem-sucedida vale por este
+# intervalo (guardada em CACHE_BUSCA_PATH), sem nova busca de teste a cada
+# execução. 0 = verifica sempre. Falhas não são guardadas: a próxima
+# execução verifica de novo
+INTERVALO_VERIFICACAO_BUSCA_HORAS = 24
+
+# === BASE VETORIAL PERSISTENTE (CHROMA) ===
+# Todos os trechos indexados ficam numa única coleção em disco, com os
+# metadados 'processo' e 'titular'. Reexecuções reaproveitam o índice.
+# Ao trocar o modelo de embeddings, use outra coleção (os vetores mudam)
+CHROMA_DIR = os.path.join(CACHE_DIR, "chroma")
+CHROMA_COLECAO = "sigmine_contexto"
+
+# === CACHE DOS EMBEDDINGS ===
+# Vetores já calculados ficam em disco, identificados pelo hash de
+# (modelo, texto). Trechos repetidos ou já vistos não geram nova chamada
+# paga ao modelo de embeddings. Embeddings não mudam, então não há TTL
+USAR_CACHE_EMBEDDINGS = True
+CACHE_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite")
+TAMANHO_MAX_CACHE_EMBEDDINGS_MB = 500
+
+# === CACHE DAS RESPOSTAS DO LLM ===
+# Respostas do Gemini ficam guardadas, identificadas por (modelo,
+# temperatura, template, pergunta, trechos de contexto). Reexecuções com
+# o mesmo contexto (ex: após ajustar a formatação do relatório) não
+# chamam o modelo de novo
+USAR_CACHE_LLM = True
+CACHE_LLM_PATH = os.path.join(CACHE_DIR, "respostas_llm.sqlite")
+TAMANHO_MAX_CACHE_LLM_MB = 200
+
+# === ENVIO DOS EMBEDDINGS EM LOTES ===
+# Os trechos novos dos processos que chegam juntos à etapa "embeddings"
+# são reunidos em lotes, enviados em paralelo
+TAMANHO_LOTE_EMBEDDINGS = 100         # Textos por requisição (limite da API Gemini)
+LOTES_EMBEDDINGS_CONCORRENTES = 4     # Requisições simultâneas
+LIMITE_EMBEDDINGS = (5.0, 5)          # (requisições por segundo, rajada máxima)
+ESPERA_LOTE_EMBEDDINGS = 0.5          # Segundos de espera por trechos de outros processos
+
+# === PIPELINE DE ANÁLISE DOS PROCESSOS ===
+# Cada processo passa por quatro etapas: busca na web, embeddings dos
+# trechos novos, indexação no Chroma e geração do resumo pelo Gemini. Os
+# processos são analisados ao mesmo tempo, cada um numa etapa: enquanto
+# um espera o Gemini, outro é indexado e outro faz as buscas. Máximo de
+# processos em cada etapa:
+LIMITES_ETAPAS = {
+    "busca": 2,       # As buscas de cada processo já rodam em paralelo (BUSCAS_CONCORRENTES)
+    "embeddings": 4,  # Processos cujos trechos podem ser reunidos num mesmo lote
+    "indexacao": 2,
+    "geracao": 3,     # Chamadas simultâneas ao Gemini
+}
+
+# Retentativas da geração em caso de 429 do LLM (o cliente do Gemini já
+# repete algumas vezes por conta própria; estas vêm depois das dele)
+MAX_TENTATIVAS_LLM = 5
+BACKOFF_BASE_LLM = 10.0
+
+# === MEDIÇÕES DA EXECUÇÃO ===
+# Tempo de cada etapa, buscas (e erros 429), requisições de embeddings,
+# chamadas e tokens do LLM e acertos dos caches, no total e por processo.
+# Gravados no fim de cada execução, mesmo se ela falhar
+MANIFESTO_PATH = os.path.join(OUTPUT_DIR, "manifesto_execucao.json")
+# Métricas no formato do Prometheus, para o coletor "textfile" do
+# node_exporter (ex: "/var/lib/node_exporter/textfile/sigmine.prom")
+PROMETHEUS_PATH = None
+# Perfis opcionais (têm custo): cProfile da thread principal, gravado no
+# arquivo indicado (ex: os.path.join(OUTPUT_DIR, "perfil_cpu.prof")), e
+# tracemalloc, com o pico de memória e as maiores alocações no manifesto
+PERFIL_CPU_PATH = None
+PERFILAR_MEMORIA = False
+
+# Instância do cache de buscas, criada na primeira utilização
+_CACHE_BUSCA = None
+_LOCK_CACHE_BUSCA = threading.Lock()
+
+# Limitadores de taxa compartilhados, um por motor de busca
+_BUCKETS_BUSCA = {}
+_LOCK_BUCKETS = threading.Lock()
+
+# Medições da execução (ver instrumentacao.py)
+INSTRUMENTACAO = Instrumentacao()
 
 # Variável global para rastrear qual motor de busca foi efetivamente utilizado
-# Será preenchida em runtime com "Google Search API" ou "DuckDuckGo Search"
+# Será preenchida em runtime com "Google Search API", "DuckDuckGo Search" ou "Busca local"
 SEARCH_ENGINE_USED = None
 
+# Modelo de IA usado, para o relatório (preenchido por configurar_backends)
+MODELO_IA_USADO = None
+
+def verificar_google_search(search_tool, google_api_key: str, google_cse_id: str) -> bool:
+    """
+    Confirma que a Google Search API responde, reaproveitando verificações recentes.
+    
+    Faz uma busca de teste só se não houver uma verificação bem-sucedida,
+    com as mesmas credenciais, nas últimas INTERVALO_VERIFICACAO_BUSCA_HORAS.
+    
+    Args:
+        search_tool: Instância de GoogleSearchAPIWrapper
+        google_api_key (str): Chave da API (entra na chave da verificação como hash)
+        google_cse_id (str): ID do Custom Search Engine
+        
+    Returns:
+        bool: True se a busca de teste (atual ou guardada) trouxe resultados
+        
+    Raises:
+        Exception: Erros da busca de teste
+    """
+    intervalo = INTERVALO_VERIFICACAO_BUSCA_HORAS * 3600
+    cache = CacheSQLite(CACHE_BUSCA_PATH, "verificacao_busca", ttl_segundos=intervalo) if intervalo > 0 else None
+    # Trocar a chave ou o CSE invalida a verificação guardada
+    chave = hashlib.sha256(f"{google_api_key}\0{google_cse_id}".encode("utf-8")).hexdigest()
+    
+    try:
+        if cache is not None:
+            verificacao = cache.get(chave)
+            if verificacao is not None:
+                logger.info(f"Google Search API verificada em {verificacao['verificado_em']}; "
+                            f"busca de teste dispensada")
+                return True
+        
+        # Testa se a ferramenta funciona fazendo uma busca simples
+        INSTRUMENTACAO.contar("busca_verificacoes")
+        if not search_tool.run("test query"):
+            return False
+        if cache is not None:
+            cache.set(chave, {"verificado_em": datetime.now().isoformat(timespec="seconds")})
+        return True
+    finally:
+        if cache is not None:
+            cache.fechar()
+
 def setup_search_tool():
     """
     Configura a ferramenta de busca na web, priorizando Google Search API.
     
     Esta função tenta primeiro usar o Google Search (mais preciso e estruturado),
     mas se falhar ou não estiver configurado, usa DuckDuckGo como fallback.
+    A busca de teste do Google é feita no máximo uma vez por
+    INTERVALO_VERIFICACAO_BUSCA_HORAS (ver verificar_google_search).
     
     Returns:
         search_tool: Instância de GoogleSearchAPIWrapper ou DuckDuckGoSearchResults
@@ -93,6 +411,10 @@ def setup_search_tool():
     """
     global SEARCH_ENGINE_USED  # Permite modificar a variável global
     
+    # Importadas só aqui: carregam o LangChain (ver IMPORTAÇÕES DO LANGCHAIN)
+    from langchain_google_community import GoogleSearchAPIWrapper  # Busca via Google Custom Search
+    from langchain_community.tools import DuckDuckGoSearchResults  # Busca via DuckDuckGo (fallback)
+    
     # Tenta buscar as credenciais do Google no arquivo .env
     google_api_key = os.getenv("GOOGLE_API_KEY")
     google_cse_id = os.getenv("GOOGLE_CSE_ID")  # Custom Search Engine ID
@@ -103,11 +425,9 @@ def setup_search_tool():
             # Cria instância da ferramenta Google Search
             search_tool = GoogleSearchAPIWrapper()
             
-            # Testa se a ferramenta funciona fazendo uma busca simples
-            test_results = search_tool.run("test query")
-            
-            # Se retornou resultados, a configuração está correta
-            if test_results:
+            # Se a busca de teste (agora ou recente) retornou resultados,
+            # a configuração está correta
+            if verificar_google_search(search_tool, google_api_key, google_cse_id):
                 print("✅ Usando Google Search como ferramenta de busca.")
                 SEARCH_ENGINE_USED = "Google Search API"
                 return search_tool
@@ -121,6 +441,61 @@ def setup_search_tool():
     SEARCH_ENGINE_USED = "DuckDuckGo Search"
     return DuckDuckGoSearchResults()
 
+def configurar_backends():
+    """
+    Cria a ferramenta de busca, o LLM e o modelo de embeddings configurados.
+    
+    BACKEND_BUSCA e BACKEND_IA escolhem entre os serviços reais e os
+    substitutos locais (ver backends_locais.py), que respondem sem rede,
+    com a latência, os erros e a vazão de CONFIG_BACKENDS_LOCAIS.
+    
+    Returns:
+        tuple: (search_tool, llm, embed_model), sem o cache de embeddings
+        
+    Raises:
+        ValueError: Se BACKEND_BUSCA ou BACKEND_IA não for reconhecido
+    """
+    global SEARCH_ENGINE_USED, MODELO_IA_USADO
+    
+    # Substitutos locais da busca, dos embeddings e do LLM (testes sem rede)
+    from backends_locais import BuscaLocal, EmbeddingsLocais, LLMLocal
+    
+    if BACKEND_BUSCA == "web":
+        # Google Search ou DuckDuckGo
+        search_tool = setup_search_tool()
+    elif BACKEND_BUSCA == "local":
+        search_tool = BuscaLocal(**CONFIG_BACKENDS_LOCAIS.get("busca", {}))
+        SEARCH_ENGINE_USED = "Busca local"
+        print("🧪 Usando a busca local simulada (sem rede).")
+    else:
+        raise ValueError(f"BACKEND_BUSCA desconhecido: {BACKEND_BUSCA!r} (use 'web' ou 'local')")
+    
+    if BACKEND_IA == "gemini":
+        # Integração com Google Gemini (modelo de IA)
+        from langchain_google_genai import ChatGoogleGenerativeAI  # Modelo de chat do Gemini
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings  # Modelo de embeddings
+        
+        # === CONFIGURAÇÃO DO MODELO GEMINI ===
+        # Gemini 2.5 Pro: modelo mais recente e capaz do Google
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-pro",  # Versão do modelo
+            temperature=0.1,         # Baixa temperatura = respostas mais consistentes
+            max_output_tokens=2048   # Limite de tokens na resposta
+        )
+        # Modelo de embeddings para vetorização de texto
+        # Usado para busca semântica nos documentos
+        embed_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        MODELO_IA_USADO = "Google Gemini 2.5"
+    elif BACKEND_IA == "local":
+        llm = LLMLocal(**CONFIG_BACKENDS_LOCAIS.get("llm", {}))
+        embed_model = EmbeddingsLocais(**CONFIG_BACKENDS_LOCAIS.get("embeddings", {}))
+        MODELO_IA_USADO = "Substituto local (sem rede, para testes)"
+        print("🧪 Usando LLM e embeddings locais simulados (sem rede).")
+    else:
+        raise ValueError(f"BACKEND_IA desconhecido: {BACKEND_IA!r} (use 'gemini' ou 'local')")
+    
+    return search_tool, llm, embed_model
+
 def extract_urls_from_duckduckgo_text(text):
     """
     Extrai URLs de texto não estruturado retornado pelo DuckDuckGo.
@@ -160,49 +535,181 @@ def extract_urls_from_duckduckgo_text(text):
             
     return unique_urls
 
-def enhanced_search(titular: str, processo: str, uf: str, search_tool):
+def processar_resultados_busca(results, search_query: str, sites_relevantes: list):
     """
-    Realiza busca aprimorada na web com múltiplas estratégias e Google Dorks.
+    Converte o retorno bruto de uma busca em uma lista de resultados estruturados.
+    
+    Args:
+        results: Retorno de search_tool.run (str no DuckDuckGo, list no Google)
+        search_query (str): Query que gerou o resultado
+        sites_relevantes (list): Domínios especializados em questões socioambientais
+        
+    Returns:
+        list: Lista de dicionários no formato usado por enhanced_search
+    """
+    processados = []
+    
+    # === PROCESSAMENTO PARA DUCKDUCKGO ===
+    if isinstance(results, str) and results:
+        # DuckDuckGo retorna string não estruturada
+        
+        # Tenta extrair URLs do texto
+        urls_found = extract_urls_from_duckduckgo_text(results)
+        
+        if urls_found:
+            # Se encontrou URLs, cria uma entrada para cada uma
+            for url in urls_found[:3]:  # Máximo 3 URLs por busca
+                processados.append({
+                    'content': results[:500],  # Primeiros 500 caracteres
+                    'query': search_query,     # Query que gerou o resultado
+                    'link': url,              # URL extraída
+                    'source': url,            # Duplica para compatibilidade
+                    'title': f'Resultado de {search_query}',
+                    'strategy': 'duckduckgo_extracted',
+                    # Verifica se é de um site relevante
+                    'is_relevant_site': any(site in url for site in sites_relevantes)
+                })
+        else:
+            # Se não encontrou URLs, salva só o conteúdo
+            processados.append({
+                'content': results[:500],
+                'query': search_query,
+                'source': f'Busca: {search_query}',
+                'link': '',  # Sem URL
+                'title': 'Resultado sem URL extraída',
+                'strategy': 'text_result',
+                'is_relevant_site': False
+            })
+            
+    # === PROCESSAMENTO PARA GOOGLE SEARCH ===
+    elif isinstance(results, list):
+        # Google retorna lista de dicionários estruturados
+        for item in results:
+            if isinstance(item, dict):
+                link = item.get('link', '')
+                
+                # Verifica se o link é de um site relevante
+                is_relevant_site = any(site in link for site in sites_relevantes)
+                
+                processados.append({
+                    'content': item.get('snippet', ''),  # Trecho do resultado
+                    'title': item.get('title', ''),      # Título da página
+                    'link': link,                        # URL
+                    'source': link,                      # Duplica para compatibilidade
+                    'query': search_query,               # Query usada
+                    'is_relevant_site': is_relevant_site,
+                    'strategy': 'structured_result'
+                })
+    
+    return processados
+
+def bucket_busca(motor: str) -> TokenBucket:
+    """
+    Retorna o limitador de taxa compartilhado de um motor de busca.
+    
+    O mesmo bucket é usado por todas as buscas do motor durante a execução,
+    para que o limite valha para o programa inteiro e não só para um processo.
+    
+    Args:
+        motor (str): Nome do motor (ex: "Google Search API")
+        
+    Returns:
+        TokenBucket: Limitador de taxa do motor
+    """
+    with _LOCK_BUCKETS:
+        if motor not in _BUCKETS_BUSCA:
+            taxa, capacidade = LIMITES_BUSCA.get(motor, LIMITE_BUSCA_PADRAO)
+            _BUCKETS_BUSCA[motor] = TokenBucket(taxa, capacidade)
+        return _BUCKETS_BUSCA[motor]
+
+def cache_busca():
+    """
+    Retorna o cache de resultados de busca, criando-o na primeira chamada.
+    
+    Returns:
+        CacheSQLite ou None: None se o cache estiver desativado
+    """
+    global _CACHE_BUSCA
+    if not USAR_CACHE_BUSCA:
+        return None
+    with _LOCK_CACHE_BUSCA:
+        if _CACHE_BUSCA is None:
+            _CACHE_BUSCA = CacheSQLite(
+                CACHE_BUSCA_PATH, "buscas",
+                ttl_segundos=TTL_CACHE_BUSCA_HORAS * 3600,
+                tamanho_max_bytes=TAMANHO_MAX_CACHE_BUSCA_MB * 1024 * 1024,
+            )
+        return _CACHE_BUSCA
+
+def buscar(search_tool, search_query: str, forcar_atualizacao: bool = False):
+    """
+    Executa uma busca usando o cache em disco quando possível.
+    
+    Se a mesma busca (mesmo motor e mesma query normalizada) já foi feita
+    dentro da validade do cache, devolve o resultado guardado sem acessar
+    a rede. Caso contrário, faz a busca respeitando o limite de taxa do
+    motor e guarda o resultado bruto.
+    
+    Args:
+        search_tool: Ferramenta de busca configurada
+        search_query (str): Query a ser buscada
+        forcar_atualizacao (bool): Se True, ignora o resultado guardado
+        
+    Returns:
+        Resultado bruto de search_tool.run (str ou list)
+    """
+    cache = cache_busca()
+    chave = f"{SEARCH_ENGINE_USED}|{normalizar_query(search_query)}"
+    
+    if cache is not None and not forcar_atualizacao:
+        results = cache.get(chave)
+        if results is not None:
+            INSTRUMENTACAO.contar("busca_cache_acertos")
+            return results
+        INSTRUMENTACAO.contar("busca_cache_faltas")
+    
+    # Cada tentativa é uma requisição ao motor de busca (conta na cota)
+    def executar(query):
+        INSTRUMENTACAO.contar("busca_chamadas")
+        return search_tool.run(query)
+    
+    results = executar_com_retentativa(
+        executar, search_query,
+        bucket=bucket_busca(SEARCH_ENGINE_USED),
+        max_tentativas=MAX_TENTATIVAS_BUSCA,
+        backoff_base=BACKOFF_BASE_BUSCA,
+        ao_rate_limit=lambda e: INSTRUMENTACAO.contar("busca_429"),
+    )
     
-    Esta é uma das funções mais importantes do sistema. Ela implementa
-    três estratégias de busca para maximizar as chances de encontrar
-    informações relevantes sobre impactos socioambientais.
+    # Só respostas bem-sucedidas são guardadas (erros não chegam até aqui)
+    if cache is not None:
+        cache.set(chave, results)
+    return results
+
+def montar_buscas(titular: str, processo: str, uf: str):
+    """
+    Monta a lista de queries de busca de um processo.
+    
+    Implementa três estratégias de busca para maximizar as chances de
+    encontrar informações relevantes sobre impactos socioambientais.
     
     Args:
         titular (str): Nome da empresa titular do processo
         processo (str): Número do processo (ex: "803237/2022")
         uf (str): Estado (sigla)
-        search_tool: Ferramenta de busca configurada
         
     Returns:
-        list: Lista de dicionários com resultados de busca estruturados
+        list: Queries de busca, na ordem em que os resultados são apresentados
         
     Estratégias implementadas:
     1. Buscas básicas: termos gerais sobre a empresa
     2. Buscas de impacto: termos específicos sobre conflitos
     3. Buscas direcionadas: usando Google Dorks em sites especializados
     """
-    all_results = []  # Lista para acumular todos os resultados
-    
     # Remove a barra do número do processo para algumas buscas
     # Ex: "803237/2022" -> "8032372022"
     processo_clean = processo.replace('/', '')
     
-    # Lista de sites especializados em questões socioambientais e mineração
-    # Estes sites são priorizados porque tendem a ter informações mais confiáveis
-    sites_relevantes = [
-        "terrasindigenas.org.br",    # Monitoramento de terras indígenas
-        "mpf.mp.br",                 # Ministério Público Federal
-        "ibama.gov.br",              # Instituto Brasileiro do Meio Ambiente
-        "funai.gov.br",              # Fundação Nacional do Índio
-        "socioambiental.org",        # Instituto Socioambiental
-        "cimi.org.br",               # Conselho Indigenista Missionário
-        "imazon.org.br",             # Instituto do Homem e Meio Ambiente da Amazônia
-        "inesc.org.br",              # Instituto de Estudos Socioeconômicos
-        "apublica.org",              # Agência de jornalismo investigativo
-        "reporterbrasil.org.br"      # ONG de jornalismo socioambiental
-    ]
-    
     # === ESTRATÉGIA 1: BUSCAS BÁSICAS ===
     # Termos mais gerais para capturar informações gerais sobre a empresa/processo
     basic_searches = [
@@ -228,7 +735,7 @@ def enhanced_search(titular: str, processo: str, uf: str, search_tool):
     # === ESTRATÉGIA 3: BUSCAS COM GOOGLE DORKS ===
     # Usa operador "site:" para buscar diretamente em sites especializados
     site_searches = []
-    for site in sites_relevantes[:5]:  # Limita a 5 sites para não sobrecarregar
+    for site in SITES_RELEVANTES[:5]:  # Limita a 5 sites para não sobrecarregar
         site_searches.extend([
             f'site:{site} "{titular}"',        # Empresa no site específico
             f'site:{site} {processo}',         # Processo com barra
@@ -239,89 +746,282 @@ def enhanced_search(titular: str, processo: str, uf: str, search_tool):
     # Total: 3 básicas + 3 de impacto + 6 em sites = 12 buscas
     all_searches = basic_searches[:3] + impact_searches[:3] + site_searches[:6]
     
-    print(f"\n  📍 Executando {len(all_searches)} buscas estratégicas...")
+    return all_searches
+
+def executar_buscas(queries, search_tool, forcar_atualizacao: bool = False,
+                    compartilhadas: ExecucaoUnica = None):
+    """
+    Executa um conjunto de buscas em paralelo, cada query única uma só vez.
     
-    # Executa cada busca com tratamento de erros e rate limiting
-    for idx, search_query in enumerate(all_searches):
-        try:
-            # Adiciona delay aleatório entre buscas (exceto na primeira)
-            # Isso evita ser bloqueado por fazer muitas requisições rápidas
-            if idx > 0:
-                time.sleep(random.uniform(1.5, 2.5))  # Entre 1.5 e 2.5 segundos
-            
-            # Executa a busca
-            results = search_tool.run(search_query)
-            
-            # === PROCESSAMENTO PARA DUCKDUCKGO ===
-            if isinstance(results, str) and results:
-                # DuckDuckGo retorna string não estruturada
-                
-                # Tenta extrair URLs do texto
-                urls_found = extract_urls_from_duckduckgo_text(results)
-                
-                if urls_found:
-                    # Se encontrou URLs, cria uma entrada para cada uma
-                    for url in urls_found[:3]:  # Máximo 3 URLs por busca
-                        all_results.append({
-                            'content': results[:500],  # Primeiros 500 caracteres
-                            'query': search_query,     # Query que gerou o resultado
-                            'link': url,              # URL extraída
-                            'source': url,            # Duplica para compatibilidade
-                            'title': f'Resultado de {search_query}',
-                            'strategy': 'duckduckgo_extracted',
-                            # Verifica se é de um site relevante
-                            'is_relevant_site': any(site in url for site in sites_relevantes)
-                        })
+    Queries que diferem apenas em caixa ou espaços (mesma forma
+    normalizada) são buscadas uma única vez.
+    
+    Args:
+        queries (list): Queries a buscar
+        search_tool: Ferramenta de busca configurada
+        forcar_atualizacao (bool): Se True, refaz as buscas ignorando o cache
+        compartilhadas (ExecucaoUnica): Buscas compartilhadas entre os processos
+            analisados ao mesmo tempo; uma query já feita (ou em andamento)
+            para outro processo não é repetida
+        
+    Returns:
+        dict: {query normalizada: lista de resultados estruturados}
+    """
+    # Remove duplicatas mantendo a primeira forma de cada query
+    unicas = {}
+    for query in queries:
+        unicas.setdefault(normalizar_query(query), query)
+    
+    # O limite de requisições por segundo de cada motor de busca é
+    # respeitado pelo token bucket, e erros 429 são repetidos com espera
+    # exponencial (ver concorrencia.py). Buscas já feitas em execuções
+    # anteriores vêm do cache, sem acessar a rede
+    # As buscas rodam em outras threads: o processo das medições vai junto
+    processo = INSTRUMENTACAO.processo_atual()
+    
+    def executar_busca(search_query):
+        with INSTRUMENTACAO.processo(processo):
+            try:
+                results = buscar(search_tool, search_query, forcar_atualizacao)
+                return processar_resultados_busca(results, search_query, SITES_RELEVANTES)
+            except Exception as e:
+                INSTRUMENTACAO.contar("busca_erros")
+                if eh_rate_limit(e):
+                    print(f"  ⚠️ Rate limit persistente na busca '{search_query}'. Busca ignorada.")
                 else:
-                    # Se não encontrou URLs, salva só o conteúdo
-                    all_results.append({
-                        'content': results[:500],
-                        'query': search_query,
-                        'source': f'Busca: {search_query}',
-                        'link': '',  # Sem URL
-                        'title': 'Resultado sem URL extraída',
-                        'strategy': 'text_result',
-                        'is_relevant_site': False
-                    })
-                    
-            # === PROCESSAMENTO PARA GOOGLE SEARCH ===
-            elif isinstance(results, list):
-                # Google retorna lista de dicionários estruturados
-                for item in results:
-                    if isinstance(item, dict):
-                        link = item.get('link', '')
-                        
-                        # Verifica se o link é de um site relevante
-                        is_relevant_site = any(site in link for site in sites_relevantes)
-                        
-                        all_results.append({
-                            'content': item.get('snippet', ''),  # Trecho do resultado
-                            'title': item.get('title', ''),      # Título da página
-                            'link': link,                        # URL
-                            'source': link,                      # Duplica para compatibilidade
-                            'query': search_query,               # Query usada
-                            'is_relevant_site': is_relevant_site,
-                            'strategy': 'structured_result'
-                        })
-                        
-        except Exception as e:
-            # Tratamento específico para rate limiting (erro 429)
-            if "429" in str(e):
-                print(f"  ⚠️ Rate limit atingido. Aguardando 5 segundos...")
-                time.sleep(5)
-            else:
-                # Outros erros são logados mas não interrompem o processo
-                logger.warning(f"  ⚠️ Erro na busca '{search_query}': {e}")
-            continue
+                    # Outros erros são logados mas não interrompem o processo
+                    logger.warning(f"  ⚠️ Erro na busca '{search_query}': {e}")
+                return []
+    
+    if compartilhadas is not None:
+        busca_individual = executar_busca
+        def executar_busca(search_query):
+            return compartilhadas.executar(normalizar_query(search_query),
+                                           busca_individual, search_query)
+    
+    with ThreadPoolExecutor(max_workers=BUSCAS_CONCORRENTES) as executor:
+        resultados = list(executor.map(executar_busca, unicas.values()))
+    return dict(zip(unicas.keys(), resultados))
+
+def planejar_buscas(tarefas, search_tool):
+    """
+    Reúne as buscas de todos os processos da execução e faz cada uma só uma vez.
+    
+    Quando um titular tem vários processos no top-N, as buscas baseadas no
+    nome da empresa ("{titular}" mineração, site:... "{titular}", etc.) se
+    repetem em todos eles, e de novo no perfil dos titulares.
+    
+    As buscas de processos marcados para atualização são refeitas aqui,
+    antes das análises, para que o resultado novo valha para todos os
+    processos que usam a mesma query. As demais são feitas durante a
+    análise de cada processo, compartilhadas por ExecucaoUnica (ver
+    executar_buscas), também uma única vez: o plano diz quantos processos
+    pedem cada query, para que o resultado fique na memória até o último
+    deles.
+    
+    Args:
+        tarefas (list): Tuplas (titular, processo, uf, forcar_atualizacao)
+        search_tool: Ferramenta de busca configurada
+        
+    Returns:
+        tuple: ({query normalizada: lista de resultados} das buscas refeitas,
+                Counter {query normalizada: processos que a pedem} das demais)
+    """
+    normais, forcadas = [], []
+    for titular, processo, uf, forcar in tarefas:
+        (forcadas if forcar else normais).append(montar_buscas(titular, processo, uf))
+    forcadas = [q for queries in forcadas for q in queries]
+    
+    # Uma query pedida por um processo marcado para atualização é refeita
+    # uma vez e o resultado novo vale para todos os processos que a usam
+    chaves_forcadas = {normalizar_query(q) for q in forcadas}
+    
+    # executar_buscas pede cada query uma vez por processo
+    usos = Counter()
+    for queries in normais:
+        usos.update({normalizar_query(q) for q in queries} - chaves_forcadas)
+    
+    total = sum(usos.values()) + len(forcadas)
+    unicas = len(usos) + len(chaves_forcadas)
+    print(f"   {total} buscas planejadas, {unicas} únicas após remover repetições")
+    
+    return executar_buscas(forcadas, search_tool, forcar_atualizacao=True), usos
+
+def juntar_resultados(queries, resultados: dict):
+    """
+    Junta os resultados de várias buscas na ordem das queries.
+    
+    Args:
+        queries (list): Queries de um processo (ver montar_buscas)
+        resultados (dict): {query normalizada: lista de resultados}
+        
+    Returns:
+        list: Resultados do processo, com os de sites relevantes primeiro
+    """
+    # Cada processo recebe cópias, pois rag_summary_enhanced
+    # acrescenta a pontuação em cada resultado
+    all_results = []
+    for search_query in queries:
+        all_results.extend(dict(r) for r in resultados.get(normalizar_query(search_query), []))
     
     # Ordena resultados priorizando sites relevantes
     # Sites como MPF, FUNAI, etc. aparecem primeiro
+    # (a ordenação é estável: dentro de cada grupo, mantém a ordem das buscas)
     all_results.sort(key=lambda x: x.get('is_relevant_site', False), reverse=True)
+    return all_results
+
+def enhanced_search(titular: str, processo: str, uf: str, search_tool,
+                    forcar_atualizacao: bool = False, resultados_planejados: dict = None,
+                    compartilhadas: ExecucaoUnica = None):
+    """
+    Realiza busca aprimorada na web com múltiplas estratégias e Google Dorks.
+    
+    Esta é uma das funções mais importantes do sistema. Ela executa
+    as buscas montadas por montar_buscas e junta os resultados.
+    
+    Args:
+        titular (str): Nome da empresa titular do processo
+        processo (str): Número do processo (ex: "803237/2022")
+        uf (str): Estado (sigla)
+        search_tool: Ferramenta de busca configurada
+        forcar_atualizacao (bool): Se True, refaz as buscas ignorando o cache
+        resultados_planejados (dict): Resultados já obtidos por planejar_buscas;
+            só as queries que não estiverem nele são buscadas
+        compartilhadas (ExecucaoUnica): Buscas compartilhadas com os outros processos
+        
+    Returns:
+        list: Lista de dicionários com resultados de busca estruturados
+    """
+    all_searches = montar_buscas(titular, processo, uf)
+    resultados_planejados = resultados_planejados or {}
+    
+    faltantes = [q for q in all_searches if normalizar_query(q) not in resultados_planejados]
+    if faltantes:
+        print(f"\n  📍 Executando {len(faltantes)} buscas estratégicas...")
+    resultados = {**resultados_planejados,
+                  **executar_buscas(faltantes, search_tool, forcar_atualizacao, compartilhadas)}
+    
+    all_results = juntar_resultados(all_searches, resultados)
     
     print(f"  ✅ {len(all_results)} resultados encontrados")
     return all_results
 
-def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str, processo: str, uf: str):
+def preparar_indexacao(vectorstore, docs_split, processo: str, titular: str) -> tuple:
+    """
+    Compara os trechos de um processo com os já indexados na coleção do Chroma.
+    
+    Cada trecho recebe um ID derivado do hash de (processo, titular, link,
+    conteúdo), guardado também nos metadados.
+    
+    Args:
+        vectorstore (Chroma): Coleção persistente
+        docs_split (list): Trechos (Document) do processo
+        processo (str): Número do processo
+        titular (str): Nome da empresa
+        
+    Returns:
+        tuple: (filtro de metadados que seleciona os trechos do processo,
+                {ID: trecho} dos trechos atuais, sem repetições,
+                set de IDs já indexados)
+    """
+    from cache_ia import hash_conteudo
+    
+    filtro = {"$and": [{"processo": processo}, {"titular": titular}]}
+    
+    novos = {}
+    for doc in docs_split:
+        doc_hash = hash_conteudo(processo, titular, doc.metadata.get('link', ''), doc.page_content)
+        doc.metadata.update({'processo': processo, 'titular': titular, 'hash': doc_hash})
+        novos.setdefault(doc_hash, doc)
+    
+    existentes = set(vectorstore.get(where=filtro, include=[])['ids'])
+    return filtro, novos, existentes
+
+def indexar_documentos(vectorstore, filtro: dict, novos: dict, existentes: set) -> dict:
+    """
+    Sincroniza os trechos de um processo com a coleção persistente do Chroma.
+    
+    Recebe o resultado de preparar_indexacao. Assim:
+    - trechos já indexados em execuções anteriores não são reenviados
+    - trechos que não vieram na busca atual são removidos, para que a
+      análise use só o contexto encontrado agora
+    
+    Args:
+        vectorstore (Chroma): Coleção persistente
+        filtro (dict): Filtro de metadados do processo
+        novos (dict): {ID: trecho} dos trechos atuais
+        existentes (set): IDs já indexados
+        
+    Returns:
+        dict: Filtro de metadados que seleciona os trechos do processo
+    """
+    obsoletos = existentes - novos.keys()
+    if obsoletos:
+        vectorstore.delete(ids=list(obsoletos))
+    
+    faltantes = [h for h in novos if h not in existentes]
+    if faltantes:
+        vectorstore.add_documents([novos[h] for h in faltantes], ids=faltantes)
+    
+    return filtro
+
+def criar_documentos(search_results):
+    """
+    Converte os resultados de busca em Documents do LangChain.
+    
+    Args:
+        search_results (list): Resultados estruturados de enhanced_search
+        
+    Returns:
+        list: Documentos com conteúdo e metadados (fonte, título, query, link)
+    """
+    from langchain.schema import Document  # Estrutura de dados para documentos
+    
+    docs = []  # Lista de documentos LangChain
+    
+    # Converte cada resultado de busca em um Document do LangChain
+    for idx, result in enumerate(search_results):
+        content = result.get('content', '')
+        if content:
+            doc_id = f"doc_{idx}"  # ID único para o documento
+            
+            # Cria documento com metadados completos
+            docs.append(Document(
+                page_content=content,  # Conteúdo textual
+                metadata={
+                    'doc_id': doc_id,
+                    'source': result.get('link', result.get('source', 'Fonte não especificada')),
+                    'title': result.get('title', ''),
+                    'query': result.get('query', ''),
+                    'link': result.get('link', '')  # URL quando disponível
+                }
+            ))
+    return docs
+
+def dividir_documentos(docs):
+    """
+    Divide documentos longos em pedaços menores (chunks).
+    
+    Chunks menores são melhor processados pelo modelo de embeddings.
+    
+    Args:
+        docs (list): Documentos do LangChain
+        
+    Returns:
+        list: Chunks, cada um com os metadados do documento de origem
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter  # Divide textos longos em chunks
+    
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,     # Tamanho máximo de cada chunk
+        chunk_overlap=200    # Sobreposição entre chunks para manter contexto
+    )
+    return splitter.split_documents(docs)
+
+def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str, processo: str, uf: str,
+                         forcar_atualizacao: bool = False, resultados_planejados: dict = None,
+                         vectorstore=None, cache_llm: "CacheRespostasLLM" = None,
+                         compartilhadas: ExecucaoUnica = None, etapas: LimitesPorEtapa = None):
     """
     Implementa um sistema RAG (Retrieval-Augmented Generation) aprimorado.
     
@@ -336,6 +1036,15 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
         titular (str): Nome da empresa
         processo (str): Número do processo
         uf (str): Estado
+        forcar_atualizacao (bool): Se True, refaz as buscas ignorando o cache
+        resultados_planejados (dict): Resultados de busca já obtidos por planejar_buscas
+        vectorstore (Chroma): Coleção persistente onde os trechos são indexados;
+            se None, cria uma base vetorial temporária em memória
+        cache_llm (CacheRespostasLLM): Cache das respostas do LLM (None = sem cache)
+        compartilhadas (ExecucaoUnica): Buscas compartilhadas com os outros processos
+        etapas (LimitesPorEtapa): Limites de concorrência das etapas "busca",
+            "embeddings", "indexacao" e "geracao" quando vários processos
+            são analisados ao mesmo tempo (None = sem limites)
         
     Returns:
         dict: Dicionário com resumo, fontes e descobertas relevantes
@@ -346,10 +1055,19 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
     3. Usa o LLM para analisar e resumir com base no contexto
     4. Extrai e organiza as fontes citadas
     """
+    # Vectorstore, template e cadeia de QA (importados só na análise com IA)
+    from langchain_community.vectorstores import Chroma
+    from langchain.chains import RetrievalQA  # Chain para Question-Answering com recuperação
+    from langchain.prompts import PromptTemplate  # Template para prompts estruturados
+    from cache_ia import EmbeddingsComCache  # Embeddings antecipados, em lotes entre processos
+    
     print(f"\n🔍 Analisando: {processo} - {titular} ({uf})")
+    etapas = etapas or LimitesPorEtapa({})
     
     # Executa busca aprimorada com todas as estratégias
-    search_results = enhanced_search(titular, processo, uf, search_tool)
+    with etapas.etapa("busca"), INSTRUMENTACAO.etapa("busca"):
+        search_results = enhanced_search(titular, processo, uf, search_tool, forcar_atualizacao,
+                                         resultados_planejados, compartilhadas)
     
     # Verifica se encontrou resultados
     if not search_results:
@@ -360,27 +1078,7 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
         }
     
     # === CRIAÇÃO DE DOCUMENTOS PARA O RAG ===
-    docs = []  # Lista de documentos LangChain
-    source_mapping = {}  # Mapeia IDs para resultados originais
-    
-    # Converte cada resultado de busca em um Document do LangChain
-    for idx, result in enumerate(search_results):
-        content = result.get('content', '')
-        if content:
-            doc_id = f"doc_{idx}"  # ID único para o documento
-            
-            # Cria documento com metadados completos
-            docs.append(Document(
-                page_content=content,  # Conteúdo textual
-                metadata={
-                    'doc_id': doc_id,
-                    'source': result.get('link', result.get('source', 'Fonte não especificada')),
-                    'title': result.get('title', ''),
-                    'query': result.get('query', ''),
-                    'link': result.get('link', '')  # URL quando disponível
-                }
-            ))
-            source_mapping[doc_id] = result
+    docs = criar_documentos(search_results)
     
     # Verifica se há documentos para processar
     if not docs:
@@ -391,17 +1089,33 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
         }
     
     # === DIVISÃO DE DOCUMENTOS EM CHUNKS ===
-    # Documentos muito longos são divididos em pedaços menores
-    # para melhor processamento pelo modelo de embeddings
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,     # Tamanho máximo de cada chunk
-        chunk_overlap=200    # Sobreposição entre chunks para manter contexto
-    )
-    docs_split = splitter.split_documents(docs)
-    
-    # === CRIAÇÃO DA BASE VETORIAL ===
-    # Converte texto em vetores numéricos (embeddings) para busca semântica
-    vect = Chroma.from_documents(docs_split, embed_model)
+    docs_split = dividir_documentos(docs)
+    
+    # === EMBEDDINGS DOS TRECHOS NOVOS ===
+    # Converte texto em vetores numéricos (embeddings) para busca semântica.
+    # Os trechos ainda não indexados vão para o cache junto com os dos
+    # outros processos que chegam a esta etapa ao mesmo tempo (lotes cheios)
+    with etapas.etapa("embeddings"), INSTRUMENTACAO.etapa("embeddings"):
+        if vectorstore is not None:
+            preparado = preparar_indexacao(vectorstore, docs_split, processo, titular)
+            _, novos, existentes = preparado
+            textos = [doc.page_content for h, doc in novos.items() if h not in existentes]
+        else:
+            textos = [doc.page_content for doc in docs_split]
+        if isinstance(embed_model, EmbeddingsComCache):
+            embed_model.pre_calcular(textos)
+    
+    # === INDEXAÇÃO NA BASE VETORIAL ===
+    # Na coleção persistente, só trechos novos são indexados e a busca
+    # é restrita aos trechos deste processo/titular
+    with etapas.etapa("indexacao"), INSTRUMENTACAO.etapa("indexacao"):
+        INSTRUMENTACAO.contar("indexacao_trechos", len(docs_split))
+        if vectorstore is not None:
+            vect = vectorstore
+            search_kwargs = {"k": 8, "filter": indexar_documentos(vect, *preparado)}
+        else:
+            vect = Chroma.from_documents(docs_split, embed_model)
+            search_kwargs = {"k": 8}
     
     # === TEMPLATE DO PROMPT ===
     # Define como o LLM deve analisar e estruturar a resposta
@@ -446,7 +1160,7 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
     # RetrievalQA combina recuperação de documentos com geração de resposta
     qa_chain = RetrievalQA.from_chain_type(
         llm,  # Modelo Gemini
-        retriever=vect.as_retriever(search_kwargs={"k": 8}),  # Busca top-8 chunks mais relevantes
+        retriever=vect.as_retriever(search_kwargs=search_kwargs),  # Busca top-8 chunks mais relevantes
         chain_type="stuff",  # Método que passa todos os docs de uma vez
         chain_type_kwargs={
             "prompt": PROMPT,
@@ -457,9 +1171,35 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
     
     # === EXECUÇÃO DA ANÁLISE ===
     # Invoca a cadeia com a pergunta específica sobre o processo
-    resposta = qa_chain.invoke({
-        "query": f"Analise todas as informações sobre o processo {processo} da {titular}, especialmente impactos socioambientais"
-    })
+    pergunta = f"Analise todas as informações sobre o processo {processo} da {titular}, especialmente impactos socioambientais"
+    
+    # Conta as chamadas ao LLM e os tokens informados pelo modelo
+    config = {"callbacks": [contador_tokens_llm(INSTRUMENTACAO, INSTRUMENTACAO.processo_atual())]}
+    
+    # Erros 429 do LLM são repetidos com espera exponencial
+    retentativa = dict(max_tentativas=MAX_TENTATIVAS_LLM, backoff_base=BACKOFF_BASE_LLM,
+                       ao_rate_limit=lambda e: INSTRUMENTACAO.contar("llm_429"))
+    
+    with etapas.etapa("geracao"), INSTRUMENTACAO.etapa("geracao"):
+        if cache_llm is None:
+            resposta = executar_com_retentativa(qa_chain.invoke, {"query": pergunta},
+                                                config=config, **retentativa)
+        else:
+            # Recupera o contexto primeiro: se o mesmo prompt com os mesmos
+            # trechos já foi respondido, reaproveita a resposta guardada
+            docs_contexto = qa_chain.retriever.invoke(pergunta)
+            chave_llm = cache_llm.chave(llm, enhanced_prompt_template, pergunta, docs_contexto)
+            resposta = cache_llm.get(chave_llm)
+            INSTRUMENTACAO.contar("llm_cache_acertos" if resposta is not None else "llm_cache_faltas")
+            
+            if resposta is None:
+                # Mesma etapa de geração da RetrievalQA, com os trechos já recuperados
+                saida = executar_com_retentativa(qa_chain.combine_documents_chain.invoke, {
+                    "input_documents": docs_contexto,
+                    "question": pergunta
+                }, config=config, **retentativa)
+                resposta = {'result': saida['output_text'], 'source_documents': docs_contexto}
+                cache_llm.set(chave_llm, resposta)
     
     # === EXTRAÇÃO DE FONTES ÚNICAS ===
     # Processa os documentos citados para extrair URLs únicas
@@ -482,18 +1222,12 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
     
     # === PROCESSAMENTO DE DESCOBERTAS RELEVANTES ===
     # Identifica e pontua resultados com base em palavras-chave de impacto
+    # (PALAVRAS_CHAVE_RELEVANCIA, uma passada por resultado)
     raw_findings = []
     
-    # Palavras-chave que indicam potenciais impactos socioambientais
-    keywords = [
-        'terra indígena', 'conflito', 'ameaça', 'impacto', 'ambiental', 
-        'comunidade', 'protesto', 'multa', 'ação civil', 'ministério público',
-        'sobreposição', 'desmatamento', 'poluição', 'contaminação'
-    ]
-    
     # Analisa cada resultado e atribui pontuação de relevância
     for result in search_results:
-        content_lower = result.get('content', '').lower()
+        palavras = BUSCADOR_RELEVANCIA.encontrar(result.get('content', ''))
         
         # Sistema de pontuação
         score = 0
@@ -503,11 +1237,12 @@ def rag_summary_enhanced(query: str, search_tool, llm, embed_model, titular: str
             score += 10
             
         # +1 ponto para cada palavra-chave encontrada
-        score += sum(1 for keyword in keywords if keyword in content_lower)
+        score += len(palavras)
         
         # Adiciona apenas resultados com pontuação > 0
         if score > 0:
             result['relevance_score'] = score
+            result['palavras_chave'] = palavras  # Para auditoria da pontuação
             raw_findings.append(result)
     
     # Ordena por relevância (maior pontuação primeiro)
@@ -541,7 +1276,30 @@ def format_report_section(processo: str, data: dict, row_data: dict):
     # Informações básicas do processo
     section += f"**Titular:** {row_data[COL_TITULAR]}\n"
     section += f"**UF:** {row_data[COL_UF]}\n"
-    section += f"**Área:** {row_data['area_ha_calculada']:.2f} hectares\n\n"
+    section += f"**Área:** {row_data['area_ha_calculada']:.2f} hectares\n"
+    if row_data.get('geometria_reparada'):
+        section += "**Geometria:** inválida no SIGMINE, reparada antes do cálculo da área\n"
+    
+    # Dados cadastrais do SCM, quando disponíveis (ver SCM_DIR)
+    if row_data.get('substancias_scm'):
+        section += f"**Substâncias (SCM):** {row_data['substancias_scm']}\n"
+    if row_data.get('pessoas_scm'):
+        section += f"**Pessoas vinculadas (SCM):** {row_data['pessoas_scm']}\n"
+    if row_data.get('municipios_scm'):
+        section += f"**Municípios (SCM, código IBGE):** {row_data['municipios_scm']}\n"
+    
+    # Sobreposição calculada com as camadas locais (ver CAMADAS_SOBREPOSICAO)
+    for codigo, (nome_camada, _, _) in CAMADAS_SOBREPOSICAO.items():
+        area_sobreposta = row_data.get(f"sobreposicao_{codigo}_ha")
+        if area_sobreposta is None:
+            continue  # Camada não disponível nesta execução
+        if area_sobreposta > 0:
+            percentual = 100 * area_sobreposta / row_data['area_ha_calculada']
+            section += (f"**Sobreposição com {nome_camada}:** {area_sobreposta:.2f} hectares "
+                        f"({percentual:.1f}% do processo) – {row_data[f'sobreposicao_{codigo}_areas']}\n")
+        else:
+            section += f"**Sobreposição com {nome_camada}:** nenhuma\n"
+    section += "\n"
     
     # === RESUMO DA ANÁLISE ===
     section += "#### 📊 Análise do Contexto:\n"
@@ -609,17 +1367,435 @@ def format_report_section(processo: str, data: dict, row_data: dict):
     section += "\n---\n\n"
     return section
 
-def main():
+def format_titular_section(nome: str, data: dict, agregado=None):
+    """
+    Formata a seção do relatório com o perfil de um titular.
+    
+    Args:
+        nome (str): Nome da empresa
+        data (dict): Dados da análise (resumo e fontes)
+        agregado (Series): Números do titular em todos os processos lidos
+            (linha de titulares.agregar_titulares), se disponíveis
+        
+    Returns:
+        str: Seção formatada em Markdown
+    """
+    section = f"### {nome}\n\n"
+    
+    # Presença do titular no conjunto todo, não só no top-N
+    if agregado is not None:
+        section += f"**Processos:** {agregado['processos']}"
+        if 'area_total_ha' in agregado:
+            section += f" | **Área total:** {agregado['area_total_ha']:,.2f} ha"
+        section += f" | **UFs:** {agregado['ufs']}"
+        if pd.notna(agregado.get('raiz_cnpj')):
+            section += f" | **Raiz do CNPJ:** {agregado['raiz_cnpj']}"
+        section += "  \n"
+        if 'fases' in agregado:
+            section += f"**Fases:** {agregado['fases']}\n"
+        section += "\n"
+    
+    section += f"{data['summary'].strip()}\n\n"
+    
+    # Lista fontes consultadas
+    if data.get('sources'):
+        section += "**Fontes Consultadas:**\n"
+        seen_urls = set()  # Evita duplicatas
+        
+        for source in data['sources']:
+            url = source.get('url', '')
+            title = source.get('title', 'Fonte')
+            
+            if url and url not in seen_urls and url.startswith('http'):
+                seen_urls.add(url)
+                section += f"- [{title}]({url})\n"
+                
+    section += "\n---\n"
+    return section
+
+# Colunas dos CSVs de resultados e de descobertas (ver linhas_csv_processo)
+COLUNAS_CSV_RESULTADOS = [
+    'processo', 'chave_processo', 'titular', 'grupo_titular', 'uf', 'area_hectares',
+    'resumo_analise', 'possui_impacto_mencionado', 'termos_impacto_encontrados',
+    'num_fontes_consultadas', 'fontes_urls', 'data_analise', 'motor_busca',
+]
+COLUNAS_CSV_DESCOBERTAS = [
+    'processo', 'chave_processo', 'titular', 'conteudo_descoberta', 'fonte_url',
+    'titulo_fonte', 'query_busca', 'site_relevante', 'pontuacao_relevancia',
+    'palavras_chave_encontradas', 'motor_busca',
+]
+
+def colunas_opcionais_csv():
+    """Colunas do ranking copiadas para o CSV de resultados quando existem."""
+    for codigo in CAMADAS_SOBREPOSICAO:
+        yield f"sobreposicao_{codigo}_ha"
+        yield f"sobreposicao_{codigo}_areas"
+    yield from ('pessoas_scm', 'municipios_scm', 'substancias_scm')
+
+def colunas_csv(colunas_ranking) -> tuple:
+    """
+    Colunas dos CSVs de resultados e de descobertas, na ordem de linhas_csv_processo.
+    
+    As de sobreposição e do SCM entram só se existirem no ranking (camadas
+    e microdados disponíveis nesta execução).
+    
+    Args:
+        colunas_ranking: Colunas dos processos selecionados (top10.columns)
+        
+    Returns:
+        tuple: (colunas do CSV de resultados, colunas do CSV de descobertas)
+    """
+    opcionais = [c for c in colunas_opcionais_csv() if c in colunas_ranking]
+    return COLUNAS_CSV_RESULTADOS + opcionais + ['descobertas_relevantes'], list(COLUNAS_CSV_DESCOBERTAS)
+
+def linhas_csv_processo(cod: str, data: dict, termos_impacto: list):
+    """
+    Monta as linhas dos CSVs de resultados e de descobertas de um processo.
+    
+    Args:
+        cod (str): Número do processo
+        data (dict): Dados da análise, com 'row_data' (dados do shapefile)
+        termos_impacto (list): TERMOS_IMPACTO encontrados no resumo
+        
+    Returns:
+        tuple: (linha do CSV de resultados, linhas do CSV de descobertas)
+    """
+    row_info = data.get('row_data', {})
+    
+    # === EXTRAÇÃO DE URLs VÁLIDAS ===
+    # Tenta múltiplas fontes para garantir que captura URLs
+    urls_fontes = []
+    
+    # Primeiro tenta pegar das sources (fontes citadas)
+    for source in data.get('sources', []):
+        url = source.get('url', '')
+        if url and url.startswith('http'):
+            urls_fontes.append(url)
+    
+    # Se não encontrou, tenta nos raw_findings
+    if not urls_fontes:
+        for finding in data.get('raw_findings', []):
+            url = finding.get('link', '') or finding.get('source', '')
+            if url and url.startswith('http') and url not in urls_fontes:
+                urls_fontes.append(url)
+    
+    # === CONSTRUÇÃO DA LINHA DO CSV ===
+    csv_row = {
+        'processo': cod,
+        'chave_processo': row_info.get(COL_CHAVE, ''),
+        'titular': row_info.get(COL_TITULAR, ''),
+        'grupo_titular': row_info.get(COLUNA_GRUPO, ''),
+        'uf': row_info.get(COL_UF, ''),
+        'area_hectares': row_info.get('area_ha_calculada', 0),
+        'resumo_analise': data.get('summary', '').replace('\n', ' ').strip(),  # Remove quebras de linha
+        'possui_impacto_mencionado': 'Sim' if termos_impacto else 'Não',
+        'termos_impacto_encontrados': '; '.join(termos_impacto),
+        'num_fontes_consultadas': len(urls_fontes),
+        'fontes_urls': '; '.join(urls_fontes),  # Separa URLs com ponto-vírgula
+        'data_analise': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'motor_busca': SEARCH_ENGINE_USED
+    }
+    
+    # Sobreposição com as camadas locais e dados cadastrais do SCM,
+    # quando disponíveis
+    for coluna in colunas_opcionais_csv():
+        if coluna in row_info:
+            csv_row[coluna] = row_info[coluna]
+    
+    # === EXTRAÇÃO DE DESCOBERTAS RELEVANTES ===
+    # Pega os primeiros 200 caracteres das 3 descobertas mais relevantes
+    descobertas = []
+    for idx, finding in enumerate(data.get('raw_findings', [])[:3]):
+        descobertas.append(finding.get('content', '')[:200])
+    csv_row['descobertas_relevantes'] = ' | '.join(descobertas)  # Separa com pipe
+    
+    # === DESCOBERTAS DETALHADAS ===
+    # Todas as descobertas com impactos, não resumidas
+    descobertas_data = []
+    for finding in data.get('raw_findings', []):
+        # Extrai URL válida
+        url_encontrada = finding.get('link', '') or finding.get('source', '')
+        if not url_encontrada.startswith('http'):
+            url_encontrada = ''
+        
+        # Cria registro detalhado
+        descobertas_data.append({
+            'processo': cod,
+            'chave_processo': row_info.get(COL_CHAVE, ''),
+            'titular': row_info.get(COL_TITULAR, ''),
+            'conteudo_descoberta': finding.get('content', ''),  # Conteúdo completo
+            'fonte_url': url_encontrada,
+            'titulo_fonte': finding.get('title', ''),
+            'query_busca': finding.get('query', ''),  # Query que encontrou o resultado
+            'site_relevante': 'Sim' if finding.get('is_relevant_site', False) else 'Não',
+            'pontuacao_relevancia': finding.get('relevance_score', 0),
+            'palavras_chave_encontradas': '; '.join(finding.get('palavras_chave', [])),
+            'motor_busca': SEARCH_ENGINE_USED
+        })
+    
+    return csv_row, descobertas_data
+
+def executar_pipeline(analisar, tarefas, etapas: LimitesPorEtapa, desc: str, ao_concluir):
+    """
+    Analisa todas as tarefas ao mesmo tempo, respeitando os limites de cada etapa.
+    
+    Cada tarefa roda em sua própria thread; os limites por etapa (ver
+    LimitesPorEtapa) fazem com que as tarefas se sobreponham como numa
+    linha de montagem, e o tempo total fica próximo ao da etapa mais
+    lenta, e não à soma de todas.
+    
+    Os resultados não são acumulados: cada um é entregue a `ao_concluir`
+    assim que a tarefa termina e depois descartado, para que a memória
+    não cresça com a quantidade de tarefas.
+    
+    Args:
+        analisar (callable): Função aplicada a cada tarefa
+        tarefas (list): Tarefas a analisar
+        etapas (LimitesPorEtapa): Limites de concorrência de cada etapa
+        desc (str): Descrição da barra de progresso
+        ao_concluir (callable): Chamada com (posição da tarefa, resultado),
+            na ordem de conclusão
+    """
+    # Mais threads que vagas: quando uma etapa libera uma vaga, já há
+    # tarefas prontas esperando por ela
+    max_workers = max(1, min(len(tarefas), 2 * etapas.total()))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {executor.submit(analisar, tarefa): posicao
+                   for posicao, tarefa in enumerate(tarefas)}
+        for futuro in tqdm(as_completed(futuros), total=len(futuros), desc=desc):
+            # Interrompe na primeira tarefa com erro
+            ao_concluir(futuros.pop(futuro), futuro.result())
+
+def ranquear_processos(rotulo_selecao: str):
+    """
+    Lê o SIGMINE e seleciona os processos e os titulares a analisar.
+    
+    Só a parte geoespacial e tabular (sem IA e sem rede): leitura do
+    shapefile, sobreposição com áreas protegidas, dados do SCM, agregação
+    dos titulares e seleção dos top-N processos por área. Grava
+    RANKING_FILENAME, a lista de sobreposições e a de titulares agregados.
+    
+    Args:
+        rotulo_selecao (str): Nome da seleção nas mensagens ("Top-10" ou "lote")
+        
+    Returns:
+        tuple ou None: (top10, titulares_perfil), ou None se a leitura falhar
+    """
+    # === ETAPA 1: LEITURA E PROCESSAMENTO DO SHAPEFILE ===
+    print(f"\n📁 1. Lendo shapefile de: {SHAPEFILE_PATH}")
+    try:
+        # Lê o shapefile usando GeoPandas, com as áreas já calculadas
+        # Na primeira execução o shapefile é convertido para GeoParquet,
+        # reprojetado para SIRGAS 2000 / Brazil Polyconic (EPSG:5880)
+        # e tem a área em hectares calculada ('area_ha_calculada').
+        # Nas execuções seguintes, se o shapefile não mudou, tudo isso
+        # é lido direto do cache em poucos segundos
+        # Só as colunas e os processos selecionados acima são carregados
+        with INSTRUMENTACAO.etapa("leitura_sigmine"):
+            sig = carregar_sigmine(
+                SHAPEFILE_PATH,
+                cache_dir=CACHE_DIR,
+                usar_cache=USAR_CACHE,
+                colunas=COLUNAS_LEITURA,
+                uf=FILTRO_UF,
+                fase=FILTRO_FASE,
+                substancia=FILTRO_SUBSTANCIA,
+                bbox=FILTRO_BBOX,
+                processo=FILTRO_PROCESSOS,
+                titular=FILTRO_TITULAR,
+                # Sem cache, a área é calculada depois só para os candidatos ao top-N
+                calcular_area=False,
+                workers=WORKERS_GEO,
+                modo_area=MODO_AREA,
+            )
+    except Exception as e:
+        # Tratamento de erros na leitura do shapefile
+        # Erros comuns: arquivo não encontrado, formato inválido, colunas faltando
+        print(f"❌ ERRO CRÍTICO ao ler o shapefile: {e}")
+        return None  # Sem os dados, não há o que analisar
+    print("   ✅ Shapefile lido com sucesso.")
+    
+    # Polígonos inválidos (ex: autointerseção) são reparados na leitura,
+    # uma única vez: com o cache, a geometria reparada já vem do GeoParquet
+    if sig.get("geometria_reparada", pd.Series(dtype=bool)).any():
+        print(f"   🩹 {int(sig['geometria_reparada'].sum())} geometrias inválidas reparadas "
+              f"(coluna 'geometria_reparada')")
+    
+    # === SOBREPOSIÇÃO COM TERRAS INDÍGENAS E UNIDADES DE CONSERVAÇÃO ===
+    # Cruzamento geométrico de todos os processos lidos com as camadas
+    # locais (índice espacial, em lotes e em paralelo). Acrescenta as
+    # colunas 'sobreposicao_{código}_ha' e 'sobreposicao_{código}_areas'
+    try:
+        with INSTRUMENTACAO.etapa("sobreposicao"):
+            sobreposicoes = adicionar_sobreposicoes(sig, CAMADAS_SOBREPOSICAO,
+                                                    workers=WORKERS_GEO, modo_area=MODO_AREA)
+    except Exception as e:
+        # As camadas são complementares: sem elas, a análise segue sem as
+        # colunas de sobreposição (inclusive as de camadas já cruzadas)
+        print(f"   ⚠️ Erro no cruzamento com as áreas protegidas; análise segue sem "
+              f"as sobreposições: {e}")
+        sig = sig.drop(columns=[c for c in sig.columns if c.startswith("sobreposicao_")])
+        sobreposicoes = pd.DataFrame()
+    if not sobreposicoes.empty:
+        # Lista completa das sobreposições (todos os processos, não só o top-N)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        sobreposicoes_filename = os.path.join(OUTPUT_DIR, "sobreposicoes_areas_protegidas.csv")
+        sobreposicoes = sig.loc[sobreposicoes["indice"], [COL_PROCESSO, COL_CHAVE, COL_TITULAR, COL_UF]] \
+            .reset_index(drop=True).join(sobreposicoes.drop(columns="indice"))
+        sobreposicoes.to_csv(sobreposicoes_filename, index=False, encoding='utf-8-sig')
+        print(f"   🗺️ {sobreposicoes[COL_PROCESSO].nunique()} processos sobrepostos a áreas "
+              f"protegidas. Lista salva em: '{sobreposicoes_filename}'")
+    
+    # === DADOS CADASTRAIS DO SCM ===
+    # Pessoas (com CPF/CNPJ), municípios e substâncias de cada processo.
+    # Os .txt do SCM são convertidos para Parquet na primeira execução;
+    # nas seguintes, as junções são lidas direto do cache
+    try:
+        with INSTRUMENTACAO.etapa("leitura_scm"):
+            scm = carregar_scm(SCM_DIR, cache_dir=CACHE_DIR, usar_cache=USAR_CACHE)
+    except Exception as e:
+        # O SCM é complementar: sem ele, os titulares são agrupados só pelo
+        # nome e os processos ficam sem pessoas, municípios e substâncias
+        print(f"   ⚠️ Erro ao ler os dados do SCM em '{SCM_DIR}'; análise segue sem eles: {e}")
+        scm = None
+    
+    # === AGREGAÇÃO DOS TITULARES ===
+    # Todos os processos lidos (não só o top-N) são agrupados por titular,
+    # juntando variantes do nome e, com o SCM, a raiz do CNPJ. Acrescenta
+    # a cada processo a coluna 'grupo_titular'
+    # Sem o cache, a área calculada ainda não existe: usa a declarada
+    col_area = next((c for c in ("area_ha_calculada", COL_AREA_DECLARADA) if c in sig.columns), None)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    try:
+        with INSTRUMENTACAO.etapa("agregacao_titulares"):
+            titulares = agregar_titulares(
+                sig, COL_TITULAR, COL_UF,
+                col_fase=COL_FASE if COL_FASE in sig.columns else None,
+                col_area=col_area, col_chave=COL_CHAVE, scm=scm,
+            )
+        titulares_filename = os.path.join(OUTPUT_DIR, "titulares_agregados.csv")
+        titulares.to_csv(titulares_filename, encoding='utf-8-sig')
+        print(f"   🏢 {len(titulares)} titulares agregados ({sig[COL_TITULAR].nunique()} grafias "
+              f"do nome). Lista salva em: '{titulares_filename}'")
+    except Exception as e:
+        # Os processos continuam sendo analisados; só o perfil dos
+        # titulares recorrentes fica de fora
+        print(f"   ⚠️ Erro na agregação dos titulares; análise segue sem o perfil dos titulares: {e}")
+        titulares = None
+    
+    # === SELEÇÃO DOS TOP-10 PROCESSOS ===
+    # Seleciona os N_TOP maiores processos minerários por área
+    # Isso foca a análise nos processos mais significativos
+    # Se a área não veio do cache, ela é calculada apenas para os
+    # processos que ainda podem entrar no top (pelo tamanho do bbox)
+    # Com N_TOP = None, todos os processos lidos são analisados
+    with INSTRUMENTACAO.etapa("selecao_top_n"):
+        top10 = selecionar_top_n(sig, N_TOP, "area_ha_calculada",
+                                 workers=WORKERS_GEO, modo_area=MODO_AREA)
+    
+    # Dados do SCM de cada processo selecionado
+    if scm is not None:
+        try:
+            top10 = top10.join(resumo_scm(scm, top10[COL_CHAVE]), on=COL_CHAVE)
+            print(f"   📇 Dados do SCM anexados aos processos do {rotulo_selecao}.")
+        except Exception as e:
+            print(f"   ⚠️ Erro ao anexar os dados do SCM aos processos; análise segue sem eles: {e}")
+    
+    # === TITULARES QUE RECEBEM O PERFIL COM IA ===
+    # Entre os titulares do top-N, os de maior presença no conjunto todo
+    # (mais processos e maior área total), pelos números agregados
+    # (nenhum, se a agregação falhou)
+    titulares_perfil = pd.DataFrame(columns=["titular"])
+    if titulares is not None and COLUNA_GRUPO in top10.columns:
+        titulares_perfil = selecionar_titulares_perfil(
+            titulares, top10[COLUNA_GRUPO].unique(),
+            min_processos=MIN_PROCESSOS_PERFIL_TITULAR,
+            max_titulares=MAX_TITULARES_PERFIL,
+        )
+
+    # === EXIBIÇÃO DOS RESULTADOS PRELIMINARES ===
+    print(f"\n📊 Processos do {rotulo_selecao} por área (em hectares):")
+    # Mostra tabela com colunas selecionadas (só o início, em lotes grandes)
+    print(top10[[COL_PROCESSO, "area_ha_calculada", COL_TITULAR, COL_UF]]
+          .head(MAX_LINHAS_TELA).to_string())
+    if len(top10) > MAX_LINHAS_TELA:
+        print(f"   ... e mais {len(top10) - MAX_LINHAS_TELA} processos")
+    
+    # Titulares escolhidos para o perfil, com os números agregados
+    if not titulares_perfil.empty:
+        print(f"\n🏢 Titulares do {rotulo_selecao} com perfil (números de todos os processos lidos):")
+        colunas_tela = [c for c in ("titular", "processos", "area_total_ha", "ufs", "fase_predominante")
+                        if c in titulares_perfil.columns]
+        print(titulares_perfil[colunas_tela].to_string(index=False, float_format="{:,.2f}".format))
+    
+    # Processos selecionados, com os dados do SCM e as sobreposições
+    # (sem a geometria), na ordem do ranking
+    top10.drop(columns=top10.geometry.name).to_csv(RANKING_FILENAME, index=False, encoding='utf-8-sig')
+    print(f"\n   📄 Ranking do {rotulo_selecao} salvo em: '{RANKING_FILENAME}'")
+    
+    return top10, titulares_perfil
+
+def configurar_ferramentas_ia():
     """
-    Função principal que orquestra todo o processo de análise.
+    Cria a busca, o LLM, os embeddings, os caches de IA e a coleção do Chroma.
+    
+    Returns:
+        tuple: (search_tool, llm, embed_model, cache_llm, vectorstore)
+    """
+    # Importados só aqui: carregam o LangChain (ver IMPORTAÇÕES DO LANGCHAIN)
+    from langchain_community.vectorstores import Chroma  # Vectorstore dos trechos
+    from cache_ia import EmbeddingsComCache, CacheRespostasLLM  # Cache dos embeddings e do LLM
+    
+    # Ferramenta de busca, LLM e embeddings (serviços reais ou substitutos
+    # locais, conforme BACKEND_BUSCA e BACKEND_IA)
+    search_tool, llm, embed_model = configurar_backends()
+    
+    # Envolve o modelo com o cache em disco: só textos nunca vistos
+    # são enviados à API de embeddings
+    if USAR_CACHE_EMBEDDINGS:
+        embed_model = EmbeddingsComCache(
+            embed_model,
+            CacheSQLite(CACHE_EMBEDDINGS_PATH, "embeddings",
+                        tamanho_max_bytes=TAMANHO_MAX_CACHE_EMBEDDINGS_MB * 1024 * 1024),
+            tamanho_lote=TAMANHO_LOTE_EMBEDDINGS,
+            concorrencia=LOTES_EMBEDDINGS_CONCORRENTES,
+            bucket=TokenBucket(*LIMITE_EMBEDDINGS),
+            instrumentacao=INSTRUMENTACAO,
+            espera_lote=ESPERA_LOTE_EMBEDDINGS,
+        )
+    
+    # Cache das respostas do Gemini
+    cache_llm = None
+    if USAR_CACHE_LLM:
+        cache_llm = CacheRespostasLLM(
+            CacheSQLite(CACHE_LLM_PATH, "respostas_llm",
+                        tamanho_max_bytes=TAMANHO_MAX_CACHE_LLM_MB * 1024 * 1024)
+        )
+    
+    # Coleção persistente do Chroma, compartilhada por todos os processos
+    vectorstore = Chroma(
+        collection_name=CHROMA_COLECAO,
+        embedding_function=embed_model,
+        persist_directory=CHROMA_DIR,
+    )
+    return search_tool, llm, embed_model, cache_llm, vectorstore
+
+def executar_analise(comando: str = "analyze"):
+    """
+    Orquestra todo o processo de análise (chamada por main).
     
     Esta função coordena todas as etapas do pipeline:
     1. Leitura do shapefile
-    2. Seleção dos top-10 processos por área
+    2. Seleção dos top-N processos por área
     3. Busca de informações na web
     4. Análise com IA
     5. Geração de relatórios
     
+    Args:
+        comando (str): "analyze" (todas as etapas), "rank" (só 1 e 2, sem
+            IA e sem rede) ou "report" (1, 2 e 5, com as análises já
+            registradas no checkpoint, sem buscas nem IA)
+    
     O fluxo é projetado para ser robusto, com tratamento de erros
     e feedback visual do progresso.
     """
@@ -627,145 +1803,208 @@ def main():
     print("🚀 INICIANDO ANÁLISE APRIMORADA DE CONTEXTO SIGMINE")
     print("=" * 60)
 
-    # === ETAPA 1: LEITURA E PROCESSAMENTO DO SHAPEFILE ===
-    try:
-        print(f"\n📁 1. Lendo shapefile de: {SHAPEFILE_PATH}")
-        
-        # Lê o shapefile usando GeoPandas
-        # GeoPandas estende pandas para trabalhar com dados geoespaciais
-        sig = gpd.read_file(SHAPEFILE_PATH)
-        print("   ✅ Shapefile lido com sucesso.")
-
-        # === REPROJEÇÃO DO SISTEMA DE COORDENADAS ===
-        # Converte para SIRGAS 2000 / Brazil Polyconic (EPSG:5880)
-        # Isso é necessário para calcular áreas em metros quadrados
-        # Sistemas de coordenadas geográficas (lat/lon) não permitem
-        # cálculos de área precisos
-        sig = sig.to_crs(5880)
-        
-        # === CÁLCULO DA ÁREA EM HECTARES ===
-        # GeoPandas calcula área em m² para projeções métricas
-        # Dividimos por 10.000 para converter m² em hectares
-        sig["area_ha_calculada"] = sig.area / 10_000
-        
-        # === SELEÇÃO DOS TOP-10 PROCESSOS ===
-        # Seleciona os 10 maiores processos minerários por área
-        # Isso foca a análise nos processos mais significativos
-        top10 = sig.nlargest(10, "area_ha_calculada").copy()
-        
-        # === ANÁLISE DE FREQUÊNCIA DE TITULARES ===
-        # Identifica empresas que aparecem múltiplas vezes no top-10
-        # Isso pode indicar grandes players no setor
-        freq = (top10.groupby([COL_TITULAR], as_index=False)
-                    .size()  # Conta ocorrências
-                    .sort_values("size", ascending=False))  # Ordena por frequência
-        
-        # Filtra apenas titulares com mais de uma ocorrência
-        freq_mais_1 = freq.query("size > 1")
-
-        # === EXIBIÇÃO DOS RESULTADOS PRELIMINARES ===
-        print("\n📊 Top-10 processos por área (em hectares):")
-        # Mostra tabela com colunas selecionadas
-        print(top10[[COL_PROCESSO, "area_ha_calculada", COL_TITULAR, COL_UF]].to_string())
-        
-        # Se houver titulares repetidos, mostra
-        if not freq_mais_1.empty:
-            print("\n🏢 Titulares que aparecem mais de uma vez no Top-10:")
-            print(freq_mais_1.to_string())
+    # Nome da seleção nas mensagens e no relatório ("Top-10" ou "lote")
+    rotulo_selecao = f"Top-{N_TOP}" if N_TOP is not None else "lote"
 
-    except Exception as e:
-        # Tratamento de erros na leitura do shapefile
-        # Erros comuns: arquivo não encontrado, formato inválido, colunas faltando
-        print(f"❌ ERRO CRÍTICO ao ler ou processar o shapefile: {e}")
+    # === ETAPAS 1 E 2: LEITURA DO SHAPEFILE E SELEÇÃO DOS PROCESSOS ===
+    ranking = ranquear_processos(rotulo_selecao)
+    if ranking is None:
         return  # Encerra o programa se não conseguir ler os dados
+    top10, titulares_perfil = ranking
+    
+    if comando == "rank":
+        print("\n🎉 RANKING CONCLUÍDO (sem busca na web e sem IA)")
+        return
+    
+    # "report" regrava o relatório só com o que está no checkpoint
+    global SEARCH_ENGINE_USED, MODELO_IA_USADO
+    gerar_com_ia = comando == "analyze"
+    if not gerar_com_ia and not (USAR_CHECKPOINT and os.path.exists(CHECKPOINT_PATH)):
+        print(f"❌ Nenhuma análise registrada em '{CHECKPOINT_PATH}'. "
+              f"Rode antes: python main.py analyze")
+        return
 
-    # === ETAPA 2: CONFIGURAÇÃO DAS FERRAMENTAS DE IA ===
-    print("\n🤖 2. Configurando ferramentas de IA e busca...")
-    
-    # Configura ferramenta de busca (Google ou DuckDuckGo)
-    search_tool = setup_search_tool()
-    
-    # === CONFIGURAÇÃO DO MODELO GEMINI ===
-    # Gemini 2.5 Pro: modelo mais recente e capaz do Google
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",  # Versão do modelo
-        temperature=0.1,         # Baixa temperatura = respostas mais consistentes
-        max_output_tokens=2048   # Limite de tokens na resposta
-    )
-    
-    # Modelo de embeddings para vetorização de texto
-    # Usado para busca semântica nos documentos
-    embed_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-
-    # === ETAPA 3: BUSCA E ANÁLISE DE CONTEXTO EXTERNO ===
-    print("\n🔍 3. Iniciando busca aprimorada de contexto externo...")
-    print("   Isso pode levar alguns minutos...")
-    
-    # Dicionário para armazenar contexto de cada processo
-    contexto_proc = {}
-    
-    # === LOOP PRINCIPAL: ANÁLISE DE CADA PROCESSO ===
-    # tqdm cria uma barra de progresso visual
-    for _, row in tqdm(top10.iterrows(), total=len(top10), desc="Analisando Processos Top-10"):
-        # Extrai dados do processo atual
-        cod = row[COL_PROCESSO]      # Ex: "803237/2022"
-        titular = row[COL_TITULAR]   # Ex: "VALE S.A."
-        uf = row[COL_UF]            # Ex: "PA"
-        
-        # Query inicial simplificada
-        # Não precisa ser complexa pois enhanced_search fará variações
-        busca_inteligente = f'"{titular}" {uf}'
-        
-        # Executa análise RAG completa para o processo
-        contexto_proc[cod] = rag_summary_enhanced(
-            busca_inteligente,  # Query base
-            search_tool,        # Ferramenta de busca
-            llm,               # Modelo Gemini
-            embed_model,       # Modelo de embeddings
-            titular,           # Nome da empresa
-            cod,               # Número do processo
-            uf                 # Estado
-        )
-        
-        # Adiciona dados originais do shapefile (convertidos para dict)
-        # Necessário para serialização posterior
-        contexto_proc[cod]['row_data'] = row.to_dict()
-
-    # === ETAPA 4: ANÁLISE DE TITULARES RECORRENTES ===
-    # Se houver empresas que aparecem múltiplas vezes
-    contexto_emp = {}
-    if not freq_mais_1.empty:
-        print("\n🏢 4. Analisando perfil de titulares recorrentes...")
+    if gerar_com_ia:
+        # === CONFIGURAÇÃO DAS FERRAMENTAS DE IA ===
+        print("\n🤖 2. Configurando ferramentas de IA e busca...")
+        search_tool, llm, embed_model, cache_llm, vectorstore = configurar_ferramentas_ia()
         
-        # Análise específica para cada empresa recorrente
-        for _, row in tqdm(freq_mais_1.iterrows(), total=len(freq_mais_1), desc="Analisando Titulares"):
-            nome = row[COL_TITULAR]
-            
+        # === ETAPA 3: BUSCA E ANÁLISE DE CONTEXTO EXTERNO ===
+        print("\n🔍 3. Iniciando busca aprimorada de contexto externo...")
+        print("   Isso pode levar alguns minutos...")
+    else:
+        # Sem as buscas desta execução, o motor e o modelo usados nas
+        # análises do checkpoint não são conhecidos
+        SEARCH_ENGINE_USED = MODELO_IA_USADO = "não informado (relatório regravado do checkpoint)"
+        print("\n📂 3. Relendo as análises registradas no checkpoint (sem buscas e sem IA)...")
+    
+    # === PLANEJAMENTO DAS BUSCAS ===
+    # Reúne as buscas de todos os processos e dos titulares escolhidos,
+    # para que buscas repetidas (ex: mesmo titular em vários processos)
+    # sejam feitas uma única vez e compartilhadas
+    # Processos a atualizar são comparados pela chave, em qualquer formato
+    chaves_atualizar = set(chave_processo(ATUALIZAR_BUSCAS)) - {CHAVE_INVALIDA}
+    tarefas_busca = [
+        (row[COL_TITULAR], row[COL_PROCESSO], row[COL_UF], row[COL_CHAVE] in chaves_atualizar)
+        for _, row in top10.iterrows()
+    ] + [
+        (nome, "Perfil Empresarial", "Brasil", nome in ATUALIZAR_BUSCAS)
+        for nome in titulares_perfil["titular"]
+    ]
+    
+    # === CHECKPOINT: ANÁLISES JÁ CONCLUÍDAS ===
+    # Numa execução retomada, as análises já registradas são reaproveitadas
+    # e só as pendentes passam pelas buscas e pelo pipeline
+    # Cada análise é identificada pela chave int64 do processo (o número do
+    # processo em texto fica só para exibição) ou pelo grupo do titular
+    # (ex: "CNPJ:33592510"); processos sem número válido usam o texto
+    checkpoint = CheckpointJSONL(CHECKPOINT_PATH) if USAR_CHECKPOINT else None
+    chaves_checkpoint = [
+        int(row[COL_CHAVE]) if row[COL_CHAVE] != CHAVE_INVALIDA else row[COL_PROCESSO]
+        for _, row in top10.iterrows()
+    ] + list(titulares_perfil.index)
+    pendentes = [
+        i for i, (chave, tarefa) in enumerate(zip(chaves_checkpoint, tarefas_busca))
+        # Processos marcados para atualização são sempre refeitos (no "report",
+        # a análise registrada entra no relatório mesmo assim)
+        if checkpoint is None or (gerar_com_ia and tarefa[3]) or not checkpoint.concluido(chave)
+    ]
+    if checkpoint is not None:
+        print(f"   Checkpoint {CHECKPOINT_PATH}: {len(tarefas_busca) - len(pendentes)} "
+              f"análises já concluídas, {len(pendentes)} pendentes")
+    
+    # === ANÁLISE DOS PENDENTES (só no "analyze") ===
+    if gerar_com_ia:
+        with INSTRUMENTACAO.etapa("planejamento_buscas"):
+            resultados_busca, usos_buscas = planejar_buscas(
+                [tarefas_busca[i] for i in pendentes], search_tool)
+    
+        # Buscas feitas durante as análises, compartilhadas entre os processos.
+        # Com o cache em disco, um resultado sai da memória assim que nenhum
+        # processo espera por ele (as repetições seguintes vêm do cache); sem
+        # o cache, fica até o último processo que o pede, conforme o plano
+        buscas_compartilhadas = ExecucaoUnica(None if USAR_CACHE_BUSCA else usos_buscas)
+        etapas = LimitesPorEtapa(LIMITES_ETAPAS)
+    
+        # === PIPELINE: ANÁLISE DOS PROCESSOS E DOS TITULARES RECORRENTES ===
+        # Processos e titulares passam juntos pelo mesmo pipeline
+        # (busca -> indexação -> geração), vários ao mesmo tempo
+        print(f"   {len(top10)} processos e {len(titulares_perfil)} titulares, "
+              f"etapas simultâneas: {LIMITES_ETAPAS}")
+    
+        # Query inicial de cada análise (as variações são montadas por enhanced_search)
+        buscas_iniciais = [
+            f'"{row[COL_TITULAR]}" {row[COL_UF]}'
+            for _, row in top10.iterrows()
+        ] + [
             # Busca mais ampla sobre o perfil da empresa
-            busca_empresa = f'"{nome}" mineradora perfil ambiental conflitos comunidades indígenas'
-            
-            contexto_emp[nome] = rag_summary_enhanced(
-                busca_empresa,
-                search_tool,
-                llm,
-                embed_model,
-                nome,
-                "Perfil Empresarial",  # Tipo genérico
-                "Brasil"               # UF genérica
-            )
-
-    # === ETAPA 5: GERAÇÃO DO RELATÓRIO FINAL ===
-    print("\n📝 5. Gerando relatório final aprimorado...")
+            f'"{nome}" mineradora perfil ambiental conflitos comunidades indígenas'
+            for nome in titulares_perfil["titular"]
+        ]
+    
+        def analisar(i):
+            busca_inicial, (titular, processo, uf, forcar) = buscas_iniciais[i], tarefas_busca[i]
+            # Medições atribuídas ao processo; "analise" inclui a espera por vaga nas etapas
+            with INSTRUMENTACAO.processo(chaves_checkpoint[i]), INSTRUMENTACAO.etapa("analise"):
+                analise = rag_summary_enhanced(
+                    busca_inicial,     # Query base
+                    search_tool,       # Ferramenta de busca
+                    llm,               # Modelo Gemini
+                    embed_model,       # Modelo de embeddings
+                    titular,           # Nome da empresa
+                    processo,          # Número do processo (ou "Perfil Empresarial")
+                    uf,                # Estado (ou "Brasil")
+                    # Refaz as buscas se o processo/titular foi marcado para atualização
+                    forcar_atualizacao=forcar,
+                    # Resultados já obtidos no planejamento das buscas
+                    resultados_planejados=resultados_busca,
+                    vectorstore=vectorstore,
+                    cache_llm=cache_llm,
+                    compartilhadas=buscas_compartilhadas,
+                    etapas=etapas
+                )
+            # Grava assim que termina: uma falha mais adiante não perde esta análise
+            if checkpoint is not None:
+                checkpoint.registrar(chaves_checkpoint[i], analise)
+            return analise
+    
+    # === ETAPA 4/5: GRAVAÇÃO INCREMENTAL DO RELATÓRIO E DOS CSVs ===
+    # Cada análise é gravada em disco assim que chega a sua vez (na ordem do
+    # top-N), em vez de o relatório inteiro ser montado na memória no fim.
+    # Enquanto a execução roda, os arquivos ficam com a extensão ".parcial"
+    print("\n📝 Gravando relatório e CSVs à medida que as análises terminam...")
     
     # Cria diretório de saída se não existir
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
-    # === CONSTRUÇÃO DO RELATÓRIO MARKDOWN ===
     # Markdown é escolhido por ser legível, versionável e convertível
-    relatorio_md = f"""# 📊 Relatório SIGMINE – Análise Aprimorada de Contexto com IA
+    relatorio = MarkdownIncremental(REPORT_FILENAME, partes=("processos", "titulares"))
+    csv_filename = os.path.join(OUTPUT_DIR, "analise_sigmine_resultados.csv")
+    descobertas_filename = os.path.join(OUTPUT_DIR, "descobertas_impactos_detalhadas.csv")
+    # Colunas fixas, as mesmas em todas as linhas
+    colunas_resultados, colunas_descobertas = colunas_csv(top10.columns)
+    csv_resultados = CSVIncremental(csv_filename, colunas_resultados)
+    csv_descobertas = CSVIncremental(descobertas_filename, colunas_descobertas)
+    
+    # === SEÇÃO 1: ANÁLISE DETALHADA DOS PROCESSOS ===
+    relatorio.escrever("processos", f"\n---\n\n## 📋 1. Análise Detalhada dos Processos do {rotulo_selecao}\n\n")
+    
+    # Só os códigos dos processos com impacto ficam na memória (para o resumo executivo)
+    processos_com_impacto = []
+    
+    def gravar_analise(i, analise):
+        if i < len(top10):
+            row = top10.iloc[i]
+            cod = row[COL_PROCESSO]
+            # Adiciona dados originais do shapefile (convertidos para dict)
+            data = {**analise, 'row_data': row.to_dict()}
+            
+            # Procura os TERMOS_IMPACTO no resumo do processo
+            termos = BUSCADOR_IMPACTO.encontrar(data['summary'])
+            if termos:
+                processos_com_impacto.append(cod)
+            
+            relatorio.escrever("processos", format_report_section(cod, data, data['row_data']))
+            csv_row, descobertas_data = linhas_csv_processo(cod, data, termos)
+            csv_resultados.escrever([csv_row])
+            csv_descobertas.escrever(descobertas_data)
+        else:
+            # === SEÇÃO 2: PERFIL DOS PRINCIPAIS TITULARES ===
+            if i == len(top10):
+                relatorio.escrever("titulares", "\n## 🏢 2. Perfil dos Principais Titulares\n\n")
+            agregado = titulares_perfil.iloc[i - len(top10)]
+            relatorio.escrever("titulares", format_titular_section(agregado["titular"], analise, agregado))
+    
+    # As análises concluídas em paralelo chegam fora de ordem; o emissor as
+    # grava na ordem das tarefas (o relatório sai sempre igual)
+    emissor = EmissorOrdenado(gravar_analise)
+    
+    # Análises do checkpoint entram primeiro, lidas uma a uma do disco
+    if checkpoint is not None:
+        conjunto_pendentes = set(pendentes)
+        for i, chave in enumerate(chaves_checkpoint):
+            if i not in conjunto_pendentes:
+                emissor.entregar(i, checkpoint.obter(chave))
+    
+    if gerar_com_ia:
+        with INSTRUMENTACAO.etapa("pipeline_analises"):
+            executar_pipeline(analisar, pendentes, etapas,
+                              desc=f"Analisando Processos do {rotulo_selecao} e Titulares",
+                              ao_concluir=lambda posicao, analise: emissor.entregar(pendentes[posicao], analise))
+    else:
+        # Processos ainda sem análise aparecem no relatório como pendentes
+        for i in pendentes:
+            emissor.entregar(i, dict(ANALISE_PENDENTE))
+    
+    # === ETAPA 5: FINALIZAÇÃO DO RELATÓRIO ===
+    print("\n📝 5. Finalizando relatório aprimorado...")
+    
+    # === CABEÇALHO E RESUMO EXECUTIVO ===
+    # Escritos por último, pois dependem de todas as análises
+    cabecalho = f"""# 📊 Relatório SIGMINE – Análise Aprimorada de Contexto com IA
     
 **Data de Geração:** {datetime.now().strftime('%d/%m/%Y às %H:%M')}  
-**Modelo IA:** Google Gemini  
+**Modelo IA:** {MODELO_IA_USADO}  
 **Processos Analisados:** {len(top10)}  
 
 ---
@@ -779,67 +2018,34 @@ sobreposições com terras indígenas e conflitos com comunidades.
 ### ⚠️ Alertas Principais:
 """
     
-    # === IDENTIFICAÇÃO DE PROCESSOS COM IMPACTOS ===
-    # Analisa o resumo de cada processo procurando palavras-chave
-    processos_com_impacto = []
-    for cod, data in contexto_proc.items():
-        summary_lower = data['summary'].lower()
-        
-        # Palavras que indicam potenciais impactos
-        termos_impacto = ['terra indígena', 'conflito', 'impacto', 'ameaça']
-        
-        # Se encontrar qualquer termo, marca como processo com impacto
-        if any(termo in summary_lower for termo in termos_impacto):
-            processos_com_impacto.append(cod)
-    
     # Adiciona alertas ao resumo executivo
     if processos_com_impacto:
-        relatorio_md += f"\n- **{len(processos_com_impacto)} processos** com possíveis impactos socioambientais identificados\n"
+        cabecalho += f"\n- **{len(processos_com_impacto)} processos** com possíveis impactos socioambientais identificados\n"
         
         # Lista os 3 primeiros como exemplo
         for proc in processos_com_impacto[:3]:
-            relatorio_md += f"  - Processo {proc}: Ver análise detalhada abaixo\n"
+            cabecalho += f"  - Processo {proc}: Ver análise detalhada abaixo\n"
     else:
-        relatorio_md += "\n- Nenhum impacto socioambiental significativo foi identificado nas fontes consultadas\n"
-    
-    # === SEÇÃO 1: ANÁLISE DETALHADA DOS PROCESSOS ===
-    relatorio_md += "\n---\n\n## 📋 1. Análise Detalhada dos Processos Top-10\n\n"
-    
-    # Adiciona uma seção para cada processo
-    for cod, data in contexto_proc.items():
-        relatorio_md += format_report_section(cod, data, data['row_data'])
-
-    # === SEÇÃO 2: PERFIL DOS TITULARES RECORRENTES ===
-    if contexto_emp:
-        relatorio_md += "\n## 🏢 2. Perfil dos Titulares Recorrentes\n\n"
-        
-        for nome, data in contexto_emp.items():
-            relatorio_md += f"### {nome}\n\n"
-            relatorio_md += f"{data['summary'].strip()}\n\n"
-            
-            # Lista fontes consultadas
-            if data.get('sources'):
-                relatorio_md += "**Fontes Consultadas:**\n"
-                seen_urls = set()  # Evita duplicatas
-                
-                for source in data['sources']:
-                    url = source.get('url', '')
-                    title = source.get('title', 'Fonte')
-                    
-                    if url and url not in seen_urls and url.startswith('http'):
-                        seen_urls.add(url)
-                        relatorio_md += f"- [{title}]({url})\n"
-                        
-            relatorio_md += "\n---\n"
+        cabecalho += "\n- Nenhum impacto socioambiental significativo foi identificado nas fontes consultadas\n"
+    
+    # Alertas de sobreposição geométrica (camadas locais, independentes das buscas)
+    for codigo, (nome_camada, _, _) in CAMADAS_SOBREPOSICAO.items():
+        coluna = f"sobreposicao_{codigo}_ha"
+        if coluna in top10.columns:
+            sobrepostos = top10.loc[top10[coluna] > 0, COL_PROCESSO].tolist()
+            if sobrepostos:
+                cabecalho += (f"- **{len(sobrepostos)} processos** sobrepostos a {nome_camada} "
+                              f"(cálculo geométrico): {', '.join(sobrepostos[:5])}\n")
 
     # === NOTAS METODOLÓGICAS ===
     # Importante para transparência e reprodutibilidade
-    relatorio_md += f"""
+    rodape = f"""
 ## 📌 Notas Metodológicas
 
 - **Fonte dos dados espaciais:** Shapefile SIGMINE
+- **Sobreposições:** calculadas geometricamente com as camadas locais de {', '.join(nome for nome, caminho, _ in CAMADAS_SOBREPOSICAO.values() if os.path.exists(caminho)) or 'nenhuma camada disponível'}
 - **Ferramentas de busca:** {SEARCH_ENGINE_USED}
-- **Modelo de IA:** Google Gemini 2.5
+- **Modelo de IA:** {MODELO_IA_USADO}
 - **Palavras-chave utilizadas:** mineração, impacto ambiental, terra indígena, conflito, comunidade
 
 ### 📄 Referências dos Documentos
@@ -865,103 +2071,112 @@ Para verificar a origem exata de cada citação:
 *Relatório gerado automaticamente por sistema de análise SIGMINE com IA*
 """
 
-    # === SALVAMENTO DO RELATÓRIO MARKDOWN ===
-    with open(REPORT_FILENAME, "w", encoding="utf-8") as f:
-        f.write(relatorio_md)
-
-    # === GERAÇÃO DO CSV DE RESULTADOS ===
-    # Cria estrutura tabular para análise em Excel/pandas
-    csv_data = []
-    
-    for cod, data in contexto_proc.items():
-        row_info = data.get('row_data', {})
-        
-        # === EXTRAÇÃO DE URLs VÁLIDAS ===
-        # Tenta múltiplas fontes para garantir que captura URLs
-        urls_fontes = []
-        
-        # Primeiro tenta pegar das sources (fontes citadas)
-        for source in data.get('sources', []):
-            url = source.get('url', '')
-            if url and url.startswith('http'):
-                urls_fontes.append(url)
-        
-        # Se não encontrou, tenta nos raw_findings
-        if not urls_fontes:
-            for finding in data.get('raw_findings', []):
-                url = finding.get('link', '') or finding.get('source', '')
-                if url and url.startswith('http') and url not in urls_fontes:
-                    urls_fontes.append(url)
-        
-        # === CONSTRUÇÃO DA LINHA DO CSV ===
-        csv_row = {
-            'processo': cod,
-            'titular': row_info.get(COL_TITULAR, ''),
-            'uf': row_info.get(COL_UF, ''),
-            'area_hectares': row_info.get('area_ha_calculada', 0),
-            'resumo_analise': data.get('summary', '').replace('\n', ' ').strip(),  # Remove quebras de linha
-            'possui_impacto_mencionado': 'Sim' if cod in processos_com_impacto else 'Não',
-            'num_fontes_consultadas': len(urls_fontes),
-            'fontes_urls': '; '.join(urls_fontes),  # Separa URLs com ponto-vírgula
-            'data_analise': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'motor_busca': SEARCH_ENGINE_USED
-        }
-        
-        # === EXTRAÇÃO DE DESCOBERTAS RELEVANTES ===
-        # Pega os primeiros 200 caracteres das 3 descobertas mais relevantes
-        descobertas = []
-        for idx, finding in enumerate(data.get('raw_findings', [])[:3]):
-            descobertas.append(finding.get('content', '')[:200])
-        csv_row['descobertas_relevantes'] = ' | '.join(descobertas)  # Separa com pipe
-        
-        csv_data.append(csv_row)
-    
-    # === CRIAÇÃO E SALVAMENTO DO DATAFRAME ===
-    df_resultados = pd.DataFrame(csv_data)
-    csv_filename = os.path.join(OUTPUT_DIR, "analise_sigmine_resultados.csv")
-    
-    # encoding='utf-8-sig' adiciona BOM para compatibilidade com Excel
-    df_resultados.to_csv(csv_filename, index=False, encoding='utf-8-sig')
-    
-    # === GERAÇÃO DO CSV DETALHADO DE DESCOBERTAS ===
-    # Este arquivo contém todas as descobertas com impactos, não resumidas
-    descobertas_data = []
-    
-    for cod, data in contexto_proc.items():
-        for finding in data.get('raw_findings', []):
-            # Extrai URL válida
-            url_encontrada = finding.get('link', '') or finding.get('source', '')
-            if not url_encontrada.startswith('http'):
-                url_encontrada = ''
-            
-            # Cria registro detalhado
-            descobertas_data.append({
-                'processo': cod,
-                'titular': data.get('row_data', {}).get(COL_TITULAR, ''),
-                'conteudo_descoberta': finding.get('content', ''),  # Conteúdo completo
-                'fonte_url': url_encontrada,
-                'titulo_fonte': finding.get('title', ''),
-                'query_busca': finding.get('query', ''),  # Query que encontrou o resultado
-                'site_relevante': 'Sim' if finding.get('is_relevant_site', False) else 'Não',
-                'motor_busca': SEARCH_ENGINE_USED
-            })
-    
-    # Salva CSV de descobertas se houver dados
-    if descobertas_data:
-        df_descobertas = pd.DataFrame(descobertas_data)
-        descobertas_filename = os.path.join(OUTPUT_DIR, "descobertas_impactos_detalhadas.csv")
-        df_descobertas.to_csv(descobertas_filename, index=False, encoding='utf-8-sig')
+    # === SALVAMENTO DO RELATÓRIO E DOS CSVs ===
+    # Junta cabeçalho, seções e notas no arquivo definitivo e dá aos CSVs
+    # seus nomes definitivos
+    relatorio.finalizar(cabecalho, rodape)
+    resultados_gravados = csv_resultados.fechar()
+    
+    # O CSV de descobertas só é gerado se houver dados
+    if csv_descobertas.fechar():
         print(f"✅ Descobertas detalhadas salvas em: '{descobertas_filename}'")
     
     # === MENSAGENS FINAIS ===
     print(f"\n✅ Relatório final salvo em: '{REPORT_FILENAME}'")
-    print(f"✅ Resultados em CSV salvos em: '{csv_filename}'")
+    if resultados_gravados:
+        print(f"✅ Resultados em CSV salvos em: '{csv_filename}'")
     print(f"✅ Motor de busca utilizado: {SEARCH_ENGINE_USED}")
     print("\n🎉 ANÁLISE CONCLUÍDA COM SUCESSO!")
     print("=" * 60)
 
+def gravar_medicoes(perfil: dict = None, comando: str = "analyze"):
+    """
+    Grava o manifesto da execução (e as métricas do Prometheus, se configurado).
+    
+    Args:
+        perfil (dict): Resultado dos perfis opcionais (ver perfilar)
+        comando (str): Subcomando executado (ver cli)
+    """
+    configuracao = {
+        "comando": comando,
+        "shapefile": SHAPEFILE_PATH,
+        "n_top": N_TOP,
+        "filtros": {"uf": FILTRO_UF, "fase": FILTRO_FASE, "substancia": FILTRO_SUBSTANCIA,
+                    "bbox": FILTRO_BBOX, "processos": FILTRO_PROCESSOS, "titular": FILTRO_TITULAR},
+        "motor_busca": SEARCH_ENGINE_USED,
+        "limites_etapas": LIMITES_ETAPAS,
+        "buscas_concorrentes": BUSCAS_CONCORRENTES,
+        "caches": {"busca": USAR_CACHE_BUSCA, "embeddings": USAR_CACHE_EMBEDDINGS, "llm": USAR_CACHE_LLM},
+    }
+    try:
+        manifesto = INSTRUMENTACAO.gravar_manifesto(MANIFESTO_PATH, configuracao=configuracao,
+                                                    **(perfil or {}))
+        if PROMETHEUS_PATH:
+            INSTRUMENTACAO.gravar_prometheus(PROMETHEUS_PATH)
+    except OSError as e:
+        # As medições não devem derrubar uma análise que terminou
+        logger.warning(f"Não foi possível gravar as medições da execução: {e}")
+        return
+    
+    c = manifesto["contadores"]
+    print(f"📈 Medições salvas em: '{MANIFESTO_PATH}' ({manifesto['duracao_segundos']:.0f}s): "
+          f"{c.get('busca_chamadas', 0)} buscas ({c.get('busca_429', 0)} com 429), "
+          f"{c.get('embeddings_chamadas', 0)} requisições de embeddings, "
+          f"{c.get('llm_chamadas', 0)} chamadas ao LLM "
+          f"({c.get('llm_tokens_entrada', 0)} tokens de entrada, {c.get('llm_tokens_saida', 0)} de saída)")
+
+def main(comando: str = "analyze"):
+    """
+    Função principal: executa a análise e grava as medições da execução.
+    
+    O manifesto (ver gravar_medicoes) é gravado mesmo se a análise falhar
+    ou for interrompida, com o que foi medido até ali.
+    
+    Args:
+        comando (str): "rank", "analyze" ou "report" (ver executar_analise)
+    """
+    perfil = {}
+    try:
+        with perfilar(PERFIL_CPU_PATH, PERFILAR_MEMORIA, perfil):
+            executar_analise(comando)
+    finally:
+        gravar_medicoes(perfil, comando)
+
+def cli(argv=None):
+    """
+    Linha de comando: python main.py [rank|analyze|report] [--n-top N] [--uf UF]
+    
+    Sem subcomando, roda a análise completa ("analyze"). Só o "analyze"
+    carrega o LangChain, o Chroma e os clientes do Google.
+    
+    Args:
+        argv (list): Argumentos (padrão: os da linha de comando)
+    """
+    global N_TOP, FILTRO_UF
+    
+    parser = argparse.ArgumentParser(description="Análise de contexto dos processos do SIGMINE")
+    subcomandos = parser.add_subparsers(dest="comando")
+    opcoes = argparse.ArgumentParser(add_help=False)
+    opcoes.add_argument("--n-top", type=int, default=None,
+                        help=f"Processos selecionados por área (padrão: {N_TOP})")
+    opcoes.add_argument("--uf", nargs="+", default=None,
+                        help="Filtra os processos por UF (ex: --uf PA AM)")
+    subcomandos.add_parser("rank", parents=[opcoes],
+                           help="Só o ranking geoespacial dos processos, sem busca e sem IA")
+    subcomandos.add_parser("analyze", parents=[opcoes],
+                           help="Ranking, buscas na web, análise com IA e relatório (padrão)")
+    subcomandos.add_parser("report", parents=[opcoes],
+                           help="Regrava o relatório a partir do checkpoint, sem buscas e sem IA")
+    args = parser.parse_args(argv)
+    
+    if getattr(args, "n_top", None) is not None:
+        N_TOP = args.n_top
+    if getattr(args, "uf", None):
+        FILTRO_UF = [uf.upper() for uf in args.uf]
+    main(args.comando or "analyze")
+
 # === PONTO DE ENTRADA DO PROGRAMA ===
 # Este bloco só executa se o script for rodado diretamente
 # Não executa se for importado como módulo
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
\ No newline at end of file
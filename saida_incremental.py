@@ -0,0 +1,145 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Gravação incremental do relatório e dos CSVs.
+
+Cada processo analisado é gravado em disco assim que termina, em vez de
+todo o relatório ser montado na memória no fim da execução. Enquanto a
+execução roda, os arquivos ficam com a extensão ".parcial" e podem ser
+consultados; ao final, recebem o nome definitivo.
+"""
+
+import os
+import csv
+import math
+import shutil
+import threading
+
+
+class EmissorOrdenado:
+    """
+    Repassa itens na ordem dos índices, mesmo que cheguem fora de ordem.
+
+    Itens que chegam antes da vez ficam guardados até que todos os
+    anteriores tenham chegado. Assim, análises concluídas em paralelo são
+    gravadas sempre na mesma ordem (a do top-N), e só as que estão
+    esperando a vez ficam na memória.
+
+    Args:
+        funcao (callable): Chamada com (índice, item) na ordem dos índices
+    """
+
+    def __init__(self, funcao):
+        self.funcao = funcao
+        self.proximo = 0
+        self._pendentes = {}
+        self._lock = threading.Lock()
+
+    def entregar(self, indice: int, item):
+        """Recebe o item de um índice e repassa todos os que já podem sair."""
+        with self._lock:
+            self._pendentes[indice] = item
+            while self.proximo in self._pendentes:
+                self.funcao(self.proximo, self._pendentes.pop(self.proximo))
+                self.proximo += 1
+
+
+class CSVIncremental:
+    """
+    CSV gravado linha a linha, com colunas fixas definidas na criação.
+
+    O arquivo só é criado quando a primeira linha chega (sem linhas, nenhum
+    arquivo é gerado). Usa 'utf-8-sig' (com BOM) para abrir corretamente
+    no Excel, como os CSVs gerados pelo pandas no restante do projeto.
+    Valores ausentes (None ou NaN) e colunas que faltam numa linha são
+    gravados vazios, também como no to_csv do pandas. Uma coluna que não
+    está em `colunas` gera ValueError, em vez de ser descartada em silêncio.
+
+    Args:
+        caminho (str): Nome definitivo do arquivo
+        colunas (list): Colunas do CSV, na ordem do cabeçalho
+    """
+
+    def __init__(self, caminho: str, colunas):
+        self.caminho = caminho
+        self.caminho_parcial = caminho + ".parcial"
+        self.colunas = list(colunas)
+        self.linhas = 0
+        self._arquivo = None
+        self._escritor = None
+
+    @staticmethod
+    def _valor(valor):
+        if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+            return ""
+        return valor
+
+    def escrever(self, linhas):
+        """Grava uma ou mais linhas (dicts) e envia ao disco."""
+        for linha in linhas:
+            if self._escritor is None:
+                self._arquivo = open(self.caminho_parcial, "w", encoding="utf-8-sig", newline="")
+                # Quebra de linha "\n", como no to_csv do pandas
+                self._escritor = csv.DictWriter(self._arquivo, fieldnames=self.colunas,
+                                                restval="", extrasaction="raise",
+                                                lineterminator="\n")
+                self._escritor.writeheader()
+            self._escritor.writerow({coluna: self._valor(valor) for coluna, valor in linha.items()})
+            self.linhas += 1
+        if self._arquivo is not None:
+            self._arquivo.flush()
+
+    def fechar(self) -> bool:
+        """
+        Fecha o arquivo e dá a ele o nome definitivo.
+
+        Returns:
+            bool: True se o arquivo foi gerado (havia ao menos uma linha)
+        """
+        if self._arquivo is None:
+            return False
+        self._arquivo.close()
+        os.replace(self.caminho_parcial, self.caminho)
+        return True
+
+
+class MarkdownIncremental:
+    """
+    Relatório Markdown gravado em partes, com o cabeçalho escrito no final.
+
+    O corpo de cada parte (ex: seções dos processos, perfis dos titulares)
+    é acrescentado a um arquivo ".parcial" próprio à medida que as análises
+    terminam. finalizar() junta cabeçalho, partes e rodapé no arquivo
+    definitivo, copiando as partes do disco sem carregá-las na memória.
+
+    Args:
+        caminho (str): Nome definitivo do relatório
+        partes (tuple): Nomes das partes, na ordem em que aparecem no relatório
+    """
+
+    def __init__(self, caminho: str, partes=("corpo",)):
+        self.caminho = caminho
+        self._arquivos = {
+            parte: open(f"{caminho}.{parte}.parcial", "w", encoding="utf-8")
+            for parte in partes
+        }
+
+    def escrever(self, parte: str, texto: str):
+        """Acrescenta texto a uma parte e envia ao disco."""
+        arquivo = self._arquivos[parte]
+        arquivo.write(texto)
+        arquivo.flush()
+
+    def finalizar(self, cabecalho: str, rodape: str = ""):
+        """Monta o relatório definitivo: cabeçalho + partes + rodapé."""
+        temporario = self.caminho + ".parcial"
+        with open(temporario, "w", encoding="utf-8") as saida:
+            saida.write(cabecalho)
+            for arquivo in self._arquivos.values():
+                arquivo.close()
+                with open(arquivo.name, encoding="utf-8") as parte:
+                    shutil.copyfileobj(parte, saida)
+                os.remove(arquivo.name)
+            saida.write(rodape)
+        os.replace(temporario, self.caminho)
@@ -0,0 +1,320 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Leitura dos microdados do SCM (Sistema de Cadastro Mineiro) da ANM.
+
+Os arquivos .txt do SCM (separados por ";", em latin1) são lidos pelo
+leitor de CSV do Apache Arrow, em C++ e com várias threads, e guardados
+em Parquet com tipos definidos: códigos como inteiros e textos repetidos
+(tipo de pessoa, substância) como categorias. As tabelas de junção
+processo -> pessoas, municípios e substâncias são montadas uma única vez
+e ficam no mesmo cache; nas execuções seguintes, enquanto os .txt não
+mudarem, tudo é lido direto dos arquivos Parquet.
+
+As junções são indexadas pela chave numérica do processo (ver chaves.py),
+a mesma usada no SIGMINE, e não pelo texto DSPROCESSO.
+
+Fonte dos dados:
+https://dados.gov.br/dados/conjuntos-dados/sistema-de-cadastro-mineiro
+"""
+
+import os
+import re
+import json  # Para salvar a assinatura dos arquivos junto do cache
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv  # Leitor de CSV multithread do Arrow
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from chaves import CHAVE_INVALIDA, chave_processo
+from geo_sigmine import CACHE_DIR, COLUNA_CHAVE, _salvar_assinatura
+
+logger = logging.getLogger(__name__)
+
+# === CONFIGURAÇÕES DA LEITURA DO SCM ===
+
+# Versão do formato do cache. Incrementar quando mudar o que é salvo nos Parquet
+VERSAO_CACHE_SCM = 2
+
+# Texto categórico: poucos valores distintos repetidos em milhões de linhas
+CATEGORIA = pa.dictionary(pa.int32(), pa.string())
+
+# Arquivos do SCM e colunas lidas de cada um, com o tipo de cada coluna
+# Os nomes das colunas são comparados já normalizados (ver _normalizar_coluna),
+# pois variam entre versões dos arquivos (ex: "DSProcesso" x "DS_PROCESSO")
+TABELAS_SCM = {
+    "pessoa": ("Pessoa.txt", {
+        "IDPESSOA": pa.int64(),
+        "NRCPFCNPJ": pa.string(),   # Texto: mantém zeros à esquerda e a máscara (***)
+        "TPPESSOA": CATEGORIA,      # "F" (física) ou "J" (jurídica)
+        "NMPESSOA": CATEGORIA,      # Categoria: o mesmo titular se repete em muitos processos
+    }),
+    "processo_pessoa": ("ProcessoPessoa.txt", {
+        "DSPROCESSO": pa.string(),
+        "IDPESSOA": pa.int64(),
+    }),
+    "processo_municipio": ("ProcessoMunicipio.txt", {
+        "DSPROCESSO": pa.string(),
+        "IDMUNICIPIO": pa.int64(),  # Código IBGE do município
+    }),
+    "processo_substancia": ("ProcessoSubstancia.txt", {
+        "DSPROCESSO": pa.string(),
+        "IDSUBSTANCIA": pa.int64(),
+    }),
+    "substancia": ("Substancia.txt", {
+        "IDSUBSTANCIA": pa.int64(),
+        "NMSUBSTANCIA": CATEGORIA,
+    }),
+}
+
+# Tabelas de junção montadas a partir das tabelas acima
+JUNCOES_SCM = ("processo_pessoas", "processo_municipios", "processo_substancias")
+
+
+def _normalizar_coluna(nome: str) -> str:
+    """Nome de coluna só com letras maiúsculas e dígitos (ex: "DS_Processo" -> "DSPROCESSO")."""
+    return re.sub(r"[^A-Z0-9]", "", nome.upper())
+
+
+def _colunas_arquivo(caminho: str) -> list:
+    """Lê só a primeira linha do arquivo e retorna os nomes das colunas."""
+    with open(caminho, encoding="latin1") as f:
+        cabecalho = f.readline().rstrip("\r\n")
+    return [c.strip().strip('"') for c in cabecalho.split(";")]
+
+
+def ler_tabela_scm(caminho: str, colunas: dict) -> pa.Table:
+    """
+    Lê um arquivo .txt do SCM com o leitor de CSV do Arrow.
+
+    Só as colunas pedidas são convertidas, já nos tipos finais. Linhas
+    malformadas (quantidade errada de campos) são ignoradas com um aviso,
+    como o on_bad_lines="warn" do pandas.
+
+    Args:
+        caminho (str): Arquivo .txt (separado por ";", em latin1)
+        colunas (dict): {nome normalizado da coluna: tipo Arrow}
+
+    Returns:
+        pa.Table: Tabela com as colunas pedidas, com os nomes normalizados
+
+    Raises:
+        ValueError: Se alguma coluna pedida não existe no arquivo
+    """
+    nomes = {_normalizar_coluna(c): c for c in _colunas_arquivo(caminho)}
+    faltando = [c for c in colunas if c not in nomes]
+    if faltando:
+        raise ValueError(f"{caminho}: colunas não encontradas: {faltando}")
+
+    ignoradas = []
+
+    def linha_invalida(linha):
+        ignoradas.append(linha.text)
+        return "skip"
+
+    tabela = pv.read_csv(
+        caminho,
+        read_options=pv.ReadOptions(encoding="latin1", use_threads=True,
+                                    block_size=16 * 1024 * 1024),
+        parse_options=pv.ParseOptions(delimiter=";", invalid_row_handler=linha_invalida),
+        convert_options=pv.ConvertOptions(
+            include_columns=[nomes[c] for c in colunas],
+            column_types={nomes[c]: tipo for c, tipo in colunas.items()},
+            strings_can_be_null=True,
+        ),
+    )
+    if ignoradas:
+        logger.warning(f"{caminho}: {len(ignoradas)} linhas malformadas ignoradas "
+                       f"(primeira: {ignoradas[0][:80]!r})")
+    return tabela.rename_columns(list(colunas))
+
+
+def montar_juncoes(tabelas: dict) -> dict:
+    """
+    Monta as tabelas de junção entre processos e pessoas, municípios e substâncias.
+
+    As junções são feitas pelo Arrow (hash join em C++, com várias threads).
+    Em cada tabela, DSPROCESSO é trocado pela coluna 'chave_processo'
+    (int64) e as linhas são ordenadas por ela. Linhas cujo DSPROCESSO não
+    é um número de processo válido são descartadas com um aviso, em vez
+    de sumirem em silêncio numa junção por texto.
+
+    Args:
+        tabelas (dict): Tabelas lidas por ler_tabela_scm (chaves de TABELAS_SCM)
+
+    Returns:
+        dict: {nome da junção: pa.Table}, com as chaves de JUNCOES_SCM
+    """
+    def com_chave(nome):
+        tabela = tabelas[nome]
+        chaves = chave_processo(tabela["DSPROCESSO"])
+        validas = chaves != CHAVE_INVALIDA
+        if not validas.all():
+            logger.warning(f"SCM {nome}: {int((~validas).sum())} linhas com DSPROCESSO inválido descartadas")
+        tabela = tabela.drop_columns("DSPROCESSO").add_column(0, COLUNA_CHAVE, pa.array(chaves))
+        return tabela.filter(pa.array(validas))
+
+    def ordenada(tabela):
+        # Ordenada pela chave: as consultas por processo viram buscas binárias
+        # (ver linhas_dos_processos)
+        return tabela.take(pc.sort_indices(tabela, [(COLUNA_CHAVE, "ascending")]))
+
+    pessoas = com_chave("processo_pessoa").join(
+        tabelas["pessoa"], "IDPESSOA", join_type="left outer", use_threads=True)
+    substancias = com_chave("processo_substancia").join(
+        tabelas["substancia"], "IDSUBSTANCIA", join_type="left outer", use_threads=True)
+    return {
+        "processo_pessoas": ordenada(pessoas),
+        "processo_municipios": ordenada(com_chave("processo_municipio")),
+        "processo_substancias": ordenada(substancias),
+    }
+
+
+def _assinatura_scm(scm_dir: str) -> dict:
+    """Tamanho e data de modificação de cada arquivo do SCM (chave do cache)."""
+    arquivos = {}
+    for arquivo, _ in TABELAS_SCM.values():
+        caminho = os.path.join(scm_dir, arquivo)
+        arquivos[arquivo] = {"tamanho": os.path.getsize(caminho),
+                             "mtime_ns": os.stat(caminho).st_mtime_ns}
+    return {"versao": VERSAO_CACHE_SCM, "arquivos": arquivos}
+
+
+def _caminhos_cache_scm(cache_dir: str):
+    """
+    Define onde ficam os Parquet e a assinatura do SCM.
+
+    Returns:
+        tuple: (diretório dos .parquet, caminho do .json com a assinatura)
+    """
+    pasta = os.path.join(cache_dir, "scm")
+    return pasta, os.path.join(pasta, "assinatura.json")
+
+
+def carregar_scm(scm_dir: str, cache_dir: str = CACHE_DIR, usar_cache: bool = True) -> dict:
+    """
+    Carrega as tabelas de junção do SCM, usando o cache Parquet quando possível.
+
+    Na primeira execução (ou quando algum .txt muda), lê os arquivos do
+    SCM, monta as junções e grava tudo em Parquet. Nas seguintes, lê só os
+    Parquet das junções.
+
+    Args:
+        scm_dir (str): Diretório com os arquivos .txt do SCM
+        cache_dir (str): Diretório do cache
+        usar_cache (bool): Se False, sempre lê os .txt (e não grava o cache)
+
+    Returns:
+        dict: {nome da junção: DataFrame indexado por 'chave_processo'},
+            com as chaves de JUNCOES_SCM, ou None se algum arquivo do SCM
+            não existe
+    """
+    ausentes = [arquivo for arquivo, _ in TABELAS_SCM.values()
+                if not os.path.exists(os.path.join(scm_dir, arquivo))]
+    if ausentes:
+        logger.warning(f"Microdados do SCM não encontrados em {scm_dir} ({', '.join(ausentes)}); "
+                       f"dados do SCM ignorados")
+        return None
+
+    pasta, assinatura_path = _caminhos_cache_scm(cache_dir)
+    assinatura = _assinatura_scm(scm_dir)
+
+    if usar_cache and os.path.exists(assinatura_path):
+        try:
+            with open(assinatura_path, encoding="utf-8") as f:
+                salva = json.load(f)
+        except (OSError, ValueError):
+            salva = None
+        if salva == assinatura and all(os.path.exists(os.path.join(pasta, f"{nome}.parquet"))
+                                       for nome in JUNCOES_SCM):
+            logger.info(f"Lendo SCM do cache: {pasta}")
+            return {nome: _indexar(pq.read_table(os.path.join(pasta, f"{nome}.parquet")))
+                    for nome in JUNCOES_SCM}
+
+    logger.info(f"Lendo microdados do SCM de {scm_dir}")
+    tabelas = {nome: ler_tabela_scm(os.path.join(scm_dir, arquivo), colunas)
+               for nome, (arquivo, colunas) in TABELAS_SCM.items()}
+    juncoes = montar_juncoes(tabelas)
+
+    if usar_cache:
+        os.makedirs(pasta, exist_ok=True)
+        # As tabelas originais também são guardadas, já tipadas, para consultas avulsas
+        for nome, tabela in {**tabelas, **juncoes}.items():
+            pq.write_table(tabela, os.path.join(pasta, f"{nome}.parquet"))
+        # A assinatura é gravada por último: só vale se todos os Parquet foram gravados
+        _salvar_assinatura(assinatura_path, assinatura)
+
+    return {nome: _indexar(tabela) for nome, tabela in juncoes.items()}
+
+
+def _indexar(tabela: pa.Table) -> pd.DataFrame:
+    """Converte uma junção para DataFrame indexado (e ordenado) pela chave do processo."""
+    return tabela.to_pandas().set_index(COLUNA_CHAVE)
+
+
+def linhas_dos_processos(tabela: pd.DataFrame, chaves) -> pd.DataFrame:
+    """
+    Seleciona as linhas de uma junção que pertencem aos processos pedidos.
+
+    Como o índice (chave do processo) está ordenado, cada processo é
+    localizado por busca binária (np.searchsorted), sem percorrer a tabela.
+
+    Args:
+        tabela (DataFrame): Junção de carregar_scm
+        chaves (array): Chaves dos processos, sem repetições
+
+    Returns:
+        DataFrame: Linhas dos processos pedidos, na ordem das chaves
+    """
+    indice = tabela.index.to_numpy()
+    inicios = np.searchsorted(indice, chaves, side="left")
+    contagem = np.searchsorted(indice, chaves, side="right") - inicios
+    # Posições inicio..inicio+contagem-1 de cada processo, sem laço em Python
+    deslocamento = np.repeat(inicios - np.cumsum(contagem) + contagem, contagem)
+    return tabela.iloc[deslocamento + np.arange(contagem.sum())]
+
+
+def resumo_scm(juncoes: dict, chaves) -> pd.DataFrame:
+    """
+    Resume, para cada processo, as pessoas, municípios e substâncias do SCM.
+
+    Args:
+        juncoes (dict): Saída de carregar_scm
+        chaves (list): Chaves dos processos (coluna 'chave_processo' do SIGMINE)
+
+    Returns:
+        DataFrame: Indexado por 'chave_processo', com as colunas
+            'pessoas_scm' ("NOME (CPF/CNPJ)"), 'municipios_scm' (códigos
+            IBGE) e 'substancias_scm', separados por "; " ("" se não houver)
+    """
+    chaves = pd.Index(pd.unique(np.asarray(chaves, dtype=np.int64)), name=COLUNA_CHAVE)
+
+    def juntar(tabela, valores):
+        # Filtra antes de agrupar: só os processos pedidos, não o SCM inteiro
+        linhas = linhas_dos_processos(tabela, chaves.to_numpy())
+        textos = valores(linhas).dropna().astype(str)
+        # Sem repetições, mantendo a primeira ocorrência de cada valor
+        textos = textos[~pd.MultiIndex.from_arrays([textos.index, textos]).duplicated()]
+        # Valores de cada processo unidos por "; " no Arrow, sem função Python
+        # por grupo. Sem threads, a ordem das linhas é mantida em cada grupo
+        grupos = pa.table({COLUNA_CHAVE: textos.index.to_numpy(),
+                           "texto": pa.array(textos.to_numpy(dtype=object), pa.string())}) \
+            .group_by(COLUNA_CHAVE, use_threads=False).aggregate([("texto", "list")])
+        unidos = pc.binary_join(grupos["texto_list"], "; ").to_numpy(zero_copy_only=False)
+        return (pd.Series(unidos, index=grupos[COLUNA_CHAVE].to_numpy(), dtype=object)
+                .reindex(chaves).fillna(""))
+
+    pessoas = juntar(juncoes["processo_pessoas"],
+                     lambda t: (t["NMPESSOA"].astype(object).fillna("") + " ("
+                                + t["NRCPFCNPJ"].astype(object).fillna("") + ")"))
+    municipios = juntar(juncoes["processo_municipios"], lambda t: t["IDMUNICIPIO"].astype("Int64"))
+    substancias = juntar(juncoes["processo_substancias"],
+                         lambda t: t["NMSUBSTANCIA"].astype(object).fillna("DADO NÃO CADASTRADO"))
+
+    return pd.DataFrame({"pessoas_scm": pessoas, "municipios_scm": municipios,
+                         "substancias_scm": substancias}, index=chaves)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Sobreposição dos processos SIGMINE com áreas protegidas.
+
+Cruza os polígonos dos processos com camadas locais de Terras Indígenas
+(FUNAI) e Unidades de Conservação (ICMBio/MMA) e mede, em hectares, quanto
+de cada processo está dentro de cada área. O resultado é exato e
+reproduzível, ao contrário do que se obtém procurando essas informações
+em trechos de páginas na web.
+
+As geometrias das camadas ficam num índice espacial (STRtree) e preparadas
+(shapely.prepare), e os processos são cruzados em lotes, em paralelo se
+desejado, como no cálculo de áreas (ver geo_sigmine.calcular_area_ha).
+"""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor  # Para usar vários núcleos no cruzamento
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+from geo_sigmine import TAMANHO_LOTE_AREA, MODOS_AREA, _area_ha_lote
+
+logger = logging.getLogger(__name__)
+
+# Índice da camada usado nos processos auxiliares (montado por _iniciar_worker)
+_CAMADA_WORKER = None
+
+
+def carregar_camada(caminho: str, coluna_nome: str, crs) -> gpd.GeoDataFrame:
+    """
+    Lê uma camada de áreas protegidas e a prepara para o cruzamento.
+
+    Aceita qualquer formato lido pelo GDAL (shapefile, GeoPackage, GeoJSON).
+    A camada é reprojetada para o CRS dos processos, geometrias inválidas
+    são corrigidas (make_valid) e geometrias vazias são descartadas.
+
+    Args:
+        caminho (str): Arquivo da camada
+        coluna_nome (str): Coluna com o nome de cada área (ex: "terrai_nom")
+        crs: CRS dos processos SIGMINE
+
+    Returns:
+        GeoDataFrame: Colunas 'nome_area' e 'geometry', com índice 0..n-1
+    """
+    camada = gpd.read_file(caminho, engine="pyogrio", columns=[coluna_nome], use_arrow=True)
+    if camada.crs is None:
+        logger.warning(f"Camada {caminho} sem CRS definido; assumindo o CRS dos processos")
+        camada = camada.set_crs(crs)
+    camada = camada.to_crs(crs)
+
+    invalidas = ~camada.geometry.is_valid
+    if invalidas.any():
+        logger.info(f"Camada {caminho}: corrigindo {int(invalidas.sum())} geometrias inválidas")
+        camada.loc[invalidas, "geometry"] = shapely.make_valid(camada.geometry[invalidas].values)
+
+    camada = camada[camada.geometry.notna() & ~camada.geometry.is_empty]
+    return camada.rename(columns={coluna_nome: "nome_area"}).reset_index(drop=True)
+
+
+def _indexar(geometrias):
+    """
+    Prepara as geometrias da camada e monta o índice espacial.
+
+    Returns:
+        tuple: (STRtree, array de geometrias preparadas)
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    # Geometrias preparadas tornam os testes repetidos (covers) muito mais rápidos
+    shapely.prepare(geometrias)
+    return shapely.STRtree(geometrias), geometrias
+
+
+def _iniciar_worker(geometrias_camada):
+    """Monta o índice da camada uma vez em cada processo auxiliar."""
+    global _CAMADA_WORKER
+    _CAMADA_WORKER = _indexar(geometrias_camada)
+
+
+def _sobreposicoes_lote(geometrias: gpd.GeoSeries, modo: str = "projetada", camada=None):
+    """
+    Cruza um lote de processos com a camada indexada.
+
+    Fica no nível do módulo para poder ser enviada a outros processos.
+
+    Args:
+        geometrias (GeoSeries): Geometrias de um lote de processos
+        modo (str): Modo de cálculo de área ("projetada" ou "elipsoidal")
+        camada (tuple): Saída de _indexar (None = índice do processo auxiliar)
+
+    Returns:
+        tuple: (posições dos processos no lote, posições das áreas na camada,
+            área de cada par em ha, área total sobreposta de cada processo em ha)
+    """
+    arvore, geometrias_camada = camada if camada is not None else _CAMADA_WORKER
+    processos = np.asarray(geometrias.values, dtype=object)
+    totais = np.zeros(len(processos))
+
+    # O índice espacial devolve só os pares que realmente se intersectam
+    i_proc, i_area = arvore.query(processos, predicate="intersects")
+    if len(i_proc) == 0:
+        return i_proc, i_area, np.array([], dtype=float), totais
+
+    a, b = processos[i_proc], geometrias_camada[i_area]
+
+    # Processo inteiramente dentro da área: a sobreposição é o próprio processo,
+    # sem precisar calcular a interseção
+    dentro = shapely.covers(b, a)
+    pedacos = a.copy()
+    pedacos[~dentro] = shapely.intersection(a[~dentro], b[~dentro])
+    areas = _area_ha_lote(gpd.GeoSeries(pedacos, crs=geometrias.crs), modo)
+
+    # Total por processo: áreas da mesma camada podem se sobrepor entre si
+    # (ex: APA que contém um Parque), então os pedaços são unidos antes de medir
+    np.add.at(totais, i_proc, areas)
+    ordem = np.argsort(i_proc, kind="stable")
+    posicoes, inicios, contagem = np.unique(i_proc[ordem], return_index=True, return_counts=True)
+    grupos = np.split(pedacos[ordem], inicios[1:])
+    repetidos = contagem > 1
+    if repetidos.any():
+        unioes = [shapely.union_all(g) for g, r in zip(grupos, repetidos) if r]
+        totais[posicoes[repetidos]] = _area_ha_lote(gpd.GeoSeries(unioes, crs=geometrias.crs), modo)
+
+    return i_proc, i_area, areas, totais
+
+
+def calcular_sobreposicoes(processos: gpd.GeoDataFrame, camada: gpd.GeoDataFrame,
+                           workers: int = 1, tamanho_lote: int = TAMANHO_LOTE_AREA,
+                           modo_area: str = "projetada"):
+    """
+    Calcula a sobreposição de cada processo com as áreas de uma camada.
+
+    Com workers > 1, os lotes de processos são cruzados em paralelo; cada
+    processo auxiliar monta o índice da camada uma única vez. O resultado
+    é o mesmo do cálculo serial.
+
+    Args:
+        processos (GeoDataFrame): Processos SIGMINE
+        camada (GeoDataFrame): Camada lida por carregar_camada (mesmo CRS)
+        workers (int): Quantidade de processos (1 = cálculo serial)
+        tamanho_lote (int): Quantidade de processos por tarefa
+        modo_area (str): "projetada" ou "elipsoidal"
+
+    Returns:
+        tuple: (detalhes, totais)
+            detalhes (DataFrame): Uma linha por par processo x área com
+                sobreposição: 'indice' (índice do processo), 'nome_area'
+                e 'area_sobreposicao_ha'
+            totais (Series): Área sobreposta de cada processo em ha (0 se
+                nenhuma), com o mesmo índice de `processos`
+    """
+    if modo_area not in MODOS_AREA:
+        raise ValueError(f"Modo de área inválido: {modo_area!r}. Use um de {MODOS_AREA}")
+
+    geometrias = processos.geometry
+    inicios = list(range(0, len(geometrias), tamanho_lote))
+    lotes = [geometrias.iloc[i:i + tamanho_lote] for i in inicios]
+
+    if workers <= 1 or len(lotes) <= 1:
+        cruzar = partial(_sobreposicoes_lote, modo=modo_area, camada=_indexar(camada.geometry.values))
+        resultados = [cruzar(lote) for lote in lotes]
+    else:
+        cruzar = partial(_sobreposicoes_lote, modo=modo_area)
+        with ProcessPoolExecutor(max_workers=min(workers, len(lotes)),
+                                 initializer=_iniciar_worker,
+                                 initargs=(np.asarray(camada.geometry.values, dtype=object),)) as executor:
+            resultados = list(executor.map(cruzar, lotes))
+
+    # Remonta os lotes: posições relativas ao lote -> posições em `processos`
+    pos_proc, pos_area, areas, totais = [], [], [], []
+    for inicio, (i_proc, i_area, areas_lote, totais_lote) in zip(inicios, resultados):
+        pos_proc.append(i_proc + inicio)
+        pos_area.append(i_area)
+        areas.append(areas_lote)
+        totais.append(totais_lote)
+
+    pos_proc = np.concatenate(pos_proc) if pos_proc else np.array([], dtype=int)
+    pos_area = np.concatenate(pos_area) if pos_area else np.array([], dtype=int)
+    areas = np.concatenate(areas) if areas else np.array([], dtype=float)
+
+    detalhes = pd.DataFrame({
+        "indice": processos.index[pos_proc],
+        "nome_area": camada["nome_area"].to_numpy()[pos_area],
+        "area_sobreposicao_ha": areas,
+    })
+    # Pares que só se tocam na borda não têm sobreposição de área
+    detalhes = detalhes[detalhes["area_sobreposicao_ha"] > 0].reset_index(drop=True)
+
+    totais = pd.Series(np.concatenate(totais) if totais else np.array([], dtype=float),
+                       index=processos.index)
+    return detalhes, totais
+
+
+def adicionar_sobreposicoes(gdf: gpd.GeoDataFrame, camadas: dict, workers: int = 1,
+                            modo_area: str = "projetada"):
+    """
+    Acrescenta aos processos as colunas de sobreposição com cada camada.
+
+    Para cada camada de código `cod`, são criadas as colunas
+    'sobreposicao_{cod}_ha' (área sobreposta) e 'sobreposicao_{cod}_areas'
+    (nomes das áreas, separados por "; "). Camadas cujo arquivo não existe
+    são ignoradas com um aviso.
+
+    Args:
+        gdf (GeoDataFrame): Processos SIGMINE (alterado no próprio objeto)
+        camadas (dict): {código: (nome da camada, arquivo, coluna com o nome da área)}
+        workers (int): Processos usados no cruzamento
+        modo_area (str): "projetada" ou "elipsoidal"
+
+    Returns:
+        DataFrame: Todas as sobreposições encontradas, com as colunas de
+            calcular_sobreposicoes mais 'camada'
+    """
+    todas = []
+    for codigo, (nome, caminho, coluna_nome) in camadas.items():
+        if not os.path.exists(caminho):
+            logger.warning(f"Camada '{nome}' não encontrada em {caminho}; sobreposição ignorada")
+            continue
+
+        camada = carregar_camada(caminho, coluna_nome, gdf.crs)
+        detalhes, totais = calcular_sobreposicoes(gdf, camada, workers, modo_area=modo_area)
+
+        # Nomes das áreas de cada processo, sem repetições, na ordem da camada
+        nomes = (detalhes.groupby("indice", sort=False)["nome_area"]
+                 .agg(lambda s: "; ".join(dict.fromkeys(s.astype(str)))))
+        gdf[f"sobreposicao_{codigo}_ha"] = totais
+        gdf[f"sobreposicao_{codigo}_areas"] = nomes.reindex(gdf.index).fillna("")
+
+        logger.info(f"Camada '{nome}': {len(camada)} áreas, "
+                    f"{detalhes['indice'].nunique()} processos com sobreposição")
+        todas.append(detalhes.assign(camada=nome))
+
+    if not todas:
+        return pd.DataFrame(columns=["indice", "nome_area", "area_sobreposicao_ha", "camada"])
+    return pd.concat(todas, ignore_index=True)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Testes dos embeddings com cache (cache_ia.py): trechos de várias threads
+reunidos nos mesmos lotes por pre_calcular().
+"""
+
+import threading
+
+from cache_ia import EmbeddingsComCache
+from cache_persistente import CacheSQLite
+
+
+class ModeloFalso:
+    """Modelo de embeddings que só registra os lotes recebidos."""
+
+    model = "falso"
+
+    def __init__(self):
+        self.lotes = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.lotes.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def embutir_em_threads(embeddings, grupos):
+    barreira = threading.Barrier(len(grupos))
+
+    def rodar(textos):
+        barreira.wait()
+        embeddings.pre_calcular(textos)
+
+    threads = [threading.Thread(target=rodar, args=(textos,)) for textos in grupos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_trechos_de_varias_threads_vao_nos_mesmos_lotes(tmp_path):
+    modelo = ModeloFalso()
+    embeddings = EmbeddingsComCache(modelo, CacheSQLite(str(tmp_path / "e.sqlite"), "e"),
+                                    tamanho_lote=100, concorrencia=2, espera_lote=2.0)
+    grupos = [[f"processo {p} trecho {i}" for i in range(40)] for p in range(3)]
+    embutir_em_threads(embeddings, grupos)
+
+    # 120 trechos: um lote cheio assim que a fila chega a 100 e o resto no prazo
+    assert sorted(len(lote) for lote in modelo.lotes) == [20, 100]
+    assert embeddings.chamadas_modelo == 2
+
+    # A indexação encontra tudo no cache; a primeira leitura conta como falta
+    for textos in grupos:
+        assert embeddings.embed_documents(textos) == [[float(len(t)), 1.0] for t in textos]
+    assert embeddings.acertos == 0
+    assert len(modelo.lotes) == 2
+    embeddings.embed_documents(grupos[0])
+    assert embeddings.acertos == 40
+
+
+def test_trecho_comum_a_varias_threads_e_enviado_uma_vez(tmp_path):
+    modelo = ModeloFalso()
+    embeddings = EmbeddingsComCache(modelo, CacheSQLite(str(tmp_path / "e.sqlite"), "e"),
+                                    tamanho_lote=100, espera_lote=0.2)
+    grupos = [["trecho comum", f"trecho {p}"] for p in range(4)]
+    embutir_em_threads(embeddings, grupos)
+
+    enviados = [texto for lote in modelo.lotes for texto in lote]
+    assert sorted(enviados) == sorted({texto for textos in grupos for texto in textos})
+    assert embeddings.pre_calcular(["trecho comum"]) == 0
+
+
+def test_falha_no_envio_antecipado_fica_para_a_indexacao(tmp_path):
+    class ModeloQueFalhaUmaVez(ModeloFalso):
+        def embed_documents(self, texts):
+            if not self.lotes:
+                self.lotes.append(None)
+                raise RuntimeError("indisponível")
+            return super().embed_documents(texts)
+
+    modelo = ModeloQueFalhaUmaVez()
+    embeddings = EmbeddingsComCache(modelo, CacheSQLite(str(tmp_path / "e.sqlite"), "e"),
+                                    max_tentativas=1)
+    assert embeddings.pre_calcular(["a", "b"]) == 2
+    assert embeddings.embed_documents(["a", "b"]) == [[1.0, 1.0], [1.0, 1.0]]
+    assert modelo.lotes[1:] == [["a", "b"]]
+
+
+def test_contadores_corretos_com_varias_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from cache_ia import CacheRespostasLLM
+
+    class ModeloConsultas(ModeloFalso):
+        def embed_query(self, text):
+            return [1.0, 2.0]
+
+    embeddings = EmbeddingsComCache(ModeloConsultas(), CacheSQLite(str(tmp_path / "e.sqlite"), "e"))
+    respostas = CacheRespostasLLM(CacheSQLite(str(tmp_path / "l.sqlite"), "l"))
+    embeddings.embed_query("consulta")
+    respostas.set("k", {"result": "ok", "source_documents": []})
+
+    def usar(i):
+        embeddings.embed_query("consulta")
+        respostas.get("k" if i % 2 else "ausente")
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(usar, range(2000)))
+    assert (embeddings.acertos, embeddings.chamadas_modelo) == (2000, 1)
+    assert (respostas.acertos, respostas.faltas) == (1000, 1000)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Testes do cache em disco (cache_persistente.py): total armazenado mantido
+sem varrer a tabela, descarte LRU e acessos gravados em lote.
+"""
+
+import time
+
+from cache_persistente import CacheSQLite
+
+
+def soma_da_tabela(cache):
+    return cache._conn.execute(
+        f"SELECT COALESCE(SUM(tamanho), 0) FROM {cache.tabela}").fetchone()[0]
+
+
+def test_total_acompanha_gravacoes_substituicoes_e_remocoes(tmp_path):
+    cache = CacheSQLite(str(tmp_path / "c.sqlite"), "t")
+    cache.set("a", "x" * 10)
+    cache.set_muitos({"b": [1, 2, 3], "c": {"k": "v"}})
+    cache.set("a", "y" * 50)  # substitui: conta só o tamanho novo
+    cache.remover("b")
+    cache.remover("inexistente")
+    assert cache.tamanho_bytes() == soma_da_tabela(cache)
+    cache.fechar()
+
+    # Ao reabrir, o total é somado de novo a partir do arquivo
+    reaberto = CacheSQLite(str(tmp_path / "c.sqlite"), "t")
+    assert reaberto.tamanho_bytes() == soma_da_tabela(reaberto)
+    assert reaberto.get("a") == "y" * 50
+    reaberto.fechar()
+
+
+def test_descarta_os_menos_acessados_ao_passar_do_limite(tmp_path):
+    # Cada valor ocupa 12 bytes ('"' + 10 caracteres + '"')
+    cache = CacheSQLite(str(tmp_path / "c.sqlite"), "t", tamanho_max_bytes=12 * 5,
+                        acessos_por_gravacao=1000)
+    cache.set_muitos({f"k{i}": "v" * 10 for i in range(5)})
+    # Acesso ainda no buffer (não gravado) deve proteger k0 do descarte
+    assert cache.get("k0") == "v" * 10
+    assert cache._acessos
+
+    cache.set("k5", "v" * 10)
+    assert cache.get("k0") is not None
+    assert cache.get("k1") is None
+    assert cache.tamanho_bytes() <= cache.tamanho_max_bytes
+    assert cache.tamanho_bytes() == soma_da_tabela(cache)
+    cache.fechar()
+
+
+def test_acessos_gravados_em_lote(tmp_path):
+    cache = CacheSQLite(str(tmp_path / "c.sqlite"), "t", acessos_por_gravacao=3)
+    cache.set_muitos({"a": 1, "b": 2, "c": 3})
+    antes = dict(cache._conn.execute("SELECT chave, acessado_em FROM t"))
+    time.sleep(0.01)
+
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")  # repetir a chave não aumenta o buffer
+    assert dict(cache._conn.execute("SELECT chave, acessado_em FROM t")) == antes
+    cache.get("c")  # terceira chave lida: grava o buffer
+    assert not cache._acessos
+    depois = dict(cache._conn.execute("SELECT chave, acessado_em FROM t"))
+    assert depois["a"] > antes["a"] and depois["b"] > antes["b"]
+
+    cache.get("b")
+    cache.fechar()  # grava o que ficou no buffer
+    cache.fechar()  # fechar de novo não faz nada
@@ -0,0 +1,37 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Testes do checkpoint JSONL (checkpoint.py): retomada depois de uma
+gravação interrompida no meio da última linha.
+"""
+
+from checkpoint import CheckpointJSONL
+
+
+def test_retoma_depois_de_linha_final_truncada(tmp_path):
+    caminho = tmp_path / "checkpoint.jsonl"
+    checkpoint = CheckpointJSONL(str(caminho))
+    checkpoint.registrar(101, {"resumo": "primeiro", "fontes": ["a"]})
+    checkpoint.registrar("NOME:VALE", {"resumo": "perfil"})
+    checkpoint.registrar(101, {"resumo": "reanalisado", "fontes": []})
+
+    # Execução interrompida no meio da gravação do próximo registro
+    with open(caminho, "ab") as f:
+        f.write(b'{"chave": 202, "registrado_em": "2024-01-01T00:00:00", "dados": {"res')
+
+    retomado = CheckpointJSONL(str(caminho))
+    assert len(retomado) == 2
+    assert retomado.concluido(101) and retomado.concluido("NOME:VALE")
+    assert not retomado.concluido(202)
+    assert retomado.obter(101) == {"resumo": "reanalisado", "fontes": []}
+    assert retomado.obter(202, "ausente") == "ausente"
+
+    # O registro seguinte começa numa linha nova e é lido na próxima retomada
+    retomado.registrar(202, {"resumo": "refeito"})
+    assert retomado.obter(202) == {"resumo": "refeito"}
+
+    de_novo = CheckpointJSONL(str(caminho))
+    assert len(de_novo) == 3
+    assert de_novo.obter(202) == {"resumo": "refeito"}
+    assert de_novo.obter("NOME:VALE") == {"resumo": "perfil"}
@@ -0,0 +1,70 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Testes de ExecucaoUnica (concorrencia.py): uma execução por chave entre
+threads simultâneas e resultados removidos da memória depois de usados.
+"""
+
+import time
+import threading
+
+import pytest
+
+from concorrencia import ExecucaoUnica
+
+
+def test_pedidos_simultaneos_executam_uma_vez_e_liberam_a_memoria():
+    compartilhadas = ExecucaoUnica()
+    liberar = threading.Event()
+    chamadas = []
+
+    def funcao(valor):
+        chamadas.append(valor)
+        liberar.wait(timeout=10)
+        return valor * 2
+
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(
+        compartilhadas.executar("k", funcao, 21))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Espera todas as threads pedirem a chave antes de liberar a execução
+    while compartilhadas._entradas.get("k", {}).get("esperando", 0) < 5:
+        time.sleep(0.01)
+    liberar.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert chamadas == [21]
+    assert resultados == [42] * 5
+    # Sem previsão de usos, a entrada sai quando ninguém mais espera
+    assert len(compartilhadas) == 0
+    compartilhadas.executar("k", funcao, 21)
+    assert chamadas == [21, 21]
+
+
+def test_resultado_fica_ate_o_ultimo_uso_previsto():
+    compartilhadas = ExecucaoUnica({"k": 3})
+    chamadas = []
+
+    def funcao():
+        chamadas.append(1)
+        return "resultado"
+
+    for restantes in (1, 1, 0):
+        assert compartilhadas.executar("k", funcao) == "resultado"
+        assert len(compartilhadas) == restantes
+    assert chamadas == [1]
+
+
+def test_erros_sao_compartilhados_e_liberados():
+    compartilhadas = ExecucaoUnica({"k": 2})
+
+    def falhar():
+        raise ValueError("falhou")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            compartilhadas.executar("k", falhar)
+    assert len(compartilhadas) == 0
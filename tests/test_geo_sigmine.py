@@ -0,0 +1,125 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""Testes da seleção do top-N e do cálculo de áreas (geo_sigmine.py)."""
+
+import numpy as np
+import pytest
+import shapely
+import geopandas as gpd
+
+import geo_sigmine
+from geo_sigmine import calcular_area_ha, limite_superior_area_ha, selecionar_top_n
+
+
+def poligonos_sinteticos(n: int, semente: int = 0) -> gpd.GeoDataFrame:
+    """
+    Polígonos em SIRGAS 2000 geográfico espalhados pelo Brasil.
+
+    Metade são quadrados (bbox justo) e metade faixas diagonais finas, cujo
+    bbox é muito maior que a área: o limite superior erra a ordem das duas
+    famílias, e a seleção precisa medir além dos primeiros candidatos.
+    Inclui uma cópia de um polígono, para testar o desempate.
+    """
+    rng = np.random.default_rng(semente)
+    geometrias = []
+    for i in range(n):
+        x, y = rng.uniform(-70, -40), rng.uniform(-30, 3)
+        lado = rng.uniform(0.005, 0.2)
+        if i % 2:
+            geometrias.append(shapely.box(x, y, x + lado, y + lado))
+        else:
+            geometrias.append(shapely.LineString([(x, y), (x + 3 * lado, y + 3 * lado)])
+                              .buffer(lado / 20))
+    geometrias[-1] = geometrias[n // 2]
+    return gpd.GeoDataFrame({"PROCESSO": [f"{800000 + i}/2020" for i in range(n)]},
+                            geometry=geometrias, crs=4674)
+
+
+@pytest.mark.parametrize("modo", ["projetada", "elipsoidal"])
+def test_limite_superior_nunca_menor_que_a_area(modo):
+    gdf = poligonos_sinteticos(300)
+    areas = calcular_area_ha(gdf, modo=modo).to_numpy()
+    assert (limite_superior_area_ha(gdf, modo=modo) >= areas).all()
+
+
+@pytest.mark.parametrize("modo", ["projetada", "elipsoidal"])
+@pytest.mark.parametrize("n", [1, 10, 37])
+def test_top_n_igual_a_ordenar_tudo(monkeypatch, modo, n):
+    gdf = poligonos_sinteticos(600)
+    esperado = gdf.assign(area_ha_calculada=calcular_area_ha(gdf, modo=modo)) \
+        .nlargest(n, "area_ha_calculada")
+
+    # Conta quantas feições tiveram a área exata calculada
+    medidas = []
+    original = geo_sigmine.calcular_area_ha
+    def contar(gdf_lote, *args, **kwargs):
+        medidas.append(len(gdf_lote))
+        return original(gdf_lote, *args, **kwargs)
+    monkeypatch.setattr(geo_sigmine, "calcular_area_ha", contar)
+
+    top = selecionar_top_n(gdf, n, lote=20, modo_area=modo)
+
+    assert top.index.tolist() == esperado.index.tolist()
+    np.testing.assert_array_equal(top["area_ha_calculada"], esperado["area_ha_calculada"])
+    # A pré-seleção pelo limite superior dispensa a maior parte das medições
+    assert sum(medidas) < len(gdf)
+
+
+def test_top_n_com_area_ja_calculada_e_casos_limite():
+    gdf = poligonos_sinteticos(50)
+    gdf["area_ha_calculada"] = calcular_area_ha(gdf)
+    assert selecionar_top_n(gdf, 5).index.tolist() == gdf.nlargest(5, "area_ha_calculada").index.tolist()
+
+    sem_area = gdf.drop(columns="area_ha_calculada")
+    assert selecionar_top_n(sem_area, 0).empty
+    assert len(selecionar_top_n(sem_area, 500)) == len(gdf)
+    todos = selecionar_top_n(sem_area, None)
+    assert todos["area_ha_calculada"].is_monotonic_decreasing
+    assert len(todos) == len(gdf)
+
+
+def test_gravata_borboleta_reparada_com_a_area_correta():
+    # Em metros (SIRGAS 2000 / Brazil Polyconic): dois triângulos de
+    # base 200 m e altura 100 m, ligados pelo ponto onde a borda se cruza
+    x0, y0 = 5_000_000, 8_000_000
+    gravata = shapely.Polygon([(x0, y0), (x0 + 200, y0 + 200), (x0 + 200, y0), (x0, y0 + 200)])
+    quadrado = shapely.box(x0, y0, x0 + 100, y0 + 100)
+    gdf = gpd.GeoDataFrame({"PROCESSO": ["800001/2020", "800002/2020"]},
+                           geometry=[gravata, quadrado], crs=5880)
+    # Sem reparo, as duas metades se anulam
+    assert calcular_area_ha(gdf).iloc[0] == pytest.approx(0.0)
+
+    assert geo_sigmine.reparar_geometrias(gdf) == ["800001/2020"]
+    assert gdf["geometria_reparada"].tolist() == [True, False]
+    assert gdf.geometry.is_valid.all()
+    # 2 x (200 x 100 / 2) m² = 2 ha; o polígono válido não muda
+    assert calcular_area_ha(gdf).tolist() == pytest.approx([2.0, 1.0])
+
+
+def test_leitura_com_colunas_monta_e_reusa_o_cache(tmp_path, monkeypatch):
+    import benchmark
+    import main
+
+    shapefile = benchmark.gerar_shapefile_sintetico(str(tmp_path / "sigmine.shp"), 200)
+    cache_dir = str(tmp_path / "cache")
+    construcoes, leituras_cache = [], []
+    construir, ler_cache = geo_sigmine.construir_cache, geo_sigmine._ler_cache
+    monkeypatch.setattr(geo_sigmine, "construir_cache",
+                        lambda *a, **k: construcoes.append(1) or construir(*a, **k))
+    monkeypatch.setattr(geo_sigmine, "_ler_cache",
+                        lambda *a, **k: leituras_cache.append(1) or ler_cache(*a, **k))
+
+    # Como em ranquear_processos: só as colunas usadas, sem filtros
+    primeira = geo_sigmine.carregar_sigmine(shapefile, cache_dir=cache_dir,
+                                            colunas=main.COLUNAS_LEITURA, calcular_area=False)
+    assert construcoes == [1] and leituras_cache == []
+    assert geo_sigmine.cache_valido(shapefile, cache_dir)
+
+    segunda = geo_sigmine.carregar_sigmine(shapefile, cache_dir=cache_dir,
+                                           colunas=main.COLUNAS_LEITURA, calcular_area=False)
+    assert construcoes == [1] and leituras_cache == [1]
+    assert list(segunda.columns) == list(primeira.columns)
+    assert segunda["area_ha_calculada"].tolist() == pytest.approx(
+        primeira["area_ha_calculada"].tolist())
+    assert "geometria_reparada" in segunda.columns
@@ -0,0 +1,86 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Testes da gravação incremental (saida_incremental.py): ordem das análises
+concluídas fora de ordem e colunas fixas dos CSVs.
+"""
+
+import csv
+import random
+
+import pytest
+
+import main
+from saida_incremental import EmissorOrdenado, CSVIncremental
+
+
+def ler_csv(caminho):
+    with open(caminho, encoding="utf-8-sig", newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_emissor_libera_em_ordem_itens_concluidos_fora_de_ordem():
+    emitidos = []
+    emissor = EmissorOrdenado(lambda indice, item: emitidos.append((indice, item)))
+
+    emissor.entregar(2, "c")
+    emissor.entregar(1, "b")
+    assert emitidos == []  # O índice 0 ainda não chegou
+    emissor.entregar(0, "a")
+    assert emitidos == [(0, "a"), (1, "b"), (2, "c")]
+    emissor.entregar(4, "e")
+    assert emitidos[-1] == (2, "c")
+    emissor.entregar(3, "d")
+    assert [indice for indice, _ in emitidos] == [0, 1, 2, 3, 4]
+    assert emissor._pendentes == {}
+
+    # Qualquer ordem de conclusão gera a mesma saída
+    emitidos_aleatorios = []
+    emissor = EmissorOrdenado(lambda indice, item: emitidos_aleatorios.append(item))
+    indices = list(range(50))
+    random.Random(3).shuffle(indices)
+    for indice in indices:
+        emissor.entregar(indice, indice * 10)
+    assert emitidos_aleatorios == [indice * 10 for indice in range(50)]
+
+
+def test_csv_com_colunas_fixas_e_valores_ausentes_vazios(tmp_path):
+    caminho = tmp_path / "resultados.csv"
+    saida = CSVIncremental(str(caminho), ["processo", "area", "sobreposicao"])
+    # A primeira linha não tem a coluna opcional; a segunda tem
+    saida.escrever([{"processo": "1/2020", "area": float("nan")}])
+    saida.escrever([{"processo": "2/2020", "area": 10.5, "sobreposicao": None},
+                    {"processo": "3/2020", "area": 1.0, "sobreposicao": "TI Yanomami"}])
+    assert saida.fechar()
+
+    assert ler_csv(caminho) == [
+        ["processo", "area", "sobreposicao"],
+        ["1/2020", "", ""],
+        ["2/2020", "10.5", ""],
+        ["3/2020", "1.0", "TI Yanomami"],
+    ]
+
+    with pytest.raises(ValueError):
+        CSVIncremental(str(tmp_path / "outro.csv"), ["processo"]).escrever(
+            [{"processo": "1/2020", "coluna_nova": 1}])
+
+
+def test_csv_sem_linhas_nao_gera_arquivo(tmp_path):
+    saida = CSVIncremental(str(tmp_path / "vazio.csv"), ["processo"])
+    assert not saida.fechar()
+    assert not (tmp_path / "vazio.csv").exists()
+
+
+def test_linhas_do_processo_cabem_nas_colunas_do_csv():
+    ranking = [main.COL_PROCESSO, main.COL_CHAVE, main.COL_TITULAR, main.COL_UF,
+               "area_ha_calculada", "sobreposicao_ti_ha", "sobreposicao_ti_areas", "pessoas_scm"]
+    colunas_resultados, colunas_descobertas = main.colunas_csv(ranking)
+    row = {main.COL_PROCESSO: "1/2020", main.COL_CHAVE: 1, "sobreposicao_ti_ha": float("nan"),
+           "sobreposicao_ti_areas": "", "pessoas_scm": "EMPRESA"}
+    data = {"summary": "resumo", "row_data": row,
+            "raw_findings": [{"content": "texto", "link": "https://exemplo.org"}]}
+
+    linha, descobertas = main.linhas_csv_processo("1/2020", data, [])
+    assert list(linha) == colunas_resultados
+    assert all(list(descoberta) == colunas_descobertas for descoberta in descobertas)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8
+# Reinaldo Chaves (reichaves@gmail.com)
+
+"""
+Agregação dos titulares de todos os processos do SIGMINE.
+
+O mesmo titular aparece escrito de várias formas ("VALE S.A.", "Vale S/A",
+"VALE SA"). Aqui os nomes são normalizados e, quando os microdados do SCM
+estão disponíveis, agrupados também pela raiz do CNPJ (8 primeiros
+dígitos, comum à matriz e às filiais). Para cada titular são calculados
+quantidade de processos, área total, UFs e fases; esses números orientam
+a escolha dos titulares que recebem o perfil com IA, a etapa mais cara.
+
+Todo o cálculo é vetorizado: a normalização é feita uma vez por nome
+distinto (não por processo) e os agrupamentos usam códigos inteiros.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+logger = logging.getLogger(__name__)
+
+# Coluna acrescentada aos processos com o grupo (titular agregado) de cada um
+COLUNA_GRUPO = "grupo_titular"
+
+# Formas do tipo societário que não distinguem titulares ("S.A.", "S/A",
+# "LTDA.", "LTDA - ME", ...). Removidas do fim do nome normalizado
+_SUFIXOS_SOCIETARIOS = r"(\s+(SA|LTDA|EIRELI|ME|EPP|CIA|E CIA|MEI))+$"
+
+
+def normalizar_nomes_titulares(nomes) -> np.ndarray:
+    """
+    Normaliza nomes de titulares para comparar variantes.
+
+    Remove acentos e pontuação, passa para maiúsculas e descarta o tipo
+    societário no fim do nome. Ex: "Mineração Foo Ltda." e
+    "MINERACAO FOO LTDA - ME" -> "MINERACAO FOO". A conversão é vetorizada
+    (pyarrow.compute), como em palavras_chave.remover_acentos, sem laços
+    em Python.
+
+    Args:
+        nomes: Nomes (lista, Series ou array); valores ausentes viram ""
+
+    Returns:
+        ndarray: Nomes normalizados (object)
+    """
+    textos = pa.array(pd.Series(list(nomes), dtype=object).fillna("").astype(str), type=pa.string())
+    # NFKD separa letra e acento; o acento (não ASCII) é descartado com a pontuação
+    textos = pc.utf8_upper(pc.utf8_normalize(textos, "NFKD"))
+    textos = pc.replace_substring_regex(textos, r"[\x{0300}-\x{036F}]+", "")
+    textos = pc.utf8_trim_whitespace(pc.replace_substring_regex(textos, r"[^A-Z0-9]+", " "))
+    textos = pc.replace_substring_regex(textos, r"\bS A\b", "SA")
+    sem_sufixo = pc.replace_substring_regex(textos, _SUFIXOS_SOCIETARIOS, "")
+    # Um nome que é só o tipo societário (ex: "S.A.") fica como está
+    textos = pc.if_else(pc.equal(sem_sufixo, ""), textos, sem_sufixo)
+    return textos.to_numpy(zero_copy_only=False).astype(object)
+
+
+def normalizar_nome_titular(nome: str) -> str:
+    """Normaliza um único nome (ver normalizar_nomes_titulares)."""
+    return normalizar_nomes_titulares([nome])[0]
+
+
+def _normalizar_categorias(valores: pd.Series):
+    """
+    Normaliza uma coluna de nomes calculando cada nome distinto uma só vez.
+
+    Returns:
+        tuple: (códigos inteiros do nome normalizado de cada linha,
+            array com os nomes normalizados distintos)
+    """
+    categorias = pd.Categorical(valores.astype(object).fillna(""))
+    codigos_norm, unicos = pd.factorize(normalizar_nomes_titulares(categorias.categories))
+    # -1 (valor ausente) continua -1; os demais passam ao código normalizado
+    codigos = np.where(categorias.codes >= 0, codigos_norm[categorias.codes], -1)
+    return codigos, np.asarray(unicos, dtype=object)
+
+
+def _raiz_cnpj_por_nome(chaves, nomes_norm, scm: dict) -> pd.Series:
+    """
+    Associa cada nome normalizado à raiz do CNPJ, usando o SCM.
+
+    Para cada processo, procura no SCM uma pessoa jurídica vinculada cujo
+    nome normalizado é o do titular no SIGMINE. Se o mesmo nome aparecer
+    com raízes diferentes, vale a mais frequente.
+
+    Args:
+        chaves (array): Chave de cada processo
+        nomes_norm (array): Nome normalizado do titular de cada processo
+        scm (dict): Saída de scm.carregar_scm
+
+    Returns:
+        Series: Raiz do CNPJ (8 dígitos) indexada pelo nome normalizado
+    """
+    pessoas = scm["processo_pessoas"]
+    pessoas = pessoas[pessoas["TPPESSOA"].astype(object) == "J"]
+    digitos = pessoas["NRCPFCNPJ"].astype(object).fillna("").str.replace(r"\D", "", regex=True)
+    validos = digitos.str.len() == 14  # CNPJs mascarados ou incompletos não servem
+    codigos, unicos = _normalizar_categorias(pessoas.loc[validos, "NMPESSOA"])
+    juridicas = pd.DataFrame({
+        "chave": pessoas.index[validos],
+        "nome_norm": unicos[codigos] if len(unicos) else np.array([], dtype=object),
+        "raiz_cnpj": digitos[validos].str[:8].to_numpy(),
+    })
+
+    processos = pd.DataFrame({"chave": chaves, "nome_norm": nomes_norm})
+    pares = processos.merge(juridicas, on=["chave", "nome_norm"], how="inner")
+    if pares.empty:
+        return pd.Series(dtype=object)
+    # Raiz mais frequente de cada nome (empate: a menor, para ser determinístico)
+    contagem = pares.groupby(["nome_norm", "raiz_cnpj"], sort=True).size().reset_index(name="n")
+    contagem = contagem.sort_values(["nome_norm", "n"], ascending=[True, False], kind="stable")
+    return contagem.drop_duplicates("nome_norm").set_index("nome_norm")["raiz_cnpj"]
+
+
+def _contagem_por_grupo(codigos_grupo, n_grupos: int, valores) -> pd.DataFrame:
+    """
+    Conta os valores de uma coluna em cada grupo (ex: processos por UF).
+
+    Uma única contagem (np.bincount) sobre o par (grupo, valor): as colunas
+    agregadas (UFs, fases) têm poucas dezenas de valores distintos.
+
+    Returns:
+        DataFrame: Uma linha por grupo (na ordem dos códigos) e uma coluna
+            por valor (em ordem alfabética), com as contagens
+    """
+    codigos_valor, nomes = pd.factorize(pd.Series(valores).astype(object).fillna(""), sort=True)
+    contagens = np.bincount(codigos_grupo * len(nomes) + codigos_valor,
+                            minlength=n_grupos * len(nomes))
+    return pd.DataFrame(contagens.reshape(n_grupos, len(nomes)), columns=nomes)
+
+
+def _juntar_colunas(contagens: pd.DataFrame, com_contagem: bool = False) -> pd.Series:
+    """
+    Lista, para cada grupo, os valores com contagem > 0, do mais ao menos frequente.
+
+    Ex: "PA, AM" ou, com com_contagem=True, "PESQUISA (3); LAVRA (1)"
+    """
+    valores = contagens.to_numpy()
+    nomes = np.asarray(contagens.columns, dtype=object)
+    # Ordem decrescente de contagem em cada linha (empates pela ordem alfabética)
+    ordem = np.argsort(-valores, axis=1, kind="stable")
+    resultado = np.full(len(contagens), "", dtype=object)
+    separador = "; " if com_contagem else ", "
+    # Uma operação por posição (no máximo algumas dezenas), não por grupo
+    for pos in range(valores.shape[1]):
+        colunas = ordem[:, pos]
+        n = valores[np.arange(len(valores)), colunas]
+        texto = nomes[colunas]
+        if com_contagem:
+            texto = texto + " (" + n.astype(str) + ")"
+        presente = n > 0
+        resultado = np.where(presente & (resultado != ""), resultado + separador, resultado)
+        resultado = np.where(presente, resultado + texto, resultado)
+    return pd.Series(resultado, index=contagens.index)
+
+
+def agregar_titulares(gdf: pd.DataFrame, col_titular: str, col_uf: str, col_fase: str = None,
+                      col_area: str = None, col_chave: str = None, scm: dict = None) -> pd.DataFrame:
+    """
+    Agrega todos os processos por titular, juntando variantes do nome e CNPJ.
+
+    Acrescenta aos processos a coluna 'grupo_titular' (o titular agregado
+    de cada um). Grupos com CNPJ são identificados por "CNPJ:<raiz>"; os
+    demais, por "NOME:<nome normalizado>".
+
+    Args:
+        gdf (DataFrame): Processos (alterado no próprio objeto)
+        col_titular (str): Coluna com o nome do titular
+        col_uf (str): Coluna com a UF
+        col_fase (str): Coluna com a fase do processo (None = não agrega fases)
+        col_area (str): Coluna com a área em ha (None = não soma áreas)
+        col_chave (str): Coluna com a chave do processo (necessária com `scm`)
+        scm (dict): Saída de scm.carregar_scm (None = agrupa só pelo nome)
+
+    Returns:
+        DataFrame: Uma linha por titular agregado, indexada por 'grupo_titular',
+            ordenada pela área total (ou pela quantidade de processos), com as
+            colunas 'titular' (variante mais frequente do nome), 'raiz_cnpj',
+            'variantes_nome', 'processos', 'area_total_ha', 'n_ufs', 'ufs',
+            'fase_predominante' e 'fases'
+    """
+    codigos, unicos = _normalizar_categorias(gdf[col_titular])
+    nomes_norm = np.where(codigos >= 0, unicos[np.maximum(codigos, 0)], "")
+
+    grupo = pd.Series("NOME:" + pd.Series(nomes_norm, dtype=object), index=gdf.index)
+    raiz = pd.Series(np.nan, index=gdf.index, dtype=object)
+    if scm is not None and col_chave is not None:
+        raiz_por_nome = _raiz_cnpj_por_nome(gdf[col_chave].to_numpy(), nomes_norm, scm)
+        raiz = pd.Series(raiz_por_nome.reindex(nomes_norm).to_numpy(), index=gdf.index)
+        grupo = grupo.where(raiz.isna(), "CNPJ:" + raiz)
+        logger.info(f"Titulares: {raiz_por_nome.size} nomes associados a CNPJ pelo SCM")
+
+    # Códigos inteiros do grupo: todos os agrupamentos abaixo usam esses códigos
+    codigos_grupo, grupos = pd.factorize(grupo)
+    grupos = pd.Index(grupos, name=COLUNA_GRUPO)
+    gdf[COLUNA_GRUPO] = grupo.to_numpy()
+
+    processos = np.bincount(codigos_grupo, minlength=len(grupos))
+    agregados = pd.DataFrame({"processos": processos}, index=grupos)
+
+    # Variante mais frequente do nome original em cada grupo
+    nomes = pd.DataFrame({"g": codigos_grupo, "nome": gdf[col_titular].astype(object).to_numpy()})
+    variantes = nomes.groupby(["g", "nome"], sort=True).size().reset_index(name="n")
+    agregados["variantes_nome"] = np.bincount(variantes["g"], minlength=len(grupos))
+    mais_frequente = (variantes.sort_values(["g", "n"], ascending=[True, False], kind="stable")
+                      .drop_duplicates("g").set_index("g")["nome"])
+    agregados["titular"] = mais_frequente.reindex(np.arange(len(grupos))).to_numpy()
+    agregados["raiz_cnpj"] = (pd.Series(raiz.to_numpy()).groupby(codigos_grupo).first()
+                              .reindex(np.arange(len(grupos))).to_numpy())
+
+    if col_area is not None:
+        areas = pd.to_numeric(gdf[col_area], errors="coerce").fillna(0).to_numpy()
+        agregados["area_total_ha"] = np.bincount(codigos_grupo, weights=areas, minlength=len(grupos))
+
+    por_uf = _contagem_por_grupo(codigos_grupo, len(grupos), gdf[col_uf])
+    agregados["n_ufs"] = (por_uf.to_numpy() > 0).sum(axis=1)
+    agregados["ufs"] = _juntar_colunas(por_uf).to_numpy()
+
+    if col_fase is not None:
+        por_fase = _contagem_por_grupo(codigos_grupo, len(grupos), gdf[col_fase])
+        # Sem processos não há coluna para o argmax
+        mais_comum = por_fase.to_numpy().argmax(axis=1) if por_fase.size else np.array([], dtype=int)
+        agregados["fase_predominante"] = np.asarray(por_fase.columns, dtype=object)[mais_comum]
+        agregados["fases"] = _juntar_colunas(por_fase, com_contagem=True).to_numpy()
+
+    ordem = ["area_total_ha", "processos"] if col_area is not None else ["processos"]
+    return agregados.sort_values(ordem, ascending=False, kind="stable")
+
+
+def selecionar_titulares_perfil(agregados: pd.DataFrame, grupos_candidatos,
+                                min_processos: int = 2, max_titulares: int = None) -> pd.DataFrame:
+    """
+    Escolhe os titulares que recebem o perfil com IA, pelos números agregados.
+
+    Entre os candidatos (ex: titulares dos processos do top-N), ficam os que
+    têm pelo menos `min_processos` processos no total, na ordem de
+    `agregados` (maior área total primeiro), limitados a `max_titulares`.
+
+    Args:
+        agregados (DataFrame): Saída de agregar_titulares
+        grupos_candidatos (list): Valores de 'grupo_titular' candidatos
+        min_processos (int): Mínimo de processos do titular (no conjunto lido)
+        max_titulares (int): Máximo de titulares escolhidos (None = sem limite)
+
+    Returns:
+        DataFrame: Linhas de `agregados` escolhidas
+    """
+    escolhidos = agregados[agregados.index.isin(list(grupos_candidatos))
+                           & (agregados["processos"] >= min_processos)
+                           # Processos sem nome do titular não formam um titular
+                           & agregados["titular"].notna()]
+    return escolhidos if max_titulares is None else escolhidos.head(max_titulares)